@@ -0,0 +1,244 @@
+import pycparser # the C parser written in Python
+import sys # so we can access command-line args
+import argparse # so we can parse command-line options
+import json # results are saved as JSON so that runs can be compared
+import time
+import random
+import resource
+import platform
+import multiprocessing
+
+import mksymtab
+import mk3ac
+
+# The generators below produce synthetic C that stays within what CodeBuilder can compile:
+# int arithmetic between variables, assignments, if/while/for, and . and -> through structs.
+
+def variable_names(how_many):
+    return ["v%d" % i for i in range(how_many)]
+
+def expression_chain(rng,names,length):
+    operators = ["+","-","*","+","&","|","^"]
+    terms = [rng.choice(names)]
+    for i in range(length-1):
+        terms.append(rng.choice(operators))
+        terms.append(rng.choice(names))
+    return " ".join(terms)
+
+def condition(rng,names):
+    return "%s %s %s" % (rng.choice(names),rng.choice(["==","!=","<","<=",">",">="]),rng.choice(names))
+
+def statements(rng,names,depth,width,chain_length):
+    """
+        width statements, each either an assignment or, while depth allows, an if/while/for around more statements
+    """
+    lines = []
+    for i in range(width):
+        kind = rng.choice(["assign","if","while","for"]) if depth > 0 else "assign"
+        if kind == "assign":
+            lines.append("%s = %s;" % (rng.choice(names),expression_chain(rng,names,chain_length)))
+            continue
+        inner = statements(rng,names,depth-1,max(1,width//2),chain_length)
+        if kind == "if":
+            otherwise = statements(rng,names,depth-1,max(1,width//2),chain_length)
+            lines.append("if (%s) {\n%s\n} else {\n%s\n};" % (condition(rng,names),inner,otherwise))
+        elif kind == "while":
+            lines.append("while (%s) {\n%s\n};" % (condition(rng,names),inner))
+        else:
+            counter, limit = rng.sample(names,2)
+            lines.append("for (%s = %s; %s <= %s; %s++) {\n%s\n};" % (counter,limit,counter,limit,counter,inner))
+    return "\n".join(lines)
+
+def function(rng,name,depth,width,chain_length,locals_count=6):
+    arguments = variable_names(3)
+    local_names = ["l%d" % i for i in range(locals_count)]
+    names = arguments + local_names
+    declarations = "\n".join("int %s;" % local for local in local_names)
+    body = statements(rng,names,depth,width,chain_length)
+    return "int %s(%s) {\n%s\n%s\nreturn %s;\n};\n" % (
+        name,", ".join("int %s" % argument for argument in arguments),declarations,body,rng.choice(names))
+
+def many_functions(scale,seed=0):
+    rng = random.Random(seed)
+    return "".join(function(rng,"f%d" % i,1,4,4) for i in range(2000*scale))
+
+def deep_nesting(scale,seed=0):
+    rng = random.Random(seed)
+    return "".join(function(rng,"f%d" % i,10,2,3) for i in range(20*scale))
+
+def long_expressions(scale,seed=0):
+    rng = random.Random(seed)
+    return "".join(function(rng,"f%d" % i,0,8,64) for i in range(100*scale))
+
+def struct_definitions(rng,count,width):
+    """
+        count structs, each with width int and char fields and a pointer to itself and to the next struct
+    """
+    definitions = []
+    for i in range(count):
+        fields = []
+        for j in range(width):
+            fields.append("%s f%d;" % (rng.choice(["int","char","short","long"]),j))
+        fields.append("struct s%d * self;" % i)
+        fields.append("struct s%d * next;" % ((i+1) % count))
+        definitions.append("typedef struct s%d {\n%s\n} s%d;\n" % (i,"\n".join(fields),i))
+    return "".join(definitions)
+
+def wide_structs(scale,seed=0):
+    rng = random.Random(seed)
+    count = 10
+    width = 200
+    code = [struct_definitions(rng,count,width)]
+    for i in range(200*scale):
+        which = rng.randrange(count)
+        body = []
+        for j in range(16):
+            body.append("x = p->f%d;" % rng.randrange(width))
+            body.append("y = (*p).f%d;" % rng.randrange(width))
+        code.append("int w%d(s%d * p) {\nint x;\nint y;\n%s\nreturn x;\n};\n" % (i,which,"\n".join(body)))
+    return "".join(code)
+
+def pointer_chains(scale,seed=0):
+    rng = random.Random(seed)
+    count = 8
+    code = [struct_definitions(rng,count,4)]
+    for i in range(200*scale):
+        which = rng.randrange(count)
+        body = []
+        for j in range(8):
+            chain = "p" + "".join(rng.choice(["->self","->self","->next"]) for k in range(16))
+            body.append("p = %s;" % chain)
+        code.append("s%d * c%d(s%d * p) {\n%s\nreturn p;\n};\n" % (which,i,which,"\n".join(body)))
+    return "".join(code)
+
+WORKLOADS = [
+    ("many_functions",many_functions),
+    ("deep_nesting",deep_nesting),
+    ("long_expressions",long_expressions),
+    ("wide_structs",wide_structs),
+    ("pointer_chains",pointer_chains),
+]
+
+def peak_kilobytes():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def run_phases(code):
+    """
+        times parsing, building the symbol table and generating 3AC for code, one after the other
+    """
+    lines = code.count("\n")
+    timings = {}
+    started = time.time()
+    cparser = mk3ac.new_parser()
+    timings["parser_setup"] = time.time() - started
+    started = time.time()
+    parsed_code = cparser.parse(code)
+    timings["parse"] = time.time() - started
+    started = time.time()
+    st = mksymtab.makeSymbolTable(parsed_code,generator=mk3ac.generate_function)
+    timings["symbol_table"] = time.time() - started
+    started = time.time()
+    mk3ac.generate_code(st)
+    timings["codegen"] = time.time() - started
+    instructions = sum(len(value["{}"]) for name, value in st.functions())
+    return lines, instructions, timings
+
+def measure(code,results):
+    """
+        runs in a fresh process, so that the peak memory belongs to this workload alone
+    """
+    before = peak_kilobytes()
+    lines, instructions, timings = run_phases(code)
+    results.put((lines,instructions,timings,before,peak_kilobytes()))
+
+def benchmark(name,code,repeat):
+    best = None
+    for i in range(repeat):
+        results = multiprocessing.Queue()
+        process = multiprocessing.Process(target=measure,args=(code,results))
+        process.start()
+        lines, instructions, timings, before, peak = results.get()
+        process.join()
+        if best is None:
+            best = (lines,instructions,dict(timings),before,peak)
+        else:
+            for phase, seconds in timings.items():
+                best[2][phase] = min(best[2][phase],seconds)
+    lines, instructions, timings, before, peak = best
+    phases = {}
+    for phase, seconds in timings.items():
+        phases[phase] = {"seconds": seconds}
+    for phase in ["parse","symbol_table","codegen"]:
+        phases[phase]["lines_per_second"] = lines / max(timings[phase],1e-9)
+    phases["codegen"]["instructions_per_second"] = instructions / max(timings["codegen"],1e-9)
+    return {"lines": lines,
+            "instructions": instructions,
+            "phases": phases,
+            "peak_kb": peak,
+            "peak_growth_kb": peak - before}
+
+def compare(results,baseline,threshold):
+    """
+        prints how each phase's time moved against a saved baseline, and returns the regressions
+    """
+    regressions = []
+    for name, result in sorted(results["benchmarks"].items()):
+        if name not in baseline["benchmarks"]:
+            continue
+        old = baseline["benchmarks"][name]
+        for phase in ["parse","symbol_table","codegen"]:
+            new_seconds = result["phases"][phase]["seconds"]
+            old_seconds = old["phases"][phase]["seconds"]
+            ratio = new_seconds / max(old_seconds,1e-9)
+            flag = ""
+            if ratio > 1 + threshold:
+                flag = "  REGRESSION"
+                regressions.append((name,phase,ratio))
+            print "%-20s %-14s %9.4fs -> %9.4fs  x%.2f%s" % (name,phase,old_seconds,new_seconds,ratio,flag)
+        ratio = float(result["peak_growth_kb"]) / max(old["peak_growth_kb"],1)
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions.append((name,"memory",ratio))
+        print "%-20s %-14s %9dK -> %9dK  x%.2f%s" % (name,"memory",old["peak_growth_kb"],result["peak_growth_kb"],ratio,flag)
+    return regressions
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="time the parse, symbol table and 3AC phases on synthetic C")
+    argument_parser.add_argument("workloads",nargs="*",help="which workloads to run (default: all of them)")
+    argument_parser.add_argument("--scale",type=int,default=1,help="multiply the size of every workload")
+    argument_parser.add_argument("--repeat",type=int,default=3,help="keep the best of this many runs")
+    argument_parser.add_argument("--seed",type=int,default=0)
+    argument_parser.add_argument("-o","--output",help="save the results here, as JSON")
+    argument_parser.add_argument("--compare",metavar="BASELINE",help="compare against results saved by an earlier run")
+    argument_parser.add_argument("--threshold",type=float,default=0.10,help="slowdown that counts as a regression")
+    argument_parser.add_argument("--emit-source",action="store_true",help="print the generated C for the workloads instead of timing it")
+    arguments = argument_parser.parse_args()
+    generators = dict(WORKLOADS)
+    names = arguments.workloads or [name for name, generator in WORKLOADS]
+    if arguments.emit_source:
+        for name in names:
+            sys.stdout.write(generators[name](arguments.scale,arguments.seed))
+        sys.exit(0)
+    results = {"python": platform.python_version(),
+               "pycparser": pycparser.__version__,
+               "scale": arguments.scale,
+               "seed": arguments.seed,
+               "benchmarks": {}}
+    for name in names:
+        code = generators[name](arguments.scale,arguments.seed)
+        result = benchmark(name,code,arguments.repeat)
+        results["benchmarks"][name] = result
+        phases = result["phases"]
+        print "%-20s %7d lines %8d instructions  parse %.3fs  symbol table %.3fs  codegen %.3fs  %.0f instructions/s  peak %dK" % (
+            name,result["lines"],result["instructions"],
+            phases["parse"]["seconds"],phases["symbol_table"]["seconds"],phases["codegen"]["seconds"],
+            phases["codegen"]["instructions_per_second"],result["peak_kb"])
+    if arguments.output:
+        with open(arguments.output,"w") as output:
+            json.dump(results,output,indent=1,sort_keys=True)
+    if arguments.compare:
+        with open(arguments.compare) as baseline:
+            regressions = compare(results,json.load(baseline),arguments.threshold)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,346 @@
+"""
+    A symbol table and its 3AC as one little-endian file that can be mmapped and read a piece at a time:
+
+        header      MAGIC, VERSION, then (offset, count) for each section, the globals and types values,
+                    the data model's name as a string and whether struct fields were reordered
+        strings     count+1 uint32 offsets into the bytes that follow them; string i runs from offset i to offset i+1
+        values      (kind, a, b) int32 triples. Every operand and every type description is a value,
+                    and so is every scope, as a DICT
+        items       int32s that TUPLE, LIST and DICT values and the layouts point into
+        code        one (label, operation, destination, source1, source2) uint32 record per instruction;
+                    the operation is a string and the rest are values
+        functions   (name, scope, first instruction, instruction count) uint32 records, sorted by name,
+                    so one function can be found and read without reading the others
+        layouts     (name, size, alignment, first item, field count) uint32 records for every struct,
+                    each field being a (name, offset, type) triple of items
+"""
+import sys # so we can access command-line args
+import argparse # so we can parse command-line options
+import struct
+import mmap
+import pprint # so we can pretty-print our output
+from array import array
+from pycparser import c_ast, c_generator
+
+import mksymtab
+from mk3ac import Label
+from ir import InstructionList, printable
+
+MAGIC = "3AC\0"
+VERSION = 2
+SECTIONS = ["strings","values","items","code","functions","layouts"]
+HEADER = struct.Struct("<4sI"+"II"*len(SECTIONS)+"IIII")
+VALUE = struct.Struct("<Iii")
+ITEM = struct.Struct("<i")
+INSTRUCTION = struct.Struct("<IIIII")
+FUNCTION = struct.Struct("<IIII")
+LAYOUT = struct.Struct("<IIIII")
+UINT = struct.Struct("<I")
+
+NONE, STRING, INT, TUPLE, LIST, DICT, LABEL, OPAQUE = range(8)
+
+class Opaque(object):
+    """
+        stands in for something in a scope that this format has no way to write, like the parse tree
+        of a function prototype; text is what it looked like
+    """
+    def __init__(self,text):
+        self.text = text
+    def __repr__(self):
+        return "Opaque(%r)" % self.text
+
+class Writer(object):
+    def __init__(self):
+        self.strings = []
+        self.string_ids = {}
+        self.values = array('i')
+        self.value_ids = {}
+        self.items = array('i')
+        self.code = array('I')
+        self.functions = []
+        self.layouts = array('I')
+    def string(self,text):
+        the_id = self.string_ids.get(text)
+        if the_id is None:
+            the_id = self.string_ids[text] = len(self.strings)
+            self.strings.append(text)
+        return the_id
+    def add_value(self,kind,a,b):
+        self.values.extend((kind,a,b))
+        return len(self.values)//3 - 1
+    def value(self,what):
+        kind = type(what)
+        if kind is str or what is None or kind is int or kind is long or kind is tuple:
+            try:
+                key = (kind,what)
+                the_id = self.value_ids.get(key)
+            except TypeError:
+                key = the_id = None # a tuple with something unhashable in it
+            if the_id is not None:
+                return the_id
+        else:
+            key = None
+        if what is None:
+            the_id = self.add_value(NONE,0,0)
+        elif kind is str:
+            the_id = self.add_value(STRING,self.string(what),0)
+        elif kind is int or kind is long:
+            the_id = self.add_value(INT,what,0)
+        elif kind is tuple or kind is list:
+            members = [self.value(member) for member in what]
+            the_id = self.add_value(TUPLE if kind is tuple else LIST,len(self.items),len(members))
+            self.items.extend(members)
+        elif kind is dict:
+            pairs = [(self.string(name),self.value(member)) for name, member in sorted(what.items())]
+            the_id = self.add_value(DICT,len(self.items),len(pairs))
+            for pair in pairs:
+                self.items.extend(pair)
+        elif kind.__name__ == "Label": # not kind is Label, which misses labels made by mk3ac.py run as a script
+            the_id = self.add_value(LABEL,self.value(what.kwargs),0)
+        else:
+            the_id = self.add_value(OPAQUE,self.string(opaque_text(what)),0)
+        if key is not None:
+            self.value_ids[key] = the_id
+        return the_id
+    def add_function(self,name,scope):
+        code = scope["{}"]
+        first = len(self.code)//5
+        value = self.value
+        string = self.string
+        for label, operation, destination, source1, source2 in code:
+            self.code.extend((value(label),string(operation),value(destination),value(source1),value(source2)))
+        rest = dict((key,member) for key, member in scope.items() if key != "{}")
+        self.functions.append((name,self.value(rest),first,len(self.code)//5 - first))
+    def add_layout(self,name,the_type):
+        first = len(self.items)
+        for field_name, (offset, field_type) in the_type.elements:
+            self.items.extend((self.string(field_name),offset,self.value(field_type)))
+        self.layouts.extend((self.string(name),the_type.size,the_type.alignment,first,len(the_type.elements)))
+    def write(self,out,globals_value,types_value,data_model,reorder_fields):
+        data_model = self.string(data_model)
+        self.functions.sort()
+        functions = array('I')
+        for name, scope, first, count in self.functions:
+            functions.extend((self.string(name),scope,first,count))
+        offsets = array('I',[0])
+        blob = []
+        for text in self.strings:
+            blob.append(text)
+            offsets.append(offsets[-1]+len(text))
+        sections = [offsets.tostring()+"".join(blob),self.values.tostring(),self.items.tostring(),
+                    self.code.tostring(),functions.tostring(),self.layouts.tostring()]
+        counts = [len(self.strings),len(self.values)//3,len(self.items),len(self.code)//5,
+                  len(self.functions),len(self.layouts)//5]
+        header = [MAGIC,VERSION]
+        position = HEADER.size
+        for section, count in zip(sections,counts):
+            position += -position % 8
+            header.extend((position,count))
+            position += len(section)
+        header.extend((globals_value,types_value,data_model,int(reorder_fields)))
+        out.write(HEADER.pack(*header))
+        position = HEADER.size
+        for section in sections:
+            out.write("\0"*(-position % 8))
+            position += -position % 8
+            out.write(section)
+            position += len(section)
+
+def opaque_text(what):
+    if isinstance(what,c_ast.Node):
+        return c_generator.CGenerator().visit(what)
+    return repr(what)
+
+def write_symbol_table(symbol_table,out):
+    """
+        writes a symbol table, with the 3AC of every function (generating any that hasn't been yet), to a file
+    """
+    writer = Writer()
+    globals_scope = {}
+    for name, value in symbol_table.values.values.items():
+        if isinstance(value,dict):
+            writer.add_function(name,symbol_table.function(name))
+        else:
+            globals_scope[name] = value
+    for name, value in symbol_table.types.values.items():
+        if name.startswith("struct ") and isinstance(value,list):
+            writer.add_layout(name,symbol_table.type_registry.get(name))
+    registry = symbol_table.type_registry
+    writer.write(out,writer.value(globals_scope),writer.value(dict(symbol_table.types.values)),
+                 registry.data_model,registry.reorder_fields)
+
+class MappedCode(object):
+    """
+        One function's 3AC, read straight out of the mapped file one record at a time.
+        It indexes and iterates like an InstructionList.
+    """
+    def __init__(self,tables,first,count):
+        self.tables = tables
+        self.first = first
+        self.count = count
+    def __len__(self):
+        return self.count
+    def instruction(self,index):
+        tables = self.tables
+        value = tables.value
+        label, operation, destination, source1, source2 = INSTRUCTION.unpack_from(tables.mapped,tables.code+INSTRUCTION.size*(self.first+index))
+        return (value(label),tables.string(operation),value(destination),value(source1),value(source2))
+    def __getitem__(self,index):
+        if isinstance(index,slice):
+            return [self.instruction(i) for i in xrange(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return self.instruction(index)
+    def __iter__(self):
+        for index in xrange(self.count):
+            yield self.instruction(index)
+    def tolist(self):
+        return list(self)
+    def __eq__(self,other):
+        if isinstance(other,(MappedCode,InstructionList,list,tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self,other))
+        return NotImplemented
+    def __ne__(self,other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+    def __repr__(self):
+        return repr(self.tolist())
+
+class MappedTables(object):
+    """
+        A file written by write_symbol_table, mapped into memory. Nothing is decoded until
+        it is asked for, and strings and values are only decoded once.
+    """
+    def __init__(self,path):
+        self.file = open(path,"rb")
+        self.mapped = mmap.mmap(self.file.fileno(),0,access=mmap.ACCESS_READ)
+        header = HEADER.unpack_from(self.mapped,0)
+        if header[0] != MAGIC or header[1] != VERSION:
+            raise ValueError("%s is not a version %d 3AC file" % (path,VERSION))
+        self.sections = {}
+        for i, name in enumerate(SECTIONS):
+            self.sections[name] = (header[2+2*i],header[3+2*i])
+        self.globals_value, self.types_value, data_model, reorder_fields = header[-4:]
+        self.code = self.sections["code"][0]
+        self.string_count = self.sections["strings"][1]
+        self.string_bytes = self.sections["strings"][0] + UINT.size*(self.string_count+1)
+        self.strings = {}
+        self.values = {}
+        self.data_model = self.string(data_model)
+        self.reorder_fields = bool(reorder_fields)
+    def close(self):
+        self.mapped.close()
+        self.file.close()
+    def string(self,the_id):
+        text = self.strings.get(the_id)
+        if text is None:
+            start, end = struct.unpack_from("<II",self.mapped,self.sections["strings"][0]+UINT.size*the_id)
+            text = self.strings[the_id] = intern(self.mapped[self.string_bytes+start:self.string_bytes+end])
+        return text
+    def items(self,first,count):
+        return struct.unpack_from("<%di" % count,self.mapped,self.sections["items"][0]+ITEM.size*first)
+    def value(self,the_id):
+        """
+            values that can't be changed are kept once decoded; lists and dicts are decoded afresh every time
+        """
+        result = self.values.get(the_id)
+        if result is not None or the_id in self.values:
+            return result
+        kind, a, b = VALUE.unpack_from(self.mapped,self.sections["values"][0]+VALUE.size*the_id)
+        if kind == NONE:
+            result = None
+        elif kind == STRING:
+            result = self.string(a)
+        elif kind == INT:
+            result = a
+        elif kind == TUPLE:
+            result = tuple(self.value(member) for member in self.items(a,b))
+        elif kind == LIST:
+            return [self.value(member) for member in self.items(a,b)]
+        elif kind == DICT:
+            members = self.items(a,2*b)
+            return dict((self.string(members[i]),self.value(members[i+1])) for i in xrange(0,len(members),2))
+        elif kind == LABEL:
+            return Label(**self.value(a))
+        elif kind == OPAQUE:
+            return Opaque(self.string(a))
+        else:
+            raise ValueError("bad value kind %d" % kind)
+        self.values[the_id] = result
+        return result
+    def function_record(self,index):
+        return FUNCTION.unpack_from(self.mapped,self.sections["functions"][0]+FUNCTION.size*index)
+    def function_names(self):
+        return [self.string(self.function_record(i)[0]) for i in xrange(self.sections["functions"][1])]
+    def find_function(self,name):
+        low, high = 0, self.sections["functions"][1]
+        while low < high:
+            middle = (low+high)//2
+            record = self.function_record(middle)
+            found = self.string(record[0])
+            if found == name:
+                return record
+            if found < name:
+                low = middle+1
+            else:
+                high = middle
+        raise KeyError(name)
+    def function(self,name):
+        """
+            a function's scope, with its 3AC, still in the file, under "{}"
+        """
+        name_id, scope, first, count = self.find_function(name)
+        result = self.value(scope)
+        result["{}"] = MappedCode(self,first,count)
+        return result
+    def globals(self):
+        return self.value(self.globals_value)
+    def types(self):
+        return self.value(self.types_value)
+    def layouts(self):
+        """
+            the size, alignment and field offsets the compiler worked out for every struct,
+            as a dict from struct name to (size, alignment, [(field, offset, type), ...])
+        """
+        result = {}
+        start, count = self.sections["layouts"]
+        for i in xrange(count):
+            name, size, alignment, first, fields = LAYOUT.unpack_from(self.mapped,start+LAYOUT.size*i)
+            members = self.items(first,3*fields)
+            result[self.string(name)] = (size,alignment,[(self.string(members[j]),members[j+1],self.value(members[j+2]))
+                                                         for j in xrange(0,len(members),3)])
+        return result
+    def symbol_table(self):
+        """
+            a SymbolTable like the one that was written, with the same data model and field order,
+            whose functions' 3AC stays in the file until it is used
+        """
+        builder = mksymtab.SymbolTableBuilder()
+        builder.values.values.update(self.globals())
+        for name in self.function_names():
+            builder.values.values[name] = self.function(name)
+        builder.types.values.update(self.types())
+        return mksymtab.SymbolTable(builder,self.reorder_fields,self.data_model)
+
+def write_file(symbol_table,path):
+    with open(path,"wb") as out:
+        write_symbol_table(symbol_table,out)
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="print what is in a binary 3AC file")
+    argument_parser.add_argument("file",help="a file written by mk3ac.py --binary")
+    argument_parser.add_argument("functions",nargs="*",help="only print these functions")
+    argument_parser.add_argument("--layouts",action="store_true",help="print the struct layouts too")
+    arguments = argument_parser.parse_args()
+    tables = MappedTables(arguments.file)
+    if arguments.functions:
+        pprint.pprint(printable(dict((name,tables.function(name)) for name in arguments.functions)))
+    else:
+        pprint.pprint(printable(tables.symbol_table().values.values))
+    if arguments.layouts:
+        pprint.pprint(tables.layouts())
+    tables.close()
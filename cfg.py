@@ -0,0 +1,354 @@
+from collections import defaultdict
+
+from ir import is_temporary, names_used, names_defined, BRANCHES
+
+class BasicBlock(object):
+    """
+        A run of instructions that is only entered at the top and only left at the bottom.
+        label is the label of its first row, if it has one.
+    """
+    def __init__(self,index,instructions):
+        self.index = index
+        self.instructions = instructions
+        self.label = instructions[0][0] if instructions else None
+        self.successors = []
+        self.predecessors = []
+    def __repr__(self):
+        return "BasicBlock(%d,%r)" % (self.index,self.label)
+
+class ControlFlowGraph(object):
+    """
+        Splits a function's 3AC into basic blocks. A block starts at every labelled row
+        and after every branch or return, which is where visit_If, visit_While and visit_For
+        put their labels and conditional_branch/unconditional_branch instructions.
+        Block 0 is the entry.
+    """
+    def __init__(self,code):
+        self.blocks = []
+        current = []
+        for instruction in code:
+            if instruction[0] is not None and current:
+                self.add_block(current)
+                current = []
+            current.append(instruction)
+            if instruction[1] in BRANCHES or instruction[1] == "return":
+                self.add_block(current)
+                current = []
+        if current or not self.blocks:
+            self.add_block(current)
+        self.by_label = {}
+        for block in self.blocks:
+            if block.label is not None:
+                self.by_label[block.label] = block
+        for block in self.blocks:
+            for successor in self.successors_of(block):
+                block.successors.append(successor)
+                successor.predecessors.append(block)
+    def add_block(self,instructions):
+        self.blocks.append(BasicBlock(len(self.blocks),instructions))
+    def successors_of(self,block):
+        last = block.instructions[-1] if block.instructions else (None,"","","","")
+        following = self.blocks[block.index+1] if block.index+1 < len(self.blocks) else None
+        if last[1] == "unconditional_branch":
+            return [self.by_label[last[2]]]
+        if last[1] == "conditional_branch":
+            successors = [self.by_label[last[2]]]
+            if following is not None and following is not successors[0]:
+                successors.append(following)
+            return successors
+        if last[1] == "return" or following is None:
+            return []
+        return [following]
+    def code(self):
+        """
+            the instructions, back in one list
+        """
+        result = []
+        for block in self.blocks:
+            result.extend(block.instructions)
+        return result
+    def reverse_postorder(self):
+        """
+            the blocks reachable from the entry, each one before its successors wherever there is no loop
+        """
+        order = []
+        seen = set([0])
+        stack = [(self.blocks[0],iter(self.blocks[0].successors))]
+        while stack:
+            block, successors = stack[-1]
+            for successor in successors:
+                if successor.index not in seen:
+                    seen.add(successor.index)
+                    stack.append((successor,iter(successor.successors)))
+                    break
+            else:
+                stack.pop()
+                order.append(block)
+        order.reverse()
+        return order
+
+def uses_and_definitions(block):
+    """
+        the names a block reads before writing them, and the names it writes
+    """
+    used = set()
+    defined = set()
+    for instruction in block.instructions:
+        for name in names_used(instruction):
+            if name not in defined:
+                used.add(name)
+        defined.update(names_defined(instruction))
+    return used, defined
+
+def liveness(graph):
+    """
+        the names live on entry to and on exit from each block, as two lists of sets indexed by block
+    """
+    count = len(graph.blocks)
+    used = [None]*count
+    defined = [None]*count
+    for block in graph.blocks:
+        used[block.index], defined[block.index] = uses_and_definitions(block)
+    live_in = [set() for block in graph.blocks]
+    live_out = [set() for block in graph.blocks]
+    pending = list(graph.blocks)
+    queued = set(block.index for block in pending)
+    while pending:
+        block = pending.pop()
+        queued.discard(block.index)
+        out = set()
+        for successor in block.successors:
+            out |= live_in[successor.index]
+        live_out[block.index] = out
+        new_in = used[block.index] | (out - defined[block.index])
+        if new_in != live_in[block.index]:
+            live_in[block.index] = new_in
+            for predecessor in block.predecessors:
+                if predecessor.index not in queued:
+                    queued.add(predecessor.index)
+                    pending.append(predecessor)
+    return live_in, live_out
+
+def live_after_each_instruction(block,live_out):
+    """
+        for each instruction of the block, the names live just after it
+    """
+    live = set(live_out)
+    after = [None]*len(block.instructions)
+    for position in range(len(block.instructions)-1,-1,-1):
+        instruction = block.instructions[position]
+        after[position] = set(live)
+        live.difference_update(names_defined(instruction))
+        live.update(names_used(instruction))
+    return after
+
+def interference(graph,temporaries):
+    """
+        for each temporary, the temporaries that are live at the same time as it somewhere
+    """
+    live_in, live_out = liveness(graph)
+    interferes = defaultdict(set)
+    for block in graph.blocks:
+        after = live_after_each_instruction(block,live_out[block.index])
+        for instruction, live in zip(block.instructions,after):
+            for name in names_defined(instruction):
+                if name not in temporaries:
+                    continue
+                for other in live:
+                    if other != name and other in temporaries:
+                        interferes[name].add(other)
+                        interferes[other].add(name)
+    return interferes, live_in[0]
+
+class TemporaryReuse(object):
+    """
+        Gives temporaries whose live ranges never overlap one name between them,
+        as long as they have the same type, and drops the names that are no longer needed from the scope.
+        Every temporary that survives is another slot in the frame, so this keeps frames small.
+    """
+    name = "temporary_reuse"
+    def run(self,code,scope):
+        temporaries = []
+        seen = set()
+        for instruction in code:
+            for name in names_defined(instruction):
+                if is_temporary(name) and name in scope and name not in seen:
+                    seen.add(name)
+                    temporaries.append(name)
+        if len(temporaries) < 2:
+            return code
+        graph = ControlFlowGraph(code)
+        interferes, live_at_entry = interference(graph,seen)
+        renamed = {}
+        slots = []
+        slot_members = {}
+        for name in temporaries:
+            if name in live_at_entry:
+                continue # used before it is set, so it can't safely share with anything
+            for slot in slots:
+                if scope[slot] == scope[name] and not (interferes[name] & slot_members[slot]):
+                    renamed[name] = slot
+                    slot_members[slot].add(name)
+                    break
+            else:
+                slots.append(name)
+                slot_members[name] = set([name])
+        if not renamed:
+            return code
+        result = []
+        for label, operation, destination, source1, source2 in code:
+            destination, source1, source2 = renamed.get(destination,destination), renamed.get(source1,source1), \
+                renamed.get(source2,source2)
+            if operation == "=" and destination == source1:
+                if label is not None:
+                    result.append((label,"","","",""))
+                continue # a copy between two temporaries that now share a name
+            result.append((label,operation,destination,source1,source2))
+        for name in renamed:
+            del scope[name]
+        return result
+
+INVERTED_COMPARISONS = {"<": ">=",">=": "<",">": "<=","<=": ">","==": "!=","!=": "=="}
+
+class ControlFlowCleanup(object):
+    """
+        Tidies up the branches and labels that visit_If, visit_While and visit_For leave behind:
+        branches to a label that only leads to an unconditional_branch go straight to where that goes,
+        a conditional_branch over an unconditional_branch tests the opposite comparison instead,
+        code that nothing can reach is dropped, branches to the very next instruction are dropped,
+        labels nothing branches to are dropped, and the label rows that are left are folded into
+        the instruction after them.
+    """
+    name = "control_flow_cleanup"
+    def run(self,code,scope):
+        code = list(code)
+        while True:
+            before = code
+            code = self.thread_jumps(code)
+            code = self.remove_unreachable(code)
+            code = self.remove_unused_labels(code)
+            code = self.remove_jumps_to_next(code)
+            code = self.invert_branches(code,scope)
+            if code == before:
+                return self.fold_labels(code)
+    def targets(self,code):
+        """
+            for each label, the position of the first instruction that isn't just a label row at or after it
+        """
+        target_of = {}
+        pending = []
+        for index, instruction in enumerate(code):
+            if instruction[0] is not None:
+                pending.append(instruction[0])
+            if instruction[1] != "":
+                for label in pending:
+                    target_of[label] = index
+                pending = []
+        for label in pending:
+            target_of[label] = len(code)
+        return target_of
+    def thread_jumps(self,code):
+        target_of = self.targets(code)
+        first_label = {}
+        for instruction in code:
+            if instruction[0] is not None:
+                first_label.setdefault(target_of[instruction[0]],instruction[0])
+        def resolve(label):
+            seen = set()
+            while label not in seen:
+                seen.add(label)
+                index = target_of[label]
+                if index == len(code) or code[index][1] != "unconditional_branch":
+                    break
+                label = code[index][2]
+            return first_label[target_of[label]]
+        result = []
+        for instruction in code:
+            label, operation, destination, source1, source2 = instruction
+            if operation in BRANCHES:
+                instruction = (label,operation,resolve(destination),source1,source2)
+            result.append(instruction)
+        return result
+    def remove_unreachable(self,code):
+        branched_to = set(instruction[2] for instruction in code if instruction[1] in BRANCHES)
+        result = []
+        reachable = True
+        for instruction in code:
+            if instruction[0] in branched_to:
+                reachable = True
+            if reachable:
+                result.append(instruction)
+            if instruction[1] == "unconditional_branch" or instruction[1] == "return":
+                reachable = False
+        return result
+    def remove_unused_labels(self,code):
+        branched_to = set(instruction[2] for instruction in code if instruction[1] in BRANCHES)
+        result = []
+        for instruction in code:
+            label, operation, destination, source1, source2 = instruction
+            if label is not None and label not in branched_to:
+                if operation == "":
+                    continue
+                instruction = (None,operation,destination,source1,source2)
+            result.append(instruction)
+        return result
+    def remove_jumps_to_next(self,code):
+        target_of = self.targets(code)
+        result = []
+        for index, instruction in enumerate(code):
+            if instruction[1] in BRANCHES and target_of[instruction[2]] == self.targets_after(code,index):
+                if instruction[0] is not None:
+                    result.append((instruction[0],"","","",""))
+                continue
+            result.append(instruction)
+        return result
+    def targets_after(self,code,index):
+        """
+            the position of the first instruction after code[index] that isn't just a label row
+        """
+        index += 1
+        while index < len(code) and code[index][1] == "":
+            index += 1
+        return index
+    def invert_branches(self,code,scope):
+        """
+            turns  c = a < b; conditional_branch then c; unconditional_branch else; then:
+            into   c = a >= b; conditional_branch else c; then:
+            when c is a temporary that nothing else uses
+        """
+        uses = defaultdict(int)
+        for instruction in code:
+            for name in names_used(instruction):
+                uses[name] += 1
+        target_of = self.targets(code)
+        result = []
+        index = 0
+        while index < len(code):
+            instruction = code[index]
+            if index + 2 < len(code) and index > 0 and instruction[1] == "conditional_branch" and instruction[0] is None:
+                condition = instruction[3]
+                comparison = code[index-1]
+                jump = code[index+1]
+                if jump[1] == "unconditional_branch" and jump[0] is None and \
+                        target_of[instruction[2]] == self.targets_after(code,index+1) and \
+                        comparison[1] in INVERTED_COMPARISONS and comparison[2] == condition and comparison[4] != "" and \
+                        is_temporary(condition) and condition in scope and uses[condition] == 1:
+                    result[-1] = (comparison[0],INVERTED_COMPARISONS[comparison[1]],condition,comparison[3],comparison[4])
+                    result.append((None,"conditional_branch",jump[2],condition,""))
+                    index += 2
+                    continue
+            result.append(instruction)
+            index += 1
+        return result
+    def fold_labels(self,code):
+        """
+            puts each label row's label on the instruction after it, if that has none of its own
+        """
+        result = []
+        for index, instruction in enumerate(code):
+            if instruction[1] == "" and index + 1 < len(code) and code[index+1][0] is None and code[index+1][1] != "":
+                continue
+            if instruction[0] is None and index > 0 and code[index-1][1] == "" and instruction[1] != "":
+                instruction = (code[index-1][0],) + instruction[1:]
+            result.append(instruction)
+        return result
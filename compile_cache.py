@@ -0,0 +1,236 @@
+import pycparser # the C parser written in Python
+import os
+import hashlib
+import cPickle
+import inspect
+import tempfile
+from cStringIO import StringIO
+
+from pycparser import c_ast
+
+import mksymtab
+import mk3ac
+import type_registry
+import ir
+import compiler_utilities
+
+CACHE_FORMAT = "2"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+def compiler_digest():
+    """
+        a hash of the compiler's own source, so that changing the compiler invalidates everything it cached
+    """
+    digest = hashlib.sha1(CACHE_FORMAT)
+    for module in [compiler_utilities, type_registry, ir, mksymtab, mk3ac]:
+        with open(inspect.getsourcefile(module),"rb") as source:
+            digest.update(source.read())
+    return digest.hexdigest()
+
+class CompileCache(object):
+    """
+        An on-disk store of pickled values, each in a file named by its key.
+        When the files add up to more than max_bytes the least recently used ones are removed.
+        Anything that can not be read back is treated as a miss.
+    """
+    def __init__(self,directory,max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.entries = {}
+        self.total_bytes = 0
+        for name in os.listdir(directory):
+            if name.endswith(".tmp"):
+                continue
+            stat = os.stat(os.path.join(directory,name))
+            self.entries[name] = [stat.st_size,stat.st_mtime]
+            self.total_bytes += stat.st_size
+        self.hits = 0
+        self.misses = 0
+        self.evict()
+    def path_of(self,key):
+        return os.path.join(self.directory,key)
+    def get(self,key):
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        try:
+            with open(self.path_of(key),"rb") as entry:
+                value = cPickle.load(entry)
+        except Exception:
+            self.discard(key)
+            self.misses += 1
+            return None
+        os.utime(self.path_of(key),None)
+        self.entries[key][1] = os.stat(self.path_of(key)).st_mtime
+        self.hits += 1
+        return value
+    def put(self,key,value):
+        try:
+            data = cPickle.dumps(value,cPickle.HIGHEST_PROTOCOL)
+        except (cPickle.PicklingError,RuntimeError,TypeError):
+            return # too deep or not picklable, so it just won't be cached
+        handle, temporary_path = tempfile.mkstemp(suffix=".tmp",dir=self.directory)
+        with os.fdopen(handle,"wb") as entry:
+            entry.write(data)
+        os.rename(temporary_path,self.path_of(key))
+        if key in self.entries:
+            self.total_bytes -= self.entries[key][0]
+        self.entries[key] = [len(data),os.stat(self.path_of(key)).st_mtime]
+        self.total_bytes += len(data)
+        self.evict(keep=key)
+    def discard(self,key):
+        size, last_used = self.entries.pop(key)
+        self.total_bytes -= size
+        try:
+            os.remove(self.path_of(key))
+        except OSError:
+            pass
+    def evict(self,keep=None):
+        if self.total_bytes <= self.max_bytes:
+            return
+        by_age = sorted(self.entries.items(),key=lambda entry: entry[1][1])
+        for key, (size, last_used) in by_age:
+            if self.total_bytes <= self.max_bytes:
+                break
+            if key != keep:
+                self.discard(key)
+
+class ReferenceCollector(compiler_utilities.Traversal):
+    """
+        collects every name a piece of the parse tree refers to: identifiers, typedef names and struct tags
+    """
+    def __init__(self):
+        self.names = set()
+    def visit_ID(self,node):
+        self.names.add(node.name)
+    def visit_IdentifierType(self,node):
+        self.names.add(mksymtab.normalize_type_name(node.names))
+    def visit_Struct(self,node):
+        if node.name is not None:
+            self.names.add("struct "+node.name)
+        for child in node:
+            yield child
+
+def references_of(node):
+    collector = ReferenceCollector()
+    collector.visit(node)
+    return collector.names
+
+def names_declared_by(node):
+    """
+        the names a top-level declaration gives a meaning to
+    """
+    names = set()
+    if isinstance(node,c_ast.FuncDef):
+        names.add(node.decl.name)
+        return names
+    if getattr(node,"name",None) is not None:
+        names.add(node.name)
+    for child in iter_nodes(node):
+        if isinstance(child,c_ast.Struct) and child.name is not None and child.decls is not None:
+            names.add("struct "+child.name)
+    return names
+
+def iter_nodes(node):
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(child for name, child in node.children())
+
+def text_of(node):
+    """
+        everything about a piece of the parse tree but where it came from, written out without recursing
+    """
+    out = StringIO()
+    compiler_utilities.show(node,out,attrnames=True,nodenames=True)
+    return out.getvalue()
+
+class DependencyIndex(object):
+    """
+        Knows, for every function in a translation unit, the text of the function and
+        the text of every top-level declaration it depends on, directly or through other declarations.
+        The text is text_of's dump of the parse tree, so however deeply the code nests it can be hashed.
+        A function's key is the hash of all of that, so it changes exactly when something
+        that could change the function's 3AC changes.
+    """
+    def __init__(self,parsed_code,compiler=None):
+        self.compiler = compiler if compiler is not None else compiler_digest()
+        self.providers = {}
+        self.functions = []
+        for ext in parsed_code.ext:
+            if isinstance(ext,c_ast.FuncDef):
+                self.functions.append(ext)
+                text = text_of(ext.decl)
+                references = references_of(ext.decl)
+            else:
+                text = text_of(ext)
+                references = references_of(ext)
+            for name in names_declared_by(ext):
+                self.providers.setdefault(name,[]).append((text,references))
+    def dependencies_of(self,function):
+        seen = set([function.decl.name])
+        texts = set()
+        pending = list(references_of(function))
+        while pending:
+            name = pending.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            for text, references in self.providers.get(name,()):
+                texts.add(text)
+                pending.extend(references)
+        return sorted(texts)
+    def key_of(self,function):
+        digest = hashlib.sha1(self.compiler)
+        digest.update(text_of(function))
+        for text in self.dependencies_of(function):
+            digest.update("\0")
+            digest.update(text)
+        return digest.hexdigest()
+
+def parse(code,cache,compiler=None):
+    """
+        the parse tree for some code, from the cache if this exact code has been parsed before
+    """
+    digest = hashlib.sha1(compiler if compiler is not None else compiler_digest())
+    digest.update(code)
+    key = "parse-"+digest.hexdigest()
+    parsed_code = cache.get(key)
+    if parsed_code is None:
+        parsed_code = mk3ac.new_parser().parse(code)
+        cache.put(key,parsed_code)
+    return parsed_code
+
+def compile_incrementally(code,cache,jobs=1,reorder_fields=False):
+    """
+        parses code, builds its symbol table and generates 3AC for its functions, like mk3ac does,
+        but only functions whose key is not in the cache go through SymbolTableBuilder and CodeBuilder;
+        of the others, only the declaration is visited.
+        Returns the parse tree and the symbol table.
+    """
+    compiler = compiler_digest()
+    if reorder_fields:
+        compiler = compiler+"-reorder_fields" # the same code gets different offsets
+    parsed_code = parse(code,cache,compiler)
+    index = DependencyIndex(parsed_code,compiler)
+    cached_scopes = {}
+    keys = {}
+    for function in index.functions:
+        name = function.decl.name
+        keys[name] = "function-"+index.key_of(function)
+        scope = cache.get(keys[name])
+        if scope is not None:
+            cached_scopes[name] = scope
+    # a cached function's body is left out, but not its declaration, since its callers need its signature
+    to_build = c_ast.FileAST([ext.decl if isinstance(ext,c_ast.FuncDef) and ext.decl.name in cached_scopes else ext
+                              for ext in parsed_code.ext])
+    st = mksymtab.makeSymbolTable(to_build,reorder_fields=reorder_fields,generator=mk3ac.generate_function)
+    changed = [name for name, value in st.functions() if name in keys and name not in cached_scopes]
+    mk3ac.generate_code(st,jobs,changed)
+    for name in changed:
+        cache.put(keys[name],st.values.values[name])
+    st.values.values.update(cached_scopes)
+    return parsed_code, st
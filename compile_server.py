@@ -0,0 +1,98 @@
+import sys # so we can access command-line args
+import argparse # so we can parse command-line options
+import json # requests and replies are one JSON object per line
+import os
+import signal
+import SocketServer
+import StringIO
+import Queue
+import traceback
+
+import mk3ac
+
+def default_socket_path():
+    return os.environ.get("MK3AC_SOCKET",os.path.join("/tmp","mk3ac-%d.sock" % os.getuid()))
+
+class ParserPool(object):
+    """
+        CParsers are not safe to share between threads, so each request borrows one of these.
+        They are all built up front, so no request pays for building one.
+    """
+    def __init__(self,size):
+        self.parsers = Queue.Queue()
+        for i in range(size):
+            self.parsers.put(mk3ac.new_parser())
+    def borrow(self):
+        return self.parsers.get()
+    def give_back(self,parser):
+        self.parsers.put(parser)
+
+def handle_request(request,parsers):
+    """
+        compiles what a client sent and returns the reply: the output the command line would
+        have written, and the exit status it would have had
+    """
+    code = request.get("code")
+    if code is None:
+        code = mk3ac.SAMPLE_CODE
+    code = code.encode("utf-8") # JSON gives back unicode, and the compiler wants str
+    disabled_passes = [name.encode("utf-8") for name in request.get("disable_passes",())]
+    function_names = [name.encode("utf-8") for name in request.get("functions",())]
+    out = StringIO.StringIO()
+    parser = parsers.borrow()
+    try:
+        mk3ac.compile_code(code,parser,out,request.get("jobs",1),request.get("optimize",False),disabled_passes,
+                           None,function_names,request.get("reorder_fields",False),request.get("layout_report",False))
+        return {"status": 0,"output": out.getvalue()}
+    except Exception:
+        return {"status": 1,"output": out.getvalue(),"error": traceback.format_exc()}
+    finally:
+        parsers.give_back(parser)
+
+class CompileRequestHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError:
+                reply = {"status": 2,"output": "","error": "not a JSON request: %r\n" % line[:80]}
+            else:
+                reply = handle_request(request,self.server.parsers)
+            self.wfile.write(json.dumps(reply)+"\n")
+            self.wfile.flush()
+
+class CompileServer(SocketServer.ThreadingMixIn,SocketServer.UnixStreamServer):
+    """
+        Keeps warmed parsers and the compiler's modules loaded, and compiles each
+        connection's requests on a thread of its own.
+    """
+    daemon_threads = True
+    def __init__(self,path,parsers):
+        self.parsers = parsers
+        if os.path.exists(path):
+            os.unlink(path)
+        SocketServer.UnixStreamServer.__init__(self,path,CompileRequestHandler)
+
+def serve(path,parser_count):
+    parsers = ParserPool(parser_count)
+    server = CompileServer(path,parsers)
+    def stop(signal_number,frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM,stop)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="compile C to 3AC for mk3ac_client.py, without starting up again for every compile")
+    argument_parser.add_argument("--socket",default=default_socket_path(),help="the Unix socket to listen on")
+    argument_parser.add_argument("--parsers",type=int,default=4,help="how many requests can be parsing at once")
+    arguments = argument_parser.parse_args()
+    serve(arguments.socket,arguments.parsers)
@@ -1,5 +1,36 @@
+import sys
 from collections import defaultdict
 
+class TagCounter(object):
+    """
+        What TagStack.push hands back. There is one of these per tag,
+        made the first time it is asked for, so a with statement allocates nothing.
+    """
+    __slots__ = ("tags","tag")
+    def __init__(self,tags,tag):
+        self.tags = tags
+        self.tag = tag
+    def __enter__(self):
+        self.tags[self.tag] += 1
+    def __exit__(self, type, value, traceback):
+        self.tags[self.tag] -= 1
+
+class TagHider(object):
+    """
+        What TagStack.unpush hands back: the tag is not in the stack until the with statement ends,
+        however many times it had been pushed, and then it is back as many times as it was
+    """
+    __slots__ = ("tags","tag","saved")
+    def __init__(self,tags,tag):
+        self.tags = tags
+        self.tag = tag
+        self.saved = []
+    def __enter__(self):
+        self.saved.append(self.tags[self.tag])
+        self.tags[self.tag] = 0
+    def __exit__(self, type, value, traceback):
+        self.tags[self.tag] = self.saved.pop()
+
 class TagStack(object):
     """
         If a tag is pushed onto this, then the tag tests as being "in" this.
@@ -7,23 +38,116 @@ class TagStack(object):
     """
     def __init__(self):
         self.tags = defaultdict(int)
+        self.pushes = {}
+        self.unpushes = {}
     def push(self,the_tag):
-        actual_self = self
-        class ContextManager(object):
-            def __enter__(self):
-                actual_self.tags[the_tag] += 1
-            def __exit__(self, type, value, traceback):
-                actual_self.tags[the_tag] -= 1
-        return ContextManager()
+        counter = self.pushes.get(the_tag)
+        if counter is None:
+            counter = self.pushes[the_tag] = TagCounter(self.tags,the_tag)
+        return counter
     def unpush(self,the_tag):
-        actual_self = self
-        class ContextManager(object):
-            def __enter__(self):
-                actual_self.tags[the_tag] -= 1
-            def __exit__(self, type, value, traceback):
-                actual_self.tags[the_tag] += 1
-        return ContextManager()
+        hider = self.unpushes.get(the_tag)
+        if hider is None:
+            hider = self.unpushes[the_tag] = TagHider(self.tags,the_tag)
+        return hider
     def __contains__(self,the_tag):
-        return self.tags[the_tag] > 1
-        
+        return self.tags[the_tag] > 0
+
+class Traversal(object):
+    """
+        A replacement for pycparser's NodeVisitor that keeps its own stack instead of recursing,
+        so there is no limit on how deeply the tree can nest.
+        A visit_* method is a generator that yields each child it wants visited; the child is visited
+        completely before the generator carries on. A visit_* method that visits no children can
+        be a plain method. Node types without a visit_* method have all their children visited.
+        Which function handles which node type is worked out once per class and node type.
+    """
+    dispatch_tables = {}
+    def visit(self,node):
+        if "begin" in self.__dict__:
+            return self.visit_through_begin(node) # begin has been wrapped on this instance, by a profiler say
+        table = self.dispatch_table()
+        stack = []
+        children = self.begin(node)
+        if children is not None:
+            stack.append(children)
+        while stack:
+            for child in stack[-1]:
+                handler = table.get(child.__class__)
+                if handler is None:
+                    handler = table[child.__class__] = self.handler_for(child.__class__)
+                children = handler(self,child)
+                if children is not None:
+                    stack.append(children)
+                    break
+            else:
+                stack.pop()
+    def visit_through_begin(self,node):
+        begin = self.begin
+        stack = []
+        children = begin(node)
+        if children is not None:
+            stack.append(children)
+        while stack:
+            for child in stack[-1]:
+                children = begin(child)
+                if children is not None:
+                    stack.append(children)
+                    break
+            else:
+                stack.pop()
+    def dispatch_table(self):
+        table = self.dispatch_tables.get(self.__class__)
+        if table is None:
+            table = Traversal.dispatch_tables[self.__class__] = {}
+        return table
+    def begin(self,node):
+        """
+            starts visiting node, returning what is left to do as an iterator of children, or None
+        """
+        table = self.dispatch_table()
+        handler = table.get(node.__class__)
+        if handler is None:
+            handler = table[node.__class__] = self.handler_for(node.__class__)
+        return handler(self,node)
+    def handler_for(self,node_class):
+        name = "visit_"+node_class.__name__
+        for klass in self.__class__.__mro__:
+            if name in klass.__dict__:
+                return klass.__dict__[name]
+        return self.__class__.generic_visit.im_func
+    def generic_visit(self,node):
+        return iter(node)
+
+class TreePrinter(Traversal):
+    """
+        writes a parse tree out the way pycparser's Node.show does, two spaces deeper for each level,
+        but without recursing, so deeply nested code can be shown too
+    """
+    def __init__(self,out,attrnames=False,nodenames=False):
+        self.out = out
+        self.attrnames = attrnames
+        self.nodenames = nodenames
+        self.depth = 0
+        self.child_name = None
+    def generic_visit(self,node):
+        if self.nodenames and self.child_name is not None:
+            self.out.write(" "*self.depth + node.__class__.__name__ + " <" + self.child_name + ">: ")
+        else:
+            self.out.write(" "*self.depth + node.__class__.__name__ + ": ")
+        if node.attr_names:
+            if self.attrnames:
+                self.out.write(", ".join("%s=%s" % (name,getattr(node,name)) for name in node.attr_names))
+            else:
+                self.out.write(", ".join("%s" % getattr(node,name) for name in node.attr_names))
+        self.out.write("\n")
+        self.depth += 2
+        for child_name, child in node.children():
+            self.child_name = child_name
+            yield child
+        self.depth -= 2
 
+def show(node,out=None,attrnames=False,nodenames=False):
+    if out is None:
+        out = sys.stdout
+    TreePrinter(out,attrnames,nodenames).visit(node)
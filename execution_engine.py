@@ -0,0 +1,508 @@
+import pycparser # the C parser written in Python
+import sys # so we can access command-line args
+import argparse # so we can parse command-line options
+import struct
+import time
+
+import mksymtab
+import mk3ac
+from ir import is_constant, constant_value, is_temporary, BINARY_OPERATIONS
+from type_registry import StructType, ArrayType
+
+class ExecutionError(Exception):
+    pass
+
+FORMATS = {1: "<b", 2: "<h", 4: "<i", 8: "<q"}
+UNSIGNED_FORMATS = {1: "<B", 2: "<H", 4: "<I", 8: "<Q"}
+
+def wrap(value,size=4):
+    bits = 8*size
+    return ((value + (1 << (bits-1))) % (1 << bits)) - (1 << (bits-1))
+
+def divide(left,right):
+    if right == 0:
+        raise ExecutionError("division by zero")
+    quotient = abs(left) // abs(right)
+    return -quotient if (left < 0) != (right < 0) else quotient
+
+def remainder(left,right):
+    return left - right * divide(left,right)
+
+# remember that the right operand of a binary operation comes first
+OPERATIONS = {
+    "+": lambda right, left: left + right,
+    "-": lambda right, left: left - right,
+    "*": lambda right, left: left * right,
+    "/": lambda right, left: divide(left,right),
+    "%": lambda right, left: remainder(left,right),
+    "==": lambda right, left: int(left == right),
+    "!=": lambda right, left: int(left != right),
+    "<": lambda right, left: int(left < right),
+    "<=": lambda right, left: int(left <= right),
+    ">": lambda right, left: int(left > right),
+    ">=": lambda right, left: int(left >= right),
+    "&&": lambda right, left: int(bool(left) and bool(right)),
+    "||": lambda right, left: int(bool(left) or bool(right)),
+    "&": lambda right, left: left & right,
+    "|": lambda right, left: left | right,
+    "^": lambda right, left: left ^ right,
+    "<<": lambda right, left: left << (right & 31),
+    ">>": lambda right, left: left >> (right & 31),
+}
+
+# shifts into an 8 byte long or pointer can go up to 63 places
+WIDE_SHIFTS = {
+    "<<": lambda right, left: left << (right & 63),
+    ">>": lambda right, left: left >> (right & 63),
+}
+
+UNARY_OPERATIONS = {
+    "-": lambda value: -value,
+    "+": lambda value: value,
+    "!": lambda value: int(not value),
+    "~": lambda value: ~value,
+}
+
+class Memory(object):
+    """
+        A flat, byte-addressed memory that only grows. Address 0 is never handed out, so it can be NULL.
+    """
+    def __init__(self):
+        self.data = bytearray(16)
+        self.top = 16
+    def allocate(self,size,alignment=4):
+        self.top += -self.top % max(alignment,1)
+        address = self.top
+        self.top += max(size,1)
+        if self.top > len(self.data):
+            self.data.extend(bytearray(max(self.top - len(self.data),len(self.data))))
+        return address
+    def release_to(self,top):
+        self.top = top
+    def check(self,address,size):
+        if address <= 0 or address + size > self.top:
+            raise ExecutionError("bad memory access: %d bytes at %d" % (size,address))
+    def read(self,address,size):
+        self.check(address,size)
+        return struct.unpack_from(FORMATS[size],self.data,address)[0]
+    def write(self,address,size,value):
+        self.check(address,size)
+        struct.pack_into(UNSIGNED_FORMATS[size],self.data,address,value % (1 << (8*size)))
+
+class CompiledFunction(object):
+    """
+        A function's 3AC turned into a list of handlers, one per instruction with labels resolved
+        to indexes. Each handler takes the frame (a list of slots for the function's locals,
+        arguments and temporaries) and returns the index of the next handler, or -1 to return.
+    """
+    def __init__(self,name,handlers,slot_count,arguments,aggregates):
+        self.name = name
+        self.handlers = handlers
+        self.slot_count = slot_count
+        self.arguments = arguments
+        self.aggregates = aggregates
+
+class ExecutionEngine(object):
+    """
+        Runs the 3AC that CodeBuilder produces, in a simulated memory laid out the way the symbol table says.
+        Globals, and locals that are structs, arrays or have their address taken, live in memory;
+        everything else lives in a slot of the frame. A struct or array used as a value stands for its
+        address, which is what load and * expect. Pointer arithmetic is not scaled, just as CodeBuilder emits it.
+    """
+    def __init__(self,symbol_table,step_limit=None):
+        self.symbol_table = symbol_table
+        self.step_limit = step_limit
+        self.registry = symbol_table.type_registry
+        self.memory = Memory()
+        self.globals = {}
+        self.compiled = {}
+        self.instructions_executed = 0
+        self.seconds = 0.0
+        self.depth = 0
+        self.counts = {}
+        for name, value in symbol_table.values.values.items():
+            if isinstance(value,(str,tuple)):
+                the_type = self.type_of(value)
+                if the_type is not None:
+                    self.globals[name] = (self.memory.allocate(the_type.size,the_type.alignment),the_type)
+    def type_of(self,description):
+        try:
+            return self.registry.get(description)
+        except (KeyError,TypeError,ValueError):
+            return None
+    def scalar_size(self,the_type):
+        """
+            how many bytes to read or write for a value of this type, or None if it is a struct or array
+        """
+        if the_type is None:
+            return 4
+        if isinstance(the_type,(StructType,ArrayType)):
+            return None
+        return the_type.size
+    def allocate(self,description,count=1):
+        the_type = self.registry.get(description)
+        return self.memory.allocate(the_type.size*count,the_type.alignment)
+    def store(self,address,description,value):
+        self.memory.write(address,self.scalar_size(self.registry.get(description)),value)
+    def fetch(self,address,description):
+        return self.memory.read(address,self.scalar_size(self.registry.get(description)))
+    def store_field(self,address,struct_description,field_name,value):
+        offset, field_type = self.symbol_table.field(struct_description,field_name)
+        self.store(address+offset,field_type,value)
+    def fetch_field(self,address,struct_description,field_name):
+        offset, field_type = self.symbol_table.field(struct_description,field_name)
+        return self.fetch(address+offset,field_type)
+    def function(self,name):
+        compiled = self.compiled.get(name)
+        if compiled is None:
+            compiled = self.compiled[name] = self.compile(name)
+        return compiled
+    def compile(self,name):
+        if "{}" not in (self.symbol_table.values.values.get(name) or ()):
+            raise ExecutionError("%s has no body" % (name,))
+        scope = self.symbol_table.function(name)
+        code = list(scope["{}"])
+        arguments = [argument for argument, the_type in scope.get("...",[])]
+        types = dict(scope.get("...",[]))
+        for local, the_type in scope.items():
+            if local not in ("...","return","{}"):
+                types[local] = the_type
+        address_taken = set(instruction[3] for instruction in code if instruction[1] == "&" and instruction[4] == "")
+        slots = {}
+        for argument in arguments:
+            slots[argument] = len(slots)
+        for local in sorted(types):
+            if local not in slots and not isinstance(types[local],mk3ac.Label):
+                slots[local] = len(slots)
+        aggregates = []
+        in_memory = {}
+        for local in sorted(slots):
+            the_type = self.type_of(types[local])
+            if is_temporary(local) and local not in address_taken:
+                continue # a struct or array temporary is only ever its address
+            if self.scalar_size(the_type) is None or local in address_taken:
+                size = the_type.size if the_type is not None else 4
+                alignment = the_type.alignment if the_type is not None else 4
+                aggregates.append((slots[local],size,alignment,slots[local] < len(arguments)))
+                in_memory[local] = self.scalar_size(the_type)
+        positions = {}
+        real = []
+        for instruction in code:
+            if instruction[0] is not None:
+                positions[instruction[0]] = len(real)
+            if instruction[1] != "":
+                real.append(instruction)
+        compiler = HandlerCompiler(self,slots,types,in_memory,positions,real)
+        handlers = [compiler.compile(instruction,index) for index, instruction in enumerate(real)]
+        handlers.append(falls_off_the_end)
+        return CompiledFunction(name,handlers,len(slots),arguments,aggregates)
+    def call(self,name,*arguments):
+        """
+            runs a function on some int (or address) arguments and returns what it returns.
+            The time spent is only counted for the outermost call, so a call made by the code isn't counted twice.
+        """
+        compiled = self.function(name)
+        if len(arguments) != len(compiled.arguments):
+            raise ExecutionError("%s takes %d arguments" % (name,len(compiled.arguments)))
+        frame = [0]*(compiled.slot_count+1)
+        frame[:len(arguments)] = arguments
+        top = self.memory.top
+        for slot, size, alignment, is_argument in compiled.aggregates:
+            address = self.memory.allocate(size,alignment)
+            if is_argument:
+                self.memory.write(address,size,frame[slot])
+            frame[slot] = address
+        handlers = compiled.handlers
+        count = 0
+        started = time.time()
+        pc = 0
+        self.depth += 1
+        try:
+            if self.step_limit is None:
+                while pc >= 0:
+                    pc = handlers[pc](frame)
+                    count += 1
+            else:
+                limit = self.step_limit
+                while pc >= 0:
+                    pc = handlers[pc](frame)
+                    count += 1
+                    if count > limit:
+                        raise ExecutionError("%s ran for more than %d instructions" % (name,limit))
+        finally:
+            self.depth -= 1
+            if self.depth == 0:
+                self.seconds += time.time() - started
+            self.memory.release_to(top)
+            self.instructions_executed += count
+            self.counts[name] = self.counts.get(name,0) + count
+        return frame[-1]
+    def report(self):
+        return {"instructions": self.instructions_executed,
+                "seconds": self.seconds,
+                "instructions_per_second": self.instructions_executed / max(self.seconds,1e-9),
+                "functions": dict(self.counts)}
+
+def falls_off_the_end(frame):
+    frame[-1] = None
+    return -1
+
+class HandlerCompiler(object):
+    """
+        turns single instructions into handlers, deciding once how each operand is read and written
+    """
+    def __init__(self,engine,slots,types,in_memory,positions,code):
+        self.engine = engine
+        self.code = code
+        self.memory = engine.memory
+        self.slots = slots
+        self.types = types
+        self.in_memory = in_memory
+        self.positions = positions
+    def size_of(self,name):
+        """
+            the size to wrap a value stored in name to, or to read through a pointer into name
+        """
+        the_type = self.engine.type_of(self.types.get(name)) if name in self.types else None
+        if name in self.engine.globals and name not in self.slots:
+            the_type = self.engine.globals[name][1]
+        size = self.engine.scalar_size(the_type)
+        return size if size is not None else 4
+    def pointee(self,name):
+        """
+            the type of what name points to, if it is known
+        """
+        description = self.types.get(name) if name in self.types else self.engine.symbol_table.values.values.get(name)
+        if isinstance(description,tuple) and description[0] == "":
+            return self.engine.type_of(description[1])
+        return None
+    def reader(self,operand):
+        """
+            (kind, what): ("constant",value), ("slot",index) or ("function",reader)
+        """
+        if is_constant(operand):
+            return ("constant",wrap(constant_value(operand),8)) # a long may need all 8 bytes; the writer narrows it
+        memory = self.memory
+        if operand in self.slots:
+            slot = self.slots[operand]
+            size = self.in_memory.get(operand,"slot")
+            if size == "slot" or size is None:
+                return ("slot",slot) # a scalar, or the address of a struct or array
+            return ("function",lambda frame: memory.read(frame[slot],size))
+        if operand in self.engine.globals:
+            address, the_type = self.engine.globals[operand]
+            size = self.engine.scalar_size(the_type)
+            if size is None:
+                return ("constant",address)
+            return ("function",lambda frame: memory.read(address,size))
+        def undefined(frame):
+            raise ExecutionError("%r is not defined" % (operand,))
+        return ("function",undefined)
+    def reader_function(self,operand):
+        kind, what = self.reader(operand)
+        if kind == "constant":
+            return lambda frame: what
+        if kind == "slot":
+            return lambda frame: frame[what]
+        return what
+    def writer(self,name):
+        memory = self.memory
+        size = self.size_of(name)
+        if name in self.slots:
+            slot = self.slots[name]
+            in_memory = self.in_memory.get(name,"slot")
+            if in_memory == "slot":
+                if size == 4:
+                    def write(frame,value):
+                        frame[slot] = ((value + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+                else:
+                    def write(frame,value):
+                        frame[slot] = wrap(value,size)
+                return write
+            if in_memory is None:
+                size = self.engine.type_of(self.types[name]).size
+                def copy_bytes(frame,value):
+                    memory.check(value,size)
+                    memory.data[frame[slot]:frame[slot]+size] = memory.data[value:value+size]
+                return copy_bytes
+            return lambda frame, value: memory.write(frame[slot],in_memory,value)
+        if name in self.engine.globals:
+            address, the_type = self.engine.globals[name]
+            return lambda frame, value: memory.write(address,size,value)
+        def undefined(frame,value):
+            raise ExecutionError("%r is not defined" % (name,))
+        return undefined
+    def compile(self,instruction,index):
+        label, operation, destination, source1, source2 = instruction
+        following = index + 1
+        memory = self.memory
+        if operation == "unconditional_branch":
+            target = self.positions[destination]
+            return lambda frame: target
+        if operation == "conditional_branch":
+            target = self.positions[destination]
+            kind, what = self.reader(source1)
+            if kind == "slot":
+                return lambda frame: target if frame[what] else following
+            condition = self.reader_function(source1)
+            return lambda frame: target if condition(frame) else following
+        if operation == "return":
+            if destination == "":
+                return falls_off_the_end
+            value = self.reader_function(destination)
+            def do_return(frame):
+                frame[-1] = value(frame)
+                return -1
+            return do_return
+        if operation == "&" and source2 == "":
+            write = self.writer(destination)
+            if source1 in self.slots and source1 in self.in_memory:
+                slot = self.slots[source1]
+                address = lambda frame: frame[slot]
+            elif source1 in self.engine.globals:
+                where = self.engine.globals[source1][0]
+                address = lambda frame: where
+            else:
+                raise ExecutionError("can not take the address of %r" % (source1,))
+            def take_address(frame):
+                write(frame,address(frame))
+                return following
+            return take_address
+        if operation in ("++","--","p++","p--") and source2 == "":
+            change = 1 if operation in ("++","p++") else -1
+            before = operation.startswith("p")
+            read = self.reader_function(source1)
+            write_operand = self.writer(source1)
+            write = self.writer(destination)
+            def increment(frame):
+                old = read(frame)
+                write_operand(frame,old+change)
+                write(frame,old if before else read(frame))
+                return following
+            return increment
+        if operation == "*" and source2 == "" or operation == "load":
+            size = self.engine.scalar_size(self.engine.type_of(self.types.get(destination))) if destination in self.types else 4
+            base = self.reader_function(source1)
+            offset = self.reader_function(source2) if operation == "load" else (lambda frame: 0)
+            write = self.writer(destination)
+            if size is None:
+                def address_of(frame):
+                    write(frame,base(frame)+offset(frame))
+                    return following
+                return address_of
+            def read_memory(frame):
+                write(frame,memory.read(base(frame)+offset(frame),size))
+                return following
+            return read_memory
+        if operation == "store":
+            value = self.reader_function(source1)
+            address = self.reader_function(source2)
+            the_type = self.pointee(source2)
+            size = self.engine.scalar_size(the_type)
+            if size is None:
+                size = the_type.size
+                def copy_bytes(frame):
+                    target, origin = address(frame), value(frame)
+                    memory.check(target,size)
+                    memory.check(origin,size)
+                    memory.data[target:target+size] = memory.data[origin:origin+size]
+                    return following
+                return copy_bytes
+            def store(frame):
+                memory.write(address(frame),size,value(frame))
+                return following
+            return store
+        if operation == "=":
+            write = self.writer(destination)
+            kind, what = self.reader(source1)
+            if kind == "slot" and destination in self.slots and destination not in self.in_memory and self.size_of(destination) == 4:
+                slot = self.slots[destination]
+                def copy(frame):
+                    frame[slot] = frame[what]
+                    return following
+                return copy
+            value = self.reader_function(source1)
+            def assign(frame):
+                write(frame,value(frame))
+                return following
+            return assign
+        if operation in BINARY_OPERATIONS and source2 != "":
+            function = OPERATIONS[operation]
+            if operation in WIDE_SHIFTS and self.size_of(destination) == 8:
+                function = WIDE_SHIFTS[operation]
+            write = self.writer(destination)
+            right_kind, right = self.reader(source1)
+            left_kind, left = self.reader(source2)
+            if right_kind == "slot" and left_kind == "slot":
+                def binary(frame):
+                    write(frame,function(frame[right],frame[left]))
+                    return following
+            elif right_kind == "constant" and left_kind == "slot":
+                def binary(frame):
+                    write(frame,function(right,frame[left]))
+                    return following
+            else:
+                right = self.reader_function(source1)
+                left = self.reader_function(source2)
+                def binary(frame):
+                    write(frame,function(right(frame),left(frame)))
+                    return following
+            return binary
+        if operation in UNARY_OPERATIONS and source2 == "":
+            function = UNARY_OPERATIONS[operation]
+            write = self.writer(destination)
+            value = self.reader_function(source1)
+            def unary(frame):
+                write(frame,function(value(frame)))
+                return following
+            return unary
+        if operation == "param":
+            return lambda frame: following # the call reads it
+        if operation == "call":
+            count = constant_value(source2)
+            params = self.code[index-count:index]
+            if len(params) != count or any(param[1] != "param" for param in params):
+                raise ExecutionError("%r is not right after its params" % (instruction,))
+            arguments = [self.reader_function(param[3]) for param in params]
+            write = self.writer(destination)
+            engine = self.engine
+            def call(frame):
+                result = engine.call(source1,*[argument(frame) for argument in arguments])
+                if result is not None:
+                    write(frame,result)
+                return following
+            return call
+        def unsupported(frame):
+            raise ExecutionError("can not execute %r" % (instruction,))
+        return unsupported
+
+def compile_and_load(code,optimized=False,step_limit=None,data_model="ILP32"):
+    parsed_code = mk3ac.new_parser().parse(code)
+    st = mksymtab.makeSymbolTable(parsed_code,lazy=True,data_model=data_model,generator=mk3ac.generate_function) # only the functions that get called are compiled
+    if optimized:
+        mk3ac.optimize_symbol_table(st)
+    return ExecutionEngine(st,step_limit)
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="compile some C to 3AC and run one of its functions")
+    argument_parser.add_argument("file",help="the C file to compile")
+    argument_parser.add_argument("function",help="the function to call")
+    argument_parser.add_argument("arguments",nargs="*",type=int,help="int arguments to call it with")
+    argument_parser.add_argument("-O","--optimize",action="store_true",help="run the optimization passes first")
+    argument_parser.add_argument("--step-limit",type=int,metavar="N",help="give up on a call after N instructions")
+    argument_parser.add_argument("--compare",action="store_true",help="run both the plain and the optimized code, and check they agree")
+    arguments = argument_parser.parse_args()
+    with open(arguments.file) as source:
+        code = source.read()
+    runs = [False,True] if arguments.compare else [arguments.optimize]
+    results = []
+    for optimized in runs:
+        engine = compile_and_load(code,optimized,arguments.step_limit)
+        result = engine.call(arguments.function,*arguments.arguments)
+        report = engine.report()
+        results.append(result)
+        print "%s%s(%s) = %r" % ("optimized " if optimized else "",arguments.function,", ".join(map(str,arguments.arguments)),result)
+        print "    %d instructions in %.4fs, %.0f instructions/s" % (report["instructions"],report["seconds"],report["instructions_per_second"])
+    if arguments.compare and results[0] != results[1]:
+        print "MISMATCH"
+        sys.exit(1)
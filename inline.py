@@ -0,0 +1,228 @@
+from ir import is_constant, is_temporary, local_names, names_used, names_defined
+from loops import TemporaryMaker
+from type_registry import StructType, ArrayType
+from mk3ac import Label
+from cfg import ControlFlowGraph
+
+# a call is worth inlining when the body it brings in is no more than this many instructions bigger
+# than the params, call and return it gets rid of
+INLINE_BUDGET = 10
+# a constant argument usually lets constant_folding throw away some of the body, so it buys a bit more room
+CONSTANT_ARGUMENT_BONUS = 5
+# callers are not grown past this many instructions
+MAX_CALLER_SIZE = 2000
+
+def calls_in(code):
+    return set(instruction[3] for instruction in code if instruction[1] == "call")
+
+def size_of(code):
+    """
+        how many instructions there are, not counting the rows that only carry a label
+    """
+    return sum(1 for instruction in code if instruction[1] != "")
+
+def falls_off_the_end(code):
+    """
+        whether some path from the entry runs past the last row of code without returning
+    """
+    graph = ControlFlowGraph(code)
+    last = graph.blocks[-1]
+    if last.instructions and last.instructions[-1][1] in ("return","unconditional_branch"):
+        return False
+    return last in graph.reverse_postorder()
+
+class CallGraph(object):
+    """
+        Which of the functions given calls which. components are the strongly connected components,
+        callees before their callers, so a function that is part of a cycle of calls (or calls itself)
+        shares a component with every function in that cycle.
+    """
+    def __init__(self,symbol_table,function_names):
+        self.callees = {}
+        for name in function_names:
+            self.callees[name] = sorted(callee for callee in calls_in(symbol_table.function(name)["{}"])
+                                        if callee in function_names)
+        self.components = self.strongly_connected_components()
+        self.component_of = {}
+        for index, component in enumerate(self.components):
+            for name in component:
+                self.component_of[name] = index
+    def strongly_connected_components(self):
+        """
+            Tarjan's algorithm, with a stack of its own instead of recursion;
+            it finds the components in reverse topological order, which is callees first
+        """
+        index_of = {}
+        lowlink = {}
+        on_stack = set()
+        stack = []
+        components = []
+        for root in sorted(self.callees):
+            if root in index_of:
+                continue
+            work = [(root,iter(self.callees[root]))]
+            index_of[root] = lowlink[root] = len(index_of)
+            stack.append(root)
+            on_stack.add(root)
+            while work:
+                name, callees = work[-1]
+                for callee in callees:
+                    if callee not in index_of:
+                        index_of[callee] = lowlink[callee] = len(index_of)
+                        stack.append(callee)
+                        on_stack.add(callee)
+                        work.append((callee,iter(self.callees[callee])))
+                        break
+                    elif callee in on_stack:
+                        lowlink[name] = min(lowlink[name],index_of[callee])
+                else:
+                    work.pop()
+                    if work:
+                        caller = work[-1][0]
+                        lowlink[caller] = min(lowlink[caller],lowlink[name])
+                    if lowlink[name] == index_of[name]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member == name:
+                                break
+                        components.append(sorted(component))
+        return components
+    def bottom_up(self):
+        return [name for component in self.components for name in component]
+    def is_recursive(self,caller,callee):
+        """
+            whether callee can end up calling caller, in which case inlining it would never stop
+        """
+        return callee in self.component_of and self.component_of.get(caller) == self.component_of[callee]
+
+class Inlining(object):
+    """
+        Replaces calls to small functions with a copy of their code. The callee's arguments become locals
+        set from what was passed, each return sets the call's destination and branches past the copy,
+        and every name the callee has to itself is renamed so it can't collide with the caller's:
+        temporaries and labels get fresh genLabel-style names, and locals and arguments get the callee's
+        name in front of theirs. Functions are done callees first, so what is copied in has already been
+        inlined into and optimized itself, and a call to a function in the same cycle of calls as the caller
+        is never inlined. What is copied is the callee's code as the rounds of passes left it, which
+        PassManager hands to optimized: the final passes fold labels onto instructions and give temporaries
+        more than one definition, which the passes that run on the caller afterwards can't cope with.
+        So only functions that went through the same run_on_symbol_table are inlined.
+    """
+    name = "inlining"
+    def __init__(self,budget=INLINE_BUDGET,constant_argument_bonus=CONSTANT_ARGUMENT_BONUS,max_caller_size=MAX_CALLER_SIZE):
+        self.budget = budget
+        self.constant_argument_bonus = constant_argument_bonus
+        self.max_caller_size = max_caller_size
+        self.optimized_code = {}
+    def order(self,symbol_table,function_names):
+        """
+            the functions, callees first, with the call graph they make
+        """
+        self.optimized_code = {}
+        graph = CallGraph(symbol_table,function_names)
+        return graph.bottom_up(), graph
+    def optimized(self,name,code,scope):
+        """
+            remembers a function's optimized code, from before the final passes, along with the scope it goes with
+        """
+        snapshot = dict(scope)
+        snapshot["{}"] = list(code)
+        self.optimized_code[name] = snapshot
+    def inlinable(self,symbol_table,caller_scope,callee):
+        """
+            the callee's scope, if its code can be copied into a caller at all
+        """
+        scope = self.optimized_code.get(callee)
+        if scope is None:
+            return None # only declared, released, or not optimized along with the caller
+        for argument, the_type in scope.get("...",[]):
+            if isinstance(self.type_of(symbol_table,the_type),(StructType,ArrayType)):
+                return None
+        mine = local_names(scope)
+        theirs = local_names(caller_scope)
+        for instruction in scope["{}"]:
+            for name in names_used(instruction) + list(names_defined(instruction)):
+                if name in theirs and name not in mine:
+                    return None # a global, which a local of the caller's would hide
+        return scope
+    def type_of(self,symbol_table,description):
+        try:
+            return symbol_table.type_registry.get(description)
+        except (KeyError,TypeError,ValueError):
+            return None
+    def worth_it(self,callee_scope,params):
+        arguments = len(callee_scope.get("...",[]))
+        constants = sum(1 for param in params if is_constant(param[3]))
+        cost = size_of(callee_scope["{}"]) - (arguments + 2)
+        return cost <= self.budget + self.constant_argument_bonus*constants
+    def run(self,symbol_table,name,graph):
+        caller_scope = symbol_table.function(name)
+        code = list(caller_scope["{}"])
+        result = []
+        maker = None
+        size = size_of(code)
+        for index, instruction in enumerate(code):
+            if instruction[1] != "call":
+                result.append(instruction)
+                continue
+            label, operation, destination, callee, count = instruction
+            params = code[index-count:index]
+            callee_scope = None
+            if size < self.max_caller_size and not graph.is_recursive(name,callee):
+                callee_scope = self.inlinable(symbol_table,caller_scope,callee)
+            if callee_scope is None or len(callee_scope.get("...",[])) != count or not self.worth_it(callee_scope,params):
+                result.append(instruction)
+                continue
+            if maker is None:
+                maker = TemporaryMaker(caller_scope)
+            del result[len(result)-count:]
+            for row in params + [instruction]:
+                if row[0] is not None:
+                    result.append((row[0],"","","",""))
+            body = self.copy(symbol_table,caller_scope,callee,callee_scope,params,destination,maker)
+            size += size_of(body) - count - 1
+            result.extend(body)
+        return result
+    def copy(self,symbol_table,caller_scope,callee,callee_scope,params,destination,maker):
+        """
+            the callee's code, renamed into the caller's scope, for a call with these params that sets destination
+        """
+        renamed = {}
+        taken = local_names(caller_scope)
+        types = dict(callee_scope.get("...",[]))
+        for local in local_names(callee_scope):
+            the_type = callee_scope[local] if local in callee_scope else types[local]
+            if is_temporary(local):
+                renamed[local] = maker.make(the_type)
+                continue
+            new_name = "%s_%s" % (callee,local)
+            suffix = 0
+            while new_name in taken or new_name in symbol_table.values.values:
+                suffix += 1
+                new_name = "%s_%s_%d" % (callee,local,suffix)
+            taken.add(new_name)
+            caller_scope[new_name] = the_type
+            renamed[local] = new_name
+        end = maker.make(Label())
+        body = []
+        for (argument, the_type), param in zip(callee_scope.get("...",[]),params):
+            body.append((None,"=",renamed[argument],param[3],""))
+        for label, operation, target, source1, source2 in callee_scope["{}"]:
+            label = renamed.get(label,label)
+            if operation == "return":
+                if target != "":
+                    body.append((label,"=",destination,renamed.get(target,target),""))
+                    label = None
+                body.append((label,"unconditional_branch",end,"",""))
+            elif operation == "call":
+                body.append((label,operation,renamed.get(target,target),source1,source2))
+            else:
+                body.append((label,operation,renamed.get(target,target),renamed.get(source1,source1),renamed.get(source2,source2)))
+        if falls_off_the_end(list(callee_scope["{}"])):
+            # using what such a call gives back is undefined in C; 0 is just an arbitrary stand-in
+            body.append((None,"=",destination,"0",""))
+        body.append((end,"","","",""))
+        return body
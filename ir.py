@@ -0,0 +1,286 @@
+import re
+from array import array
+from itertools import izip
+
+from type_registry import PrimitiveType, PointerType, PRIMITIVE_SIZES
+
+# What the instructions that CodeBuilder emits mean. Every instruction is
+# (label,operation,destination,source1,source2), and:
+#   ("","","","",label)                  only carries a label
+#   ("=",d,a,"")                         d = a
+#   (op,d,a,b) for a binary op           d = b op a, because visit_BinaryOp pops the right operand first
+#   (op,d,a,"") for a unary op           d = op a ("*" reads memory through a; "++", "--" and "p--" also change a)
+#   ("load",d,a,offset)                  d = the value at offset bytes past the start of a
+#   ("store","",a,p)                     the value at the address p = a, as big as what p points to
+#   ("conditional_branch",target,a,"")   go to target if a is not zero
+#   ("unconditional_branch",target,"","")
+#   ("return",a,"","")
+#   ("param","",a,"")                    a is the next argument of the call that follows
+#   ("call",d,f,n)                       d = f(the n params just before it), which are always right before it
+BINARY_OPERATIONS = frozenset(["+","-","*","/","%","==","!=","<","<=",">",">=","&&","||","&","|","^","<<",">>"])
+UNARY_OPERATIONS = frozenset(["-","+","!","~","*","&","++","--","p++","p--","sizeof"])
+PURE_UNARY_OPERATIONS = frozenset(["-","+","!","~"])
+INCREMENT_OPERATIONS = frozenset(["++","--","p++","p--"])
+MEMORY_READS = frozenset(["*","load"])
+BRANCHES = frozenset(["conditional_branch","unconditional_branch"])
+TEMPORARY_PREFIX = "L"
+
+integer_literal = re.compile(r"-?(0[xX][0-9a-fA-F]+|[0-9]+)[uUlL]*$")
+identifier = re.compile(r"[A-Za-z_][A-Za-z_0-9]*$")
+temporary_name = re.compile(TEMPORARY_PREFIX+r"[0-9]+$")
+
+# operands come up over and over again, so what the regular expressions say about them is remembered
+classified_constants = {}
+classified_names = {}
+CLASSIFIED_LIMIT = 1 << 16
+
+def is_constant(operand):
+    if isinstance(operand,(int,long)):
+        return True
+    result = classified_constants.get(operand)
+    if result is None:
+        result = isinstance(operand,str) and integer_literal.match(operand) is not None
+        if len(classified_constants) > CLASSIFIED_LIMIT:
+            classified_constants.clear()
+        classified_constants[operand] = result
+    return result
+
+def constant_value(operand):
+    if isinstance(operand,(int,long)):
+        return operand
+    digits = operand.rstrip("uUlL")
+    negative = digits.startswith("-")
+    if negative:
+        digits = digits[1:]
+    if digits[:2] in ("0x","0X"):
+        value = int(digits[2:],16)
+    elif len(digits) > 1 and digits[0] == "0":
+        value = int(digits,8)
+    else:
+        value = int(digits)
+    return -value if negative else value
+
+def wrap(value,size=4):
+    """
+        value as a size byte int
+    """
+    bits = 8*size
+    return ((value + (1 << (bits-1))) % (1 << bits)) - (1 << (bits-1))
+
+def size_of(name,scope,symbol_table=None):
+    """
+        how many bytes name holds, going by its type in the function's scope or else among the globals;
+        4, what sizeof says an int is, for a name that isn't an int, long, char, short or pointer.
+        Without a symbol table, the globals are unknown and the sizes are the ILP32 ones.
+    """
+    description = scope.get(name)
+    if description is None:
+        description = dict(scope.get("...",[])).get(name)
+    if symbol_table is None:
+        return PRIMITIVE_SIZES.get(description,4) if isinstance(description,str) else 4
+    if description is None:
+        description = symbol_table.values.values.get(name)
+    try:
+        the_type = symbol_table.type_registry.get(description)
+    except (KeyError,TypeError,ValueError):
+        return 4
+    return the_type.size if isinstance(the_type,(PrimitiveType,PointerType)) else 4
+
+def is_name(operand):
+    if not isinstance(operand,str):
+        return False
+    result = classified_names.get(operand)
+    if result is None:
+        result = identifier.match(operand) is not None
+        if len(classified_names) > CLASSIFIED_LIMIT:
+            classified_names.clear()
+        classified_names[operand] = result
+    return result
+
+def is_temporary(name):
+    """
+        whether name looks like something genLabel made up
+    """
+    return isinstance(name,str) and temporary_name.match(name) is not None
+
+def is_unary(instruction):
+    return instruction[4] == "" and instruction[1] in UNARY_OPERATIONS
+
+def is_binary(instruction):
+    return instruction[4] != "" and instruction[1] in BINARY_OPERATIONS
+
+def operands_used(instruction):
+    """
+        the operands an instruction reads, names and constants alike
+    """
+    label, operation, destination, source1, source2 = instruction
+    if operation == "":
+        return ()
+    if operation == "=":
+        return (source1,)
+    if operation == "return":
+        return (destination,) if destination != "" else ()
+    if operation == "conditional_branch":
+        return (source1,)
+    if operation == "unconditional_branch" or operation == "call":
+        return ()
+    if operation == "param":
+        return (source1,)
+    if source2 == "":
+        return (source1,) if source1 != "" else ()
+    return (source1,source2)
+
+def names_used(instruction):
+    return [operand for operand in operands_used(instruction) if is_name(operand)]
+
+def names_defined(instruction):
+    label, operation, destination, source1, source2 = instruction
+    if operation in ("","return","conditional_branch","unconditional_branch","param","store"):
+        return ()
+    if operation in INCREMENT_OPERATIONS and source2 == "" and is_name(source1):
+        return (destination,source1)
+    return (destination,)
+
+def is_pure(instruction):
+    """
+        whether an instruction does nothing but compute its destination, so that it can be removed if that is never used
+    """
+    operation = instruction[1]
+    if operation == "=" or operation == "load":
+        return True
+    if is_binary(instruction):
+        return True
+    if is_unary(instruction):
+        return operation in PURE_UNARY_OPERATIONS or operation == "*"
+    return False
+
+def address_taken(code):
+    """
+        names whose address is taken, which passes leave alone because they can change behind their back
+    """
+    return set(instruction[3] for instruction in code if instruction[1] == "&" and instruction[4] == "")
+
+def local_names(scope):
+    """
+        the names in a function's scope that nothing outside the function can see: its locals, temporaries and arguments
+    """
+    names = set(name for name in scope if name not in ("...","return","{}"))
+    names.update(name for name, the_type in scope.get("...",[]))
+    return names
+
+def is_block_boundary(instruction):
+    """
+        whether straight-line reasoning has to stop at this instruction
+    """
+    operation = instruction[1]
+    return operation == "" or operation in BRANCHES or operation == "return"
+
+class OperandTable(object):
+    """
+        Gives every distinct operand (a name, a constant, None or "") a small integer id.
+        Strings are interned as they go in, so a temporary's name is one shared object
+        no matter how many instructions mention it.
+    """
+    def __init__(self):
+        self.operands = []
+        self.ids = {}
+        self.intern(None)
+        self.intern("")
+    def intern(self,operand):
+        the_id = self.ids.get(operand)
+        if the_id is None:
+            if type(operand) is str:
+                operand = intern(operand)
+            the_id = len(self.operands)
+            self.operands.append(operand)
+            self.ids[operand] = the_id
+        return the_id
+    def __getitem__(self,the_id):
+        return self.operands[the_id]
+    def __len__(self):
+        return len(self.operands)
+
+class InstructionList(object):
+    """
+        The 3AC for one function, kept as five parallel arrays of ids
+        (label, operation, destination, source1, source2) rather than a list of tuples.
+        Operations are interned in their own small table and everything else in an OperandTable.
+        Iterating or indexing still gives the (label,operation,destination,source1,source2)
+        tuples that the rest of the compiler has always used.
+    """
+    def __init__(self,instructions=(),operands=None):
+        if operands is None:
+            operands = OperandTable()
+        self.operands = operands
+        self.operations = []
+        self.operation_ids = {}
+        self.labels = array('i')
+        self.ops = array('i')
+        self.destinations = array('i')
+        self.sources1 = array('i')
+        self.sources2 = array('i')
+        self.extend(instructions)
+    def operation_id(self,operation):
+        the_id = self.operation_ids.get(operation)
+        if the_id is None:
+            the_id = len(self.operations)
+            self.operations.append(intern(operation))
+            self.operation_ids[operation] = the_id
+        return the_id
+    def emit(self,label,operation,destination,source1,source2):
+        intern_operand = self.operands.intern
+        self.labels.append(intern_operand(label))
+        self.ops.append(self.operation_id(operation))
+        self.destinations.append(intern_operand(destination))
+        self.sources1.append(intern_operand(source1))
+        self.sources2.append(intern_operand(source2))
+    def append(self,instruction):
+        self.emit(*instruction)
+    def extend(self,instructions):
+        for instruction in instructions:
+            self.emit(*instruction)
+    def __len__(self):
+        return len(self.ops)
+    def instruction(self,index):
+        operands = self.operands.operands
+        return (operands[self.labels[index]],
+                self.operations[self.ops[index]],
+                operands[self.destinations[index]],
+                operands[self.sources1[index]],
+                operands[self.sources2[index]])
+    def __getitem__(self,index):
+        if isinstance(index,slice):
+            return [self.instruction(i) for i in xrange(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.instruction(index)
+    def __iter__(self):
+        operands = self.operands.operands
+        operations = self.operations
+        for label, op, destination, source1, source2 in izip(self.labels,self.ops,self.destinations,self.sources1,self.sources2):
+            yield (operands[label],operations[op],operands[destination],operands[source1],operands[source2])
+    def tolist(self):
+        return list(self)
+    def __eq__(self,other):
+        if isinstance(other,(InstructionList,list,tuple)):
+            return len(self) == len(other) and all(a == b for a, b in izip(self,other))
+        return NotImplemented
+    def __ne__(self,other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+    def __repr__(self):
+        return repr(self.tolist())
+
+def printable(what):
+    """
+        a copy of a scope tree with the instruction lists turned back into lists, for pprint
+    """
+    if isinstance(what,InstructionList) or hasattr(what,"tolist"):
+        return what.tolist()
+    if isinstance(what,dict):
+        return dict((key,printable(value)) for key, value in what.items())
+    return what
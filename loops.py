@@ -0,0 +1,394 @@
+from collections import defaultdict
+
+from ir import is_binary, is_constant, constant_value, is_temporary, is_pure, names_used, names_defined, \
+    wrap, size_of, address_taken, local_names, MEMORY_READS, BRANCHES, TEMPORARY_PREFIX
+from cfg import ControlFlowGraph, liveness
+
+# induction variables have to be a whole int, so that adding to a running product wraps around the way the variable does
+WORD_TYPES = frozenset(["int","signed","signed int","unsigned","unsigned int","long","long int","signed long","signed long int",
+                        "unsigned long","unsigned long int"])
+
+def type_of(scope,name):
+    """
+        the type of a local, temporary or argument
+    """
+    if name in scope:
+        return scope[name]
+    for argument, the_type in scope.get("...",[]):
+        if argument == name:
+            return the_type
+    return None
+
+def dominators(graph):
+    """
+        for each block reachable from the entry, the set of blocks that every path from the entry to it goes through
+    """
+    order = graph.reverse_postorder()
+    everything = set(block.index for block in order)
+    dominated_by = dict((block.index,set(everything)) for block in order)
+    dominated_by[0] = set([0])
+    changed = True
+    while changed:
+        changed = False
+        for block in order[1:]:
+            incoming = [dominated_by[predecessor.index] for predecessor in block.predecessors
+                        if predecessor.index in dominated_by]
+            new = set.intersection(*incoming) if incoming else set()
+            new.add(block.index)
+            if new != dominated_by[block.index]:
+                dominated_by[block.index] = new
+                changed = True
+    return dominated_by
+
+class Loop(object):
+    """
+        A natural loop: header dominates every block in blocks, and latches are the blocks in it that branch back to header.
+        exits are the (block in the loop, block outside it) edges that leave it.
+    """
+    def __init__(self,header,blocks,latches,graph):
+        self.header = header
+        self.blocks = blocks
+        self.latches = latches
+        self.exits = [(block,successor) for block in sorted(blocks) for successor in graph.blocks[block].successors
+                      if successor.index not in blocks]
+    def __repr__(self):
+        return "Loop(%d,%r)" % (self.header,sorted(self.blocks))
+
+def natural_loops(graph,dominated_by=None):
+    """
+        every natural loop in the graph, innermost first; back edges to the same header make one loop
+    """
+    if dominated_by is None:
+        dominated_by = dominators(graph)
+    bodies = {}
+    latches = defaultdict(list)
+    for block in graph.blocks:
+        if block.index not in dominated_by:
+            continue
+        for successor in block.successors:
+            if successor.index in dominated_by[block.index]:
+                body = bodies.setdefault(successor.index,set([successor.index]))
+                latches[successor.index].append(block.index)
+                pending = [block.index]
+                while pending:
+                    index = pending.pop()
+                    if index not in body:
+                        body.add(index)
+                        pending.extend(predecessor.index for predecessor in graph.blocks[index].predecessors)
+    loops = [Loop(header,body,latches[header],graph) for header, body in bodies.items()]
+    loops.sort(key=lambda loop: (len(loop.blocks),loop.header))
+    return loops
+
+def may_loop(code):
+    """
+        whether any branch goes back to a label above it, which every loop needs, so the passes can skip straight-line code
+    """
+    seen = set()
+    for instruction in code:
+        if instruction[0] is not None:
+            seen.add(instruction[0])
+        if instruction[1] in BRANCHES and instruction[2] in seen:
+            return True
+    return False
+
+def block_starts(graph):
+    """
+        where each block's first instruction is in the code the graph was made from
+        (or would be, for an empty block)
+    """
+    starts = []
+    position = 0
+    for block in graph.blocks:
+        starts.append(position)
+        position += len(block.instructions)
+    return starts
+
+def preheader_position(graph,loop,starts):
+    """
+        where in the code instructions can go so that they run once, just before the loop is entered,
+        or None if there is no such place. That is just before the header's label, as long as the only
+        way into the loop from outside is falling into the header from the code right before it,
+        which is how visit_For and visit_While lay out their loops.
+    """
+    header = graph.blocks[loop.header]
+    if header.label is None or loop.header == 0:
+        return None
+    outside = [predecessor for predecessor in header.predecessors if predecessor.index not in loop.blocks]
+    if len(outside) != 1 or outside[0].index != loop.header - 1:
+        return None
+    last = outside[0].instructions[-1] if outside[0].instructions else None
+    if last is not None and (last[1] in BRANCHES or last[1] == "return"):
+        return None
+    return starts[loop.header]
+
+def is_hoistable(instruction):
+    """
+        pure, and can't go wrong when it is run on a path that would never have run it, so no division or memory reads
+    """
+    operation = instruction[1]
+    if operation in MEMORY_READS and not is_binary(instruction):
+        return False
+    return instruction[0] is None and is_pure(instruction) and operation not in ("/","%")
+
+def loop_instructions(graph,loop,starts):
+    """
+        (position in the code, instruction) for every instruction in the loop, in order
+    """
+    result = []
+    for index in sorted(loop.blocks):
+        for offset, instruction in enumerate(graph.blocks[index].instructions):
+            result.append((starts[index]+offset,instruction))
+    return result
+
+def definitions_in(instructions):
+    defined = defaultdict(list)
+    for position, instruction in instructions:
+        for name in names_defined(instruction):
+            defined[name].append(position)
+    return defined
+
+def move_to(code,removed,inserted):
+    """
+        the code with the instructions at the positions in removed taken out,
+        and the instructions in inserted[position] put in just before position
+    """
+    result = []
+    for index, instruction in enumerate(code):
+        if index in inserted:
+            result.extend(inserted[index])
+        if index not in removed:
+            result.append(instruction)
+    result.extend(inserted.get(len(code),()))
+    return result
+
+class TemporaryMaker(object):
+    """
+        makes up temporary names that aren't already in a function's scope, the way genLabel would
+    """
+    def __init__(self,scope):
+        self.scope = scope
+        numbers = [int(name[len(TEMPORARY_PREFIX):]) for name in scope if is_temporary(name)]
+        self.next = max(numbers)+1 if numbers else 0
+    def make(self,the_type):
+        name = intern(TEMPORARY_PREFIX+str(self.next))
+        self.next += 1
+        self.scope[name] = the_type
+        return name
+
+class LoopInvariantCodeMotion(object):
+    """
+        Moves instructions whose operands don't change inside a loop out of it, to just before it,
+        so they are run once instead of on every iteration. Only instructions that can't go wrong are moved,
+        since the loop may not have run them at all; and only when their destination is set nowhere else
+        in the loop and nothing can tell the difference: it isn't used in the loop before it is set,
+        and either it isn't used after the loop or the instruction is on every path out of the loop.
+    """
+    name = "loop_invariant_code_motion"
+    def run(self,code,scope):
+        code = list(code)
+        if not may_loop(code):
+            return code
+        visible = local_names(scope) - address_taken(code)
+        while True:
+            graph = ControlFlowGraph(code)
+            dominated_by = dominators(graph)
+            starts = block_starts(graph)
+            live_in = liveness(graph)[0]
+            # loops that don't overlap one that has just changed can all be done off the same analysis;
+            # the ones around it wait for the next time round
+            changed = set()
+            removed = set()
+            inserted = {}
+            for loop in natural_loops(graph,dominated_by):
+                if loop.blocks & changed or loop.header - 1 in changed:
+                    continue
+                position = preheader_position(graph,loop,starts)
+                if position is None:
+                    continue
+                hoisted = self.invariants(graph,loop,starts,visible,dominated_by,live_in)
+                if hoisted:
+                    changed |= loop.blocks
+                    removed.update(where for where, instruction in hoisted)
+                    inserted[position] = [instruction for where, instruction in hoisted]
+            if not inserted:
+                return code
+            code = move_to(code,removed,inserted)
+    def invariants(self,graph,loop,starts,visible,dominated_by,live_in):
+        instructions = loop_instructions(graph,loop,starts)
+        defined = definitions_in(instructions)
+        block_of = {}
+        for index in loop.blocks:
+            for offset in range(len(graph.blocks[index].instructions)):
+                block_of[starts[index]+offset] = index
+        exiting = set(block for block, successor in loop.exits)
+        live_at_exits = set()
+        for block, successor in loop.exits:
+            live_at_exits |= live_in[successor.index]
+        invariant = set()
+        hoisted = []
+        changed = True
+        while changed:
+            changed = False
+            for position, instruction in instructions:
+                if position in invariant or not is_hoistable(instruction):
+                    continue
+                destination = instruction[2]
+                if destination not in visible or len(defined[destination]) != 1 or destination in live_in[loop.header]:
+                    continue
+                if destination in live_at_exits and not all(block_of[position] in dominated_by[block] for block in exiting):
+                    continue
+                operands_ready = True
+                for name in names_used(instruction):
+                    if name not in visible:
+                        operands_ready = False
+                    elif name in defined and not all(where in invariant for where in defined[name]):
+                        operands_ready = False
+                if not operands_ready or destination in names_used(instruction):
+                    continue
+                invariant.add(position)
+                hoisted.append((position,instruction))
+                changed = True
+        return hoisted
+
+def induction_step(instruction,name):
+    """
+        k if the instruction is name = name + k or name = name - k, for a constant k, or else None
+    """
+    label, operation, destination, source1, source2 = instruction
+    if destination != name:
+        return None
+    if operation == "+" and source1 == name and is_constant(source2):
+        return constant_value(source2)
+    if operation == "+" and source2 == name and is_constant(source1):
+        return constant_value(source1)
+    if operation == "-" and source2 == name and is_constant(source1):
+        return -constant_value(source1)
+    return None
+
+class StrengthReduction(object):
+    """
+        Replaces t = i * c inside a loop, where i only ever changes in the loop by adding or subtracting a constant
+        and c doesn't change at all, by a new temporary that starts out as i * c before the loop
+        and has k * c added to it wherever k is added to i. The multiplication on every iteration becomes an addition.
+        Only multiplications are done: an i * i would take more than one addition to keep up with.
+        A constant k * c wraps to the size of t, which takes symbol_table to know; without it, t is taken to be an int.
+    """
+    name = "strength_reduction"
+    symbol_table = None
+    def run(self,code,scope):
+        code = list(code)
+        if not may_loop(code):
+            return code
+        visible = local_names(scope) - address_taken(code)
+        maker = None
+        while True:
+            graph = ControlFlowGraph(code)
+            starts = block_starts(graph)
+            for loop in natural_loops(graph):
+                position = preheader_position(graph,loop,starts)
+                if position is None:
+                    continue
+                candidate = self.candidate(graph,loop,starts,visible,code,scope)
+                if candidate is None:
+                    continue
+                if maker is None:
+                    maker = TemporaryMaker(scope)
+                code = self.reduce(code,position,candidate,scope,maker)
+                break
+            else:
+                return code
+    def candidate(self,graph,loop,starts,visible,code,scope):
+        instructions = loop_instructions(graph,loop,starts)
+        defined = definitions_in(instructions)
+        steps = {}
+        for name, positions in defined.items():
+            if name in visible and type_of(scope,name) in WORD_TYPES:
+                found = [induction_step(code[position],name) for position in positions]
+                if None not in found:
+                    steps[name] = zip(positions,found)
+        for position, instruction in instructions:
+            label, operation, destination, source1, source2 = instruction
+            if operation != "*" or label is not None or destination not in visible:
+                continue
+            if len(defined[destination]) != 1 or destination in (source1,source2):
+                continue
+            for variable, factor in ((source1,source2),(source2,source1)):
+                if variable not in steps or type_of(scope,destination) != type_of(scope,variable):
+                    continue
+                if is_constant(factor) or (factor in visible and factor not in defined and type_of(scope,factor) == type_of(scope,variable)):
+                    return (instruction,position,variable,factor,steps[variable])
+        return None
+    def reduce(self,code,position,candidate,scope,maker):
+        instruction, where, variable, factor, increments = candidate
+        label, operation, destination, source1, source2 = instruction
+        the_type = scope[destination]
+        running = maker.make(the_type)
+        preheader = [(None,"*",running,factor,variable)]
+        step_of = {}
+        for step in set(step for increment, step in increments):
+            if is_constant(factor):
+                step_of[step] = str(wrap(step*constant_value(factor),size_of(destination,scope,self.symbol_table)))
+            else:
+                step_of[step] = maker.make(the_type)
+                preheader.append((None,"*",step_of[step],factor,str(step)))
+        after = dict((increment,step_of[step]) for increment, step in increments)
+        result = []
+        for index, current in enumerate(code):
+            if index == position:
+                result.extend(preheader)
+            if index == where:
+                result.append((label,"=",destination,running,""))
+            else:
+                result.append(current)
+            if index in after:
+                result.append((None,"+",running,after[index],running))
+        return result
+
+class LoopRotation(object):
+    """
+        Turns the loops visit_For and visit_While make, which test the condition at the top,
+        branch into the body when it holds, fall out to an unconditional_branch past the loop when it doesn't,
+        and jump back to the top at the end of the body:
+
+            top: condition; conditional_branch body; unconditional_branch bottom; body: ...; unconditional_branch top; bottom:
+
+        into loops that jump to the test once and then test at the bottom, branching back while it holds:
+
+            unconditional_branch top; body: ...; top: condition; conditional_branch body; bottom:
+
+        which runs one branch per iteration instead of two.
+    """
+    name = "loop_rotation"
+    def run(self,code,scope):
+        code = list(code)
+        while True:
+            rotated = self.rotate_one(code)
+            if rotated is None:
+                return code
+            code = rotated
+    def rotate_one(self,code):
+        label_at = dict((instruction[0],index) for index, instruction in enumerate(code) if instruction[0] is not None)
+        for top, instruction in enumerate(code):
+            if instruction[0] is None or instruction[1] != "":
+                continue
+            # the condition: straight-line code up to a conditional_branch followed by an unconditional_branch
+            index = top + 1
+            while index < len(code) and code[index][0] is None and code[index][1] not in BRANCHES \
+                    and code[index][1] not in ("","return"):
+                index += 1
+            if index + 2 >= len(code):
+                continue
+            branch, leave, body = code[index], code[index+1], code[index+2]
+            if branch[1] != "conditional_branch" or branch[0] is not None:
+                continue
+            if leave[1] != "unconditional_branch" or leave[0] is not None or body[0] != branch[2] or body[1] != "":
+                continue
+            bottom = label_at.get(leave[2])
+            if bottom is None or bottom <= index + 2 or code[bottom][1] != "":
+                continue
+            back = code[bottom-1]
+            if back[1] != "unconditional_branch" or back[2] != instruction[0] or back[0] is not None:
+                continue
+            return (code[:top] + [(None,"unconditional_branch",instruction[0],"","")] + code[index+2:bottom-1] +
+                    code[top:index+1] + code[bottom:])
+        return None
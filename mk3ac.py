@@ -1,32 +1,37 @@
 import pycparser # the C parser written in Python
 import sys # so we can access command-line args
+import argparse # so we can parse command-line options
+import os
+import contextlib
 import pprint # so we can pretty-print our output
 
 import mksymtab
+from ir import InstructionList, printable, TEMPORARY_PREFIX
 
-from compiler_utilities import TagStack
+from compiler_utilities import TagStack, Traversal, show
 
 import itertools
-
-label_generator = itertools.count()
+import multiprocessing
 
 class Label(object):
     def __init__(self,**kwargs):
         self.kwargs = kwargs
-    pass
+    def __repr__(self):
+        return "Label(%s)" % ", ".join("%s=%r" % item for item in sorted(self.kwargs.items()))
 
-class CodeBuilder(pycparser.c_ast.NodeVisitor):
+class CodeBuilder(Traversal):
     def __init__(self,function_name,symbol_table):
-        self.the_code = []
+        self.the_code = InstructionList()
         self.the_symbol_table = symbol_table
         self.the_function_name = function_name
         self.expression_stack = []
         self.state = TagStack()
+        self.label_generator = itertools.count()
     def add(self,operation,destination,source1,source2,label=None):
-        self.the_code.append((label,operation,destination,source1,source2))
+        self.the_code.emit(label,operation,destination,source1,source2)
     def genLabel(self,label_type,scope):
-        # do stuff here with symbol table
-        the_label = "L"+str(label_generator.next())
+        # labels only have to be unique within the function, so that functions can be compiled independently
+        the_label = intern(TEMPORARY_PREFIX+str(self.label_generator.next()))
         self.the_symbol_table.values[the_label] = label_type
         return the_label
     def start_visit(self,node):
@@ -35,27 +40,35 @@ class CodeBuilder(pycparser.c_ast.NodeVisitor):
         del self.the_symbol_table.values.path[-1]
         assert(0 == len(self.the_symbol_table.values.path))
     def visit_Compound(self,node):
-        self.generic_visit(node)
+        for child in node:
+            yield child
         self.expression_stack.append("")
     def visit_Assignment(self,node):
-        children = dict(node.children())
-        lvalue, rvalue = children["lvalue"], children["rvalue"]
         with self.state.push("lvalue"):
-            self.visit(lvalue)
-        self.visit(rvalue)
+            yield node.lvalue
+        with self.state.unpush("lvalue"):
+            yield node.rvalue
         rvalue = self.expression_stack.pop()
         lvalue = self.expression_stack.pop()
-        self.add("=",lvalue,rvalue,"")
-        self.expression_stack.append(lvalue)
+        if isinstance(node.lvalue,pycparser.c_ast.ID):
+            self.add("=",lvalue,rvalue,"")
+            self.expression_stack.append(lvalue)
+        elif isinstance(node.lvalue,pycparser.c_ast.StructRef) or \
+                isinstance(node.lvalue,pycparser.c_ast.UnaryOp) and node.lvalue.op == "*":
+            self.add("store","",rvalue,lvalue) # what an lvalue like these leaves on the stack is the address
+            self.expression_stack.append(rvalue)
+        else: assert(False) # nothing else can be assigned to yet
     def visit_ID(self,node):
         self.expression_stack.append(node.name)
     def visit_Constant(self,node):
         self.expression_stack.append(node.value)
     def visit_Return(self,node):
-        self.generic_visit(node)
+        for child in node:
+            yield child
         self.add("return",self.expression_stack.pop(),"","")
     def visit_BinaryOp(self,node):
-        self.generic_visit(node)
+        yield node.left
+        yield node.right
         operand1 = self.expression_stack.pop()
         operand2 = self.expression_stack.pop()
         assert(self.the_symbol_table.typeof(operand1) == self.the_symbol_table.typeof(operand2))
@@ -65,39 +78,51 @@ class CodeBuilder(pycparser.c_ast.NodeVisitor):
     def visit_UnaryOp(self,node):
         if node.op == "&":
             with self.state.push("lvalue"):
-                self.generic_visit(node)
-            return
+                yield node.expr
+            if isinstance(node.expr,pycparser.c_ast.ID):
+                operand1 = self.expression_stack.pop()
+                destination = self.genLabel(('',self.the_symbol_table.typeof(operand1)),"local")
+                self.add("&",destination,operand1,"")
+                self.expression_stack.append(destination)
+            return # otherwise the lvalue left its address
         else:
             with self.state.unpush("lvalue"):
-                self.generic_visit(node)
+                yield node.expr
         operand1 = self.expression_stack.pop()
+        if node.op == "*" and "lvalue" in self.state:
+            self.expression_stack.append(operand1) # the address to store to
+            return
         the_type = self.the_symbol_table.typeof(operand1)
         # if the_type is & or * then handle differently
         if node.op == "*":
             assert(isinstance(the_type,tuple))
             dim, ptr_type = the_type
             the_type = ptr_type
-        elif node.op == "&":
-            the_type = ('',the_type)
         destination = self.genLabel(the_type,"local")
         if node.op == "p++":
             self.add("+",operand1,operand1,1)
             self.expression_stack.append(operand1)
         else:
-            if "lvalue" in self.state and node.op == "*":
-                pass
-            else:
-                self.add(node.op,destination,operand1,"")
-        if "lvalue" in self.state:
-            if node.op == "*":
-                self.expression_stack.append(operand1)
-            else:
-                self.expression_stack.append(destination)
-        else:
+            self.add(node.op,destination,operand1,"")
             self.expression_stack.append(destination)
+    def visit_FuncCall(self,node):
+        assert(isinstance(node.name,pycparser.c_ast.ID)) # no calls through pointers
+        arguments = node.args.exprs if node.args is not None else []
+        with self.state.unpush("lvalue"):
+            for argument in arguments:
+                yield argument
+        values = self.expression_stack[len(self.expression_stack)-len(arguments):]
+        del self.expression_stack[len(self.expression_stack)-len(arguments):]
+        # every argument is worked out before the first param, so the params stay right before the call
+        for value in values:
+            self.add("param","",value,"")
+        destination = self.genLabel(self.the_symbol_table.return_type_of(node.name.name),"local")
+        self.add("call",destination,node.name.name,len(arguments))
+        self.expression_stack.append(destination)
     def visit_StructRef(self,node):
         StructRef_type = node.type
-        self.visit(dict(node.children())["name"])
+        with self.state.unpush("lvalue"):
+            yield node.name # the struct's address, or a pointer to it, either way
         if StructRef_type == "->":
             operand1 = self.expression_stack.pop()
             the_type = self.the_symbol_table.typeof(operand1)
@@ -109,34 +134,36 @@ class CodeBuilder(pycparser.c_ast.NodeVisitor):
             self.expression_stack.append(destination)
         if StructRef_type in [".","->"]:
             the_struct = self.expression_stack.pop()
-            self.visit(dict(node.children())["field"])
+            yield node.field
             the_field = self.expression_stack.pop()
             the_struct_type = self.the_symbol_table.typeof(the_struct)
-            offset, the_element_type = dict(self.the_symbol_table.offsets_and_types_of_elements(the_struct_type))[the_field]
-            pprint.pprint(offset)
-            pprint.pprint(the_element_type)
-            destination = self.genLabel(the_element_type,"local")
+            offset, the_element_type = self.the_symbol_table.field(the_struct_type,the_field)
             if "lvalue" in self.state:
+                destination = self.genLabel(('',the_element_type),"local")
                 self.add("+",destination,the_struct,offset)
                 self.expression_stack.append(destination)
             else:
+                destination = self.genLabel(the_element_type,"local")
                 self.add("load",destination,the_struct,offset)
                 self.expression_stack.append(destination)
             #assert(False)
         else: assert(False)
     def visit_For(self,node):
         init, cond, next, stmt = node.init, node.cond, node.next, node.stmt
-        self.visit(init)
+        yield init
         junk = self.expression_stack.pop()        
         top_of_loop = self.genLabel(Label(),"local")
         bottom_of_loop = self.genLabel(Label(),"local")
+        body_of_loop = self.genLabel(Label(),"local")
         self.add("","","","",label=top_of_loop)
-        self.visit(cond)
+        yield cond
         conditional = self.expression_stack.pop()
-        self.add("conditional_branch",bottom_of_loop,conditional,"")
-        self.visit(stmt)
+        self.add("conditional_branch",body_of_loop,conditional,"")
+        self.add("unconditional_branch",bottom_of_loop,"","")
+        self.add("","","","",label=body_of_loop)
+        yield stmt
         junk = self.expression_stack.pop()        
-        self.visit(next)
+        yield next
         junk = self.expression_stack.pop()
         self.add("unconditional_branch",top_of_loop,"","")
         self.add("","","","",label=bottom_of_loop)
@@ -144,11 +171,14 @@ class CodeBuilder(pycparser.c_ast.NodeVisitor):
         cond, stmt = node.cond, node.stmt        
         top_of_loop = self.genLabel(Label(),"local")
         bottom_of_loop = self.genLabel(Label(),"local")
+        body_of_loop = self.genLabel(Label(),"local")
         self.add("","","","",label=top_of_loop)
-        self.visit(cond)
+        yield cond
         conditional = self.expression_stack.pop()
-        self.add("conditional_branch",bottom_of_loop,conditional,"")
-        self.visit(stmt)
+        self.add("conditional_branch",body_of_loop,conditional,"")
+        self.add("unconditional_branch",bottom_of_loop,"","")
+        self.add("","","","",label=body_of_loop)
+        yield stmt
         junk = self.expression_stack.pop()        
         self.add("unconditional_branch",top_of_loop,"","")
         self.add("","","","",label=bottom_of_loop)
@@ -157,28 +187,83 @@ class CodeBuilder(pycparser.c_ast.NodeVisitor):
         then_part = self.genLabel(Label(),"local")
         else_part = self.genLabel(Label(),"local")
         end_part = self.genLabel(Label(),"local")
-        self.visit(cond)
+        yield cond
         conditional = self.expression_stack.pop()
         self.add("conditional_branch",then_part,conditional,"")
         self.add("unconditional_branch",else_part,"","")
         self.add("","","","",label=then_part)        
-        self.visit(iftrue)
+        yield iftrue
         junk = self.expression_stack.pop()        
         self.add("unconditional_branch",end_part,"","")
         self.add("","","","",label=else_part)                
         if iffalse is not None:
-            self.visit(iffalse)
+            yield iffalse
             junk = self.expression_stack.pop()        
         self.add("","","","",label=end_part)
     
         
         
 
-if __name__ == "__main__":
-    if len(sys.argv) > 1:    # optionally support passing in some code as a command-line argument
-        code_to_parse = sys.argv[1]
-    else: # this can not handle the typedef and struct below correctly. Need to work on it.
-        code_to_parse = """
+def generate_function(function_name,symbol_table,profiler=None):
+    """
+        generates the 3AC for one function, whose "{}" entry still holds its body,
+        and returns it without storing it in the symbol table
+    """
+    body = symbol_table.values.values[function_name]["{}"]
+    cb = CodeBuilder(function_name,symbol_table)
+    if profiler is not None:
+        profiler.instrument(cb)
+    cb.start_visit(body)
+    return cb.the_code
+
+worker_symbol_table = None
+
+def start_worker(symbol_table):
+    global worker_symbol_table
+    worker_symbol_table = symbol_table
+
+def generate_function_in_worker(function_name):
+    """
+        runs in a worker process, against that process's own copy of the symbol table.
+        Returns the code along with whatever genLabel added to the function's scope,
+        so that the parent can merge both back into its own symbol table.
+    """
+    scope = worker_symbol_table.values.values[function_name]
+    before = dict(scope)
+    the_code = generate_function(function_name,worker_symbol_table)
+    added = dict((name,value) for name, value in scope.items() if name not in before or before[name] is not value)
+    return (function_name,the_code,added)
+
+def generate_code(symbol_table,jobs=1,function_names=None,profiler=None):
+    """
+        replaces the body stored under "{}" in every function's scope (or just the named ones) with its 3AC.
+        With more than one job the functions are compiled in a pool of worker processes,
+        each of which starts from a snapshot of the symbol table. Every function numbers its
+        own labels from zero, so the result is the same as compiling them one at a time.
+        Profiling only sees this process, so a profiled compile is always done one function at a time.
+        Functions that already have their 3AC, which is all of them once a lazy table's functions()
+        has been through them, are left alone.
+    """
+    if function_names is None:
+        function_names = [name for name, value in symbol_table.functions()]
+    function_names = [name for name in function_names
+                      if isinstance(symbol_table.values.values[name]["{}"],pycparser.c_ast.Node)]
+    if jobs <= 1 or len(function_names) <= 1 or profiler is not None:
+        for name in function_names:
+            symbol_table.values.values[name]["{}"] = generate_function(name,symbol_table,profiler)
+        return
+    pool = multiprocessing.Pool(min(jobs,len(function_names)),start_worker,(symbol_table,))
+    try:
+        results = pool.map(generate_function_in_worker,function_names)
+    finally:
+        pool.close()
+        pool.join()
+    for name, the_code, added in results:
+        scope = symbol_table.values.values[name]
+        scope.update(added)
+        scope["{}"] = the_code
+
+SAMPLE_CODE = """
 int foo(int a, int b) {
     if (a == b) {
         return 1;
@@ -212,20 +297,162 @@ int sum_of_squares(int x) {
     return result;
 };
 """
-    cparser = pycparser.c_parser.CParser()
-    parsed_code = cparser.parse(code_to_parse)
-    parsed_code.show()
-    st = mksymtab.makeSymbolTable(parsed_code)
-    #pprint.pprint(st.values.values)
-    #pprint.pprint(st.types.values)
+
+TABLE_DIRECTORY = os.environ.get("MK3AC_TABLES",os.path.join(os.path.expanduser("~"),".cache","mk3ac"))
+
+def new_parser(parser_class=pycparser.c_parser.CParser):
+    """
+        a CParser (or a subclass of it), built from the lexer and parser tables that come with pycparser
+        if they are there, or else from tables that PLY writes into TABLE_DIRECTORY the first time and imports after that
+    """
+    try:
+        __import__("pycparser.lextab")
+        __import__("pycparser.yacctab")
+        return parser_class()
+    except ImportError:
+        pass
+    if not os.path.isdir(TABLE_DIRECTORY):
+        os.makedirs(TABLE_DIRECTORY)
+    if TABLE_DIRECTORY not in sys.path:
+        sys.path.insert(0,TABLE_DIRECTORY)
+    return parser_class(lextab="mk3ac_lextab",yacctab="mk3ac_yacctab",taboutputdir=TABLE_DIRECTORY)
+
+@contextlib.contextmanager
+def no_phase(name):
+    yield
+
+def optimize_symbol_table(symbol_table,disabled_passes=(),function_names=None):
+    """
+        runs the optimization passes, all but the ones named in disabled_passes,
+        over the 3AC of function_names, or of every function in the table
+    """
+    import optimize as optimization
+    pass_manager = optimization.PassManager()
+    for name in disabled_passes:
+        pass_manager.disable(name)
+    pass_manager.run_on_symbol_table(symbol_table,function_names)
+
+def compile_code(code_to_parse,cparser,out,jobs=1,optimize=False,disabled_passes=(),profiler=None,function_names=None,
+                 reorder_fields=False,layout_report=False):
+    """
+        what the command line does, given a parser to reuse: writes the parse tree,
+        each function's body and then the symbol table with the 3AC in it to out.
+        Given function_names, it only builds and writes the scopes of those functions.
+        With layout_report, it writes how every struct is laid out after that.
+    """
+    phase = profiler.phase if profiler is not None else no_phase
+    with phase("parse"):
+        parsed_code = cparser.parse(code_to_parse)
+    if function_names:
+        with phase("symbol_table"):
+            st = mksymtab.makeSymbolTable(parsed_code,profiler,lazy=True,reorder_fields=reorder_fields,generator=generate_function)
+        del parsed_code # the table keeps the functions it hasn't built yet, and nothing else
+        with phase("codegen"):
+            scopes = dict((name,st.function(name)) for name in function_names)
+        if optimize:
+            with phase("optimize"):
+                optimize_symbol_table(st,disabled_passes,function_names)
+        pprint.pprint(printable(scopes),out)
+        if layout_report:
+            pprint.pprint(st.layout_reports(),out)
+        return st
+    show(parsed_code,out)
+    with phase("symbol_table"):
+        st = mksymtab.makeSymbolTable(parsed_code,profiler,reorder_fields=reorder_fields,generator=generate_function)
     functions = (dict(st.functions()))
-    #pprint.pprint(st.values.path)
     for key,value in functions.items():
-        print key
+        out.write(key+"\n")
         body = value["{}"]
-        body.show()
-        cb = CodeBuilder(key,st)
-        cb.start_visit(body)
-        value["{}"] = cb.the_code
-    pprint.pprint(st.values.values)
-    
\ No newline at end of file
+        show(body,out)
+    with phase("codegen"):
+        generate_code(st,jobs,profiler=profiler)
+    if optimize:
+        with phase("optimize"):
+            optimize_symbol_table(st,disabled_passes)
+    pprint.pprint(printable(st.values.values),out)
+    if layout_report:
+        pprint.pprint(st.layout_reports(),out)
+    return st
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="generate 3AC for some C code")
+    argument_parser.add_argument("code",nargs="?",help="the code to compile, instead of the built-in sample")
+    argument_parser.add_argument("-j","--jobs",type=int,default=1,help="compile the functions in this many worker processes")
+    argument_parser.add_argument("--cache",metavar="DIRECTORY",help="reuse the parse and the 3AC of unchanged functions from this cache")
+    argument_parser.add_argument("--cache-size",type=int,default=256,metavar="MEGABYTES",help="how big the cache may grow before old entries are evicted")
+    argument_parser.add_argument("--profile",metavar="FILE",help="write a JSON report of where the compile spent its time here (- for standard error)")
+    argument_parser.add_argument("-O","--optimize",action="store_true",help="run the optimization passes over the generated code")
+    argument_parser.add_argument("--disable-pass",action="append",default=[],metavar="PASS",help="leave this optimization pass out")
+    argument_parser.add_argument("--function",action="append",default=[],metavar="NAME",help="only compile this function, and only print its scope")
+    argument_parser.add_argument("--reorder-fields",action="store_true",help="lay struct fields out to waste as little as possible on padding")
+    argument_parser.add_argument("--layout-report",action="store_true",help="also print each struct's padding and the fields that straddle a cache line")
+    argument_parser.add_argument("--stream",action="store_true",help="compile and print one function at a time, holding on to as little as possible")
+    argument_parser.add_argument("--pch",metavar="DIRECTORY",help="preprocess the code, keeping what its leading #includes declare in this cache")
+    argument_parser.add_argument("-I",action="append",default=[],dest="include_directories",metavar="DIRECTORY",help="with --pch, where the preprocessor looks for headers")
+    argument_parser.add_argument("-D",action="append",default=[],dest="macros",metavar="MACRO",help="with --pch, a macro to define for the preprocessor")
+    argument_parser.add_argument("--binary",metavar="FILE",help="also write the symbol table and 3AC to FILE, in the format binary_format.py reads")
+    arguments = argument_parser.parse_args()
+    if arguments.code is not None:    # optionally support passing in some code as a command-line argument
+        code_to_parse = arguments.code
+    else: # this can not handle the typedef and struct below correctly. Need to work on it.
+        code_to_parse = SAMPLE_CODE
+    if arguments.stream:
+        if arguments.binary is not None or arguments.profile is not None or arguments.function or arguments.jobs != 1 or \
+                arguments.layout_report or arguments.cache is not None or arguments.pch is not None:
+            argument_parser.error("--stream can not be used with --binary, --profile, --function, --jobs, --layout-report, --cache or --pch")
+        import streaming
+        streaming.compile_streaming(code_to_parse,new_parser(streaming.IncrementalCParser),sys.stdout,
+                                    arguments.optimize,arguments.disable_pass,arguments.reorder_fields)
+        sys.exit(0)
+    if arguments.pch is not None:
+        if arguments.profile is not None or arguments.function:
+            argument_parser.error("--pch can not be used with --profile or --function")
+        import compile_cache
+        import pch
+        cache = compile_cache.CompileCache(arguments.pch,arguments.cache_size*1024*1024)
+        cpp_args = ["-I"+directory for directory in arguments.include_directories]+["-D"+macro for macro in arguments.macros]
+        parsed_code, st = pch.compile_with_header(code_to_parse,cache,cpp_args,reorder_fields=arguments.reorder_fields)
+        generate_code(st,arguments.jobs)
+        if arguments.optimize:
+            optimize_symbol_table(st,arguments.disable_pass)
+        pprint.pprint(printable(st.values.values))
+        if arguments.layout_report:
+            pprint.pprint(st.layout_reports())
+        if arguments.binary is not None:
+            import binary_format
+            binary_format.write_file(st,arguments.binary)
+        sys.exit(0)
+    if arguments.cache is not None:
+        if arguments.profile is not None or arguments.function:
+            argument_parser.error("--cache can not be used with --profile or --function")
+        import compile_cache
+        cache = compile_cache.CompileCache(arguments.cache,arguments.cache_size*1024*1024)
+        parsed_code, st = compile_cache.compile_incrementally(code_to_parse,cache,arguments.jobs,arguments.reorder_fields)
+        if arguments.optimize:
+            optimize_symbol_table(st,arguments.disable_pass) # what is cached is the code from before the passes
+        pprint.pprint(printable(st.values.values))
+        if arguments.layout_report:
+            pprint.pprint(st.layout_reports())
+        if arguments.binary is not None:
+            import binary_format
+            binary_format.write_file(st,arguments.binary)
+        sys.exit(0)
+    profiler = None
+    if arguments.profile is not None:
+        import profiling
+        profiler = profiling.Profiler()
+        with profiler.phase("parser_setup"):
+            cparser = new_parser()
+    else:
+        cparser = new_parser()
+    st = compile_code(code_to_parse,cparser,sys.stdout,arguments.jobs,arguments.optimize,arguments.disable_pass,profiler,arguments.function,
+                      arguments.reorder_fields,arguments.layout_report)
+    if arguments.binary is not None:
+        import binary_format
+        binary_format.write_file(st,arguments.binary)
+    if profiler is not None:
+        if arguments.profile == "-":
+            profiler.write_report(sys.stderr)
+        else:
+            with open(arguments.profile,"w") as report:
+                profiler.write_report(report)
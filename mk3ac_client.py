@@ -0,0 +1,67 @@
+import sys # so we can access command-line args
+import argparse # so we can parse command-line options
+import json # requests and replies are one JSON object per line
+import os
+import socket
+
+# this only talks to compile_server.py, so it must not import pycparser or the compiler
+
+def default_socket_path():
+    return os.environ.get("MK3AC_SOCKET",os.path.join("/tmp","mk3ac-%d.sock" % os.getuid()))
+
+def request_compile(path,request):
+    connection = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+        connection.sendall(json.dumps(request)+"\n")
+        reply = connection.makefile("r").readline()
+    finally:
+        connection.close()
+    if not reply:
+        raise socket.error("the compile server hung up")
+    return json.loads(reply)
+
+def mk3ac_arguments(arguments):
+    """
+        the command line that has mk3ac.py do what the parsed arguments ask the server for,
+        without the options only the client has
+    """
+    command_line = ["--jobs",str(arguments.jobs)]
+    if arguments.optimize:
+        command_line.append("--optimize")
+    for name in arguments.disable_pass:
+        command_line += ["--disable-pass",name]
+    for name in arguments.function:
+        command_line += ["--function",name]
+    if arguments.reorder_fields:
+        command_line.append("--reorder-fields")
+    if arguments.layout_report:
+        command_line.append("--layout-report")
+    if arguments.code is not None:
+        command_line += ["--",arguments.code]
+    return command_line
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="generate 3AC for some C code, using a running compile_server.py")
+    argument_parser.add_argument("code",nargs="?",help="the code to compile, instead of the built-in sample")
+    argument_parser.add_argument("-j","--jobs",type=int,default=1,help="compile the functions in this many worker processes")
+    argument_parser.add_argument("-O","--optimize",action="store_true",help="run the optimization passes over the generated code")
+    argument_parser.add_argument("--disable-pass",action="append",default=[],metavar="PASS",help="leave this optimization pass out")
+    argument_parser.add_argument("--function",action="append",default=[],metavar="NAME",help="only compile this function, and only print its scope")
+    argument_parser.add_argument("--reorder-fields",action="store_true",help="lay struct fields out to waste as little as possible on padding")
+    argument_parser.add_argument("--layout-report",action="store_true",help="also print each struct's padding and the fields that straddle a cache line")
+    argument_parser.add_argument("--socket",default=default_socket_path(),help="where compile_server.py is listening")
+    arguments = argument_parser.parse_args()
+    request = {"code": arguments.code,"jobs": arguments.jobs,"optimize": arguments.optimize,
+               "disable_passes": arguments.disable_pass,"functions": arguments.function,
+               "reorder_fields": arguments.reorder_fields,"layout_report": arguments.layout_report}
+    try:
+        reply = request_compile(arguments.socket,request)
+    except socket.error:
+        # no server, so do the compile here instead, the slow way
+        mk3ac = os.path.join(os.path.dirname(os.path.abspath(__file__)),"mk3ac.py")
+        os.execv(sys.executable,[sys.executable,mk3ac]+mk3ac_arguments(arguments))
+    sys.stdout.write(reply["output"])
+    if "error" in reply:
+        sys.stderr.write(reply["error"])
+    sys.exit(reply["status"])
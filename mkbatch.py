@@ -0,0 +1,189 @@
+import pycparser # the C parser written in Python
+import sys # so we can access command-line args
+import argparse # so we can parse command-line options
+import json # each line of output is a JSON record
+import os
+import time
+import traceback
+import multiprocessing
+import Queue
+
+import mksymtab
+import mk3ac
+
+def find_sources(where):
+    """
+        the C files named by where, which is a .c file, a directory to search,
+        or a manifest listing one path per line (blank lines and # comments are ignored)
+    """
+    if os.path.isdir(where):
+        found = []
+        for directory, subdirectories, files in os.walk(where):
+            subdirectories.sort()
+            for name in sorted(files):
+                if name.endswith(".c"):
+                    found.append(os.path.join(directory,name))
+        return found
+    if where.endswith(".c"):
+        return [where]
+    found = []
+    base = os.path.dirname(where)
+    with open(where) as manifest:
+        for line in manifest:
+            line = line.strip()
+            if line == "" or line.startswith("#"):
+                continue
+            found.append(os.path.join(base,line))
+    return found
+
+def as_json(value):
+    if isinstance(value,(list,tuple)):
+        return [as_json(item) for item in value]
+    if value is None or isinstance(value,(str,unicode,int,long,float,bool)):
+        return value
+    return repr(value)
+
+def compile_file(path):
+    """
+        generates the records for one file: one per function, as soon as its 3AC has been generated,
+        then one saying how the file went. Nothing that goes wrong escapes; it is reported in the last record.
+    """
+    started = time.time()
+    functions = 0
+    try:
+        with open(path) as source:
+            code = source.read()
+        parsed_code = mk3ac.new_parser().parse(code,path)
+        st = mksymtab.makeSymbolTable(parsed_code,generator=mk3ac.generate_function)
+        for name, value in list(st.functions()):
+            the_code = mk3ac.generate_function(name,st)
+            yield {"file": path,
+                   "function": name,
+                   "return": as_json(value.get("return")),
+                   "arguments": as_json(value.get("...",[])),
+                   "code": as_json(list(the_code))}
+            functions += 1
+    except Exception as error:
+        yield {"file": path,
+               "status": "error",
+               "error": "%s: %s" % (error.__class__.__name__,error),
+               "traceback": traceback.format_exc(),
+               "functions": functions,
+               "seconds": time.time() - started}
+        return
+    yield {"file": path, "status": "ok", "functions": functions, "seconds": time.time() - started}
+
+worker_records = None
+worker_pids = None
+
+# how long a file may take in a worker before it is given up on
+DEFAULT_TIMEOUT = 600
+
+def start_worker(records,pids):
+    global worker_records, worker_pids
+    worker_records = records
+    worker_pids = pids
+
+def compile_file_in_worker(index,path):
+    """
+        notes which process is compiling the file before starting, straight into shared memory
+        so that it is there even if the process dies right away, then queues (index, record) for each record
+    """
+    worker_pids[index] = os.getpid()
+    for record in compile_file(path):
+        worker_records.put((index,record))
+
+def is_alive(pid):
+    try:
+        os.kill(pid,0)
+    except OSError:
+        return False
+    return True
+
+def compile_batch(paths,emit,jobs=1,timeout=DEFAULT_TIMEOUT):
+    """
+        compiles every file in paths, calling emit with each record as it is produced.
+        With more than one job, up to that many files are compiled at once in worker processes;
+        a file whose worker dies, or which takes more than timeout seconds, gets a failure record.
+        Returns the number of files that failed.
+    """
+    failures = [0]
+    def report(record):
+        if record.get("status") == "error":
+            failures[0] += 1
+        emit(record)
+    if jobs <= 1:
+        for path in paths:
+            for record in compile_file(path):
+                report(record)
+        return failures[0]
+    records = multiprocessing.Queue()
+    pids = multiprocessing.Array("i",len(paths),lock=False)
+    pool = multiprocessing.Pool(jobs,start_worker,(records,pids))
+    lost = False
+    try:
+        pending = dict((index,(path,pool.apply_async(compile_file_in_worker,(index,path))))
+                       for index, path in enumerate(paths))
+        started = {}
+        while pending:
+            try:
+                index, record = records.get(timeout=0.1)
+            except Queue.Empty:
+                pass
+            else:
+                if index in pending: # a file given up on can still have records its worker had queued
+                    report(record)
+                    if "status" in record:
+                        del pending[index]
+            # checked every time round and not only when the queue is quiet, since other workers'
+            # records could otherwise put off noticing a dead or stuck one for as long as they keep coming
+            now = time.time()
+            for index, (path, result) in pending.items():
+                if pids[index] and index not in started:
+                    started[index] = (pids[index],now)
+                error = None
+                if result.ready() and not result.successful():
+                    try:
+                        result.get()
+                    except Exception as exception:
+                        error = "%s: %s" % (exception.__class__.__name__,exception)
+                elif index in started and not is_alive(started[index][0]):
+                    error = "the worker compiling it died"
+                elif index in started and now - started[index][1] > timeout:
+                    error = "gave up after %s seconds" % timeout
+                if error is not None:
+                    lost = lost or index in started
+                    report({"file": path, "status": "error", "error": error})
+                    del pending[index]
+    finally:
+        if lost:
+            pool.terminate() # the pool would wait forever for what a dead or stuck worker never finished
+        else:
+            pool.close()
+        pool.join()
+    return failures[0]
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="generate 3AC for many C files, as a stream of JSON lines")
+    argument_parser.add_argument("sources",nargs="+",help="C files, directories of C files, or manifests listing C files")
+    argument_parser.add_argument("-j","--jobs",type=int,default=1,help="compile this many files at once")
+    argument_parser.add_argument("-o","--output",help="write the records here instead of to standard output")
+    argument_parser.add_argument("--timeout",type=float,default=DEFAULT_TIMEOUT,metavar="SECONDS",help="with more than one job, give up on a file that takes longer than this")
+    arguments = argument_parser.parse_args()
+    output = open(arguments.output,"w") if arguments.output else sys.stdout
+    def emit(record):
+        output.write(json.dumps(record,sort_keys=True))
+        output.write("\n")
+        output.flush()
+    paths = []
+    failures = 0
+    for where in arguments.sources:
+        try:
+            paths.extend(find_sources(where))
+        except EnvironmentError as error:
+            emit({"file": where, "status": "error", "error": "%s: %s" % (error.__class__.__name__,error)})
+            failures += 1
+    failures += compile_batch(paths,emit,arguments.jobs,arguments.timeout)
+    if output is not sys.stdout:
+        output.close()
+    sys.exit(1 if failures else 0)
@@ -2,35 +2,105 @@ import pycparser # the C parser written in Python
 import sys # so we can access command-line args
 import pprint # so we can pretty-print our output
 
-from compiler_utilities import TagStack
+from compiler_utilities import TagStack, Traversal, show
+from type_registry import TypeRegistry, PRIMITIVE_TYPE_NAMES, CACHE_LINE_SIZE, layout_report
+from ir import is_constant
+
+class ScopePath(list):
+    """
+        The list of scope names, from the root down, that a NestedDict is currently looking at.
+        It behaves like the plain list it replaces, but every change is reported back to the
+        NestedDict so that its chain of open scopes stays in step with the path.
+    """
+    def __init__(self,owner,names=()):
+        list.__init__(self,names)
+        self.owner = owner
+    def append(self,name):
+        list.append(self,name)
+        self.owner.enter_scope(name)
+    def pop(self,index=-1):
+        name = list.pop(self,index)
+        if index == -1:
+            self.owner.leave_scope()
+        else:
+            self.owner.rebuild_scopes()
+        return name
+    def __delitem__(self,index):
+        list.__delitem__(self,index)
+        if index == -1:
+            self.owner.leave_scope()
+        else:
+            self.owner.rebuild_scopes()
+    def __delslice__(self,i,j):
+        list.__delslice__(self,i,j)
+        self.owner.rebuild_scopes()
+    def __setitem__(self,index,name):
+        list.__setitem__(self,index,name)
+        self.owner.rebuild_scopes()
+    def __setslice__(self,i,j,names):
+        list.__setslice__(self,i,j,names)
+        self.owner.rebuild_scopes()
+    def __iadd__(self,names):
+        list.extend(self,names)
+        self.owner.rebuild_scopes()
+        return self
+    def extend(self,names):
+        list.extend(self,names)
+        self.owner.rebuild_scopes()
+    def insert(self,index,name):
+        list.insert(self,index,name)
+        self.owner.rebuild_scopes()
+    def remove(self,name):
+        list.remove(self,name)
+        self.owner.rebuild_scopes()
 
 class NestedDict(object):
+    """
+        A tree of scopes. values is the root scope, and path names the scopes leading from the root
+        to the current one. The scopes along the path are kept on a chain, so the current scope
+        is always scopes[-1] and entering or leaving a scope never walks the tree from the root.
+    """
     def __init__(self):
         self.values = {}
-        self.path = []
+        self.scopes = [self.values]
+        self._path = ScopePath(self)
+    def get_path(self):
+        return self._path
+    def set_path(self,names):
+        self._path = ScopePath(self,names)
+        self.rebuild_scopes()
+    path = property(get_path,set_path)
+    def enter_scope(self,name):
+        self.scopes.append(self.scopes[-1][name])
+    def leave_scope(self):
+        del self.scopes[-1]
+    def rebuild_scopes(self):
+        """
+            only needed when the path is changed in some way other than appending or deleting its last element
+        """
+        current_node = self.values
+        self.scopes = [current_node]
+        for elem in self._path:
+            current_node = current_node[elem]
+            self.scopes.append(current_node)
     def __contains__(self,name):
-        return name in self.current_node()
+        return name in self.scopes[-1]
     def __getitem__(self,name):
         """
             we override [] so that we can access whatever symbols are at the current scope
         """
-        current_node = self.values
-        for elem in self.path:
-            current_node = current_node[elem]
-        return current_node[name]
+        return self.scopes[-1][name]
     def current_node(self):
         """
+            the scope named by path
         """
-        current_node = self.values
-        for elem in self.path:
-            current_node = current_node[elem]
-        return current_node
+        return self.scopes[-1]
     def insert(self,name,value):
-        cn = self.current_node()
+        cn = self.scopes[-1]
         if isinstance(cn,list):
             cn.append((name,value))
         elif isinstance(cn,dict):
-            self[name] = value
+            cn[name] = value
         else:
             assert("should not get here!")
             
@@ -38,10 +108,7 @@ class NestedDict(object):
         """
             we override [] so that we can access/set whatever symbols are at the current scope
         """
-        current_node = self.values
-        for elem in self.path:
-            current_node = current_node[elem]
-        current_node[name] = value
+        self.scopes[-1][name] = value
 
 def normalize_type_name(x):
     if isinstance(x,list):
@@ -51,26 +118,38 @@ def normalize_type_name(x):
             return " ".join(x)
     return x
 def get_type_names(x):
-    the_type = dict(x.children())["type"]
+    the_type = x.type
     if isinstance(the_type,pycparser.c_ast.TypeDecl):
         return normalize_type_name(the_type.declname)
-    result = normalize_type_name(dict(x.children())["type"].names)
+    result = normalize_type_name(the_type.names)
     return result
 def get_type(x):
-    return dict(x.children())["type"]
+    return x.type
+def name_of_type(x):
+    """
+        the name of a struct or of a built-in or typedef'd type, as it is kept in the table
+    """
+    if isinstance(x,pycparser.c_ast.Struct):
+        return "struct "+x.name
+    return normalize_type_name(x.names)
 
-class SymbolTableBuilder(pycparser.c_ast.NodeVisitor):
+class SymbolTableBuilder(Traversal):
     """
-        This subclass of NodeVisitor builds the symbol table.
+        This subclass of Traversal builds the symbol table.
         Still a work-in-progress.
     """
-    def __init__(self):
+    def __init__(self,lazy=False):
         """
             about_to_see_scope_name is used when we encounter something, like a function declaration,
-            that indicates that the next declaration will be the name of a new scope
+            that indicates that the next declaration will be the name of a new scope.
+            When lazy, function bodies are not visited; each FuncDef is kept in unvisited
+            until build_function is asked for it.
         """
         self.values = NestedDict()
 
+        self.lazy = lazy
+        self.unvisited = {}
+
         self.about_to_see_scope_name = False
         
         self.types = NestedDict()
@@ -96,14 +175,14 @@ class SymbolTableBuilder(pycparser.c_ast.NodeVisitor):
                 what["..."] = []
                 what.path.append("...")
                 with self.state.push("visiting_arguments"):
-                    self.generic_visit(node)
-                    d = dict(node.children()[0][1].children())
-                    return_type = d["type"]
+                    for child in node:
+                        yield child
+                    return_type = node.type.type
                 del what.path[-1]
                 if isinstance(return_type,pycparser.c_ast.TypeDecl):
                     what["return"] = get_type_names(return_type)
                 elif isinstance(return_type,pycparser.c_ast.PtrDecl):
-                    ptr_to_what = get_type(dict(return_type.children())["type"])
+                    ptr_to_what = get_type(return_type.type)
                     if isinstance(ptr_to_what,pycparser.c_ast.IdentifierType):
                         ptr_to_what = normalize_type_name(ptr_to_what.names)
                     what["return"] = ('',
@@ -115,23 +194,20 @@ class SymbolTableBuilder(pycparser.c_ast.NodeVisitor):
         elif "visiting_arguments" in self.state:
             the_type = get_type(node)
             if isinstance(the_type,pycparser.c_ast.PtrDecl):
-                the_type = ('',normalize_type_name(dict(dict(the_type.children())["type"].children())["type"].names))
+                the_type = ('',name_of_type(get_type(the_type.type)))
             else:
-                the_type = get_type_names(the_type)
+                the_type = name_of_type(get_type(the_type))
             what.current_node().append((node.name,the_type))
         else:
             the_type = get_type(node)
             if isinstance(the_type,pycparser.c_ast.TypeDecl):
                 what.insert(node.name,get_type_names(the_type))
             elif isinstance(the_type,pycparser.c_ast.ArrayDecl):
-                d = dict(the_type.children())
-                dim = d["dim"]
-                the_type = d["type"]
+                dim = the_type.dim
+                the_type = the_type.type
                 what.insert(node.name,(dim.value,get_type_names(the_type)))
             elif isinstance(the_type,pycparser.c_ast.PtrDecl):
-                d = dict(the_type.children())
-                #dim = d["dim"]
-                the_type = d["type"]
+                the_type = the_type.type
                 
                 the_type = get_type(the_type)
                 if isinstance(the_type,pycparser.c_ast.Struct):
@@ -151,20 +227,37 @@ class SymbolTableBuilder(pycparser.c_ast.NodeVisitor):
             Here we want to have it signal that we're going to be starting a new scope with the next Decl
         """
         self.about_to_see_scope_name = True
-        body = dict(node.children())["body"]
-        self.generic_visit(node)
+        body = node.body
+        if self.lazy:
+            yield node.decl
+            self.unvisited[node.decl.name] = node
+        else:
+            for child in node:
+                yield child
         self.about_to_see_scope_name = False
         self.values["{}"] = body
         del self.values.path[-1]
+    def build_function(self,name):
+        """
+            visits the body of a function that was skipped because this is lazy, filling in its local scope
+        """
+        node = self.unvisited.pop(name)
+        self.values.path.append(name)
+        for child in node:
+            if child is not node.decl:
+                self.visit(child)
+        del self.values.path[-1]
         
     def visit_Struct(self,node):
-        if "visiting_typedef" in self.state:
-            what = self.types
-        else:
-            what = self.values
+        """
+            a struct goes in the scope it is declared in, even inside a typedef, and among the types
+        """
+        what = self.values
         what["struct "+node.name] = []
         what.path.append("struct "+node.name)
-        self.generic_visit(node)
+        with self.state.unpush("visiting_typedef"):
+            for child in node:
+                yield child
         del what.path[-1]
         self.types.values["struct "+node.name] = what["struct "+node.name]
     
@@ -176,7 +269,8 @@ class SymbolTableBuilder(pycparser.c_ast.NodeVisitor):
             self.types[node.name] = {}
             self.types.path.append(node.name)
             with self.state.push("visiting_typedef"):
-                self.generic_visit(node)
+                for child in node:
+                    yield child
             del self.types.path[-1]
             the_type = get_type(get_type(node))
             if isinstance(the_type,pycparser.c_ast.Struct):
@@ -187,69 +281,122 @@ class Identifier(object):
         self.name = name
 
 class SymbolTable(object):
-    def __init__(self,stb):
+    def __init__(self,stb,reorder_fields=False,data_model="ILP32",generator=None):
+        self.builder = stb
+        self.generator = generator
         self.values = stb.values
         self.types = stb.types
+        self.type_registry = TypeRegistry(self.types,reorder_fields,data_model)
+        self.argument_index = {}
+        self.profiler = None
+    def arguments(self):
+        """
+            the arguments of the function whose scope we are in, as a dict from name to type.
+            The dict is only rebuilt when the function's "..." list changes.
+        """
+        scope = self.values.current_node()
+        if not isinstance(scope,dict) or "..." not in scope:
+            return {}
+        the_arguments = scope["..."]
+        entry = self.argument_index.get(id(the_arguments))
+        if entry is None or entry[0] is not the_arguments or entry[1] != len(the_arguments):
+            entry = (the_arguments,len(the_arguments),dict(the_arguments))
+            self.argument_index[id(the_arguments)] = entry
+        return entry[2]
     def typeof(self,of_what):
-        if of_what in ["int", "char", "unsigned char", "signed char", "short", "unsigned short", "signed short", "long", "unsigned long", "signed long"]:
+        if of_what in PRIMITIVE_TYPE_NAMES:
             return of_what
         elif of_what in self.types:
             return self.types[of_what]
         elif of_what in self.values:
             return self.values[of_what]
-        elif of_what in dict(self.values["..."]):
-            args_dict = dict(self.values["..."])
-            return args_dict[of_what]
+        arguments = self.arguments()
+        if of_what in arguments:
+            return arguments[of_what]
+        elif isinstance(self.values.values.get(of_what),(str,tuple)):
+            return self.values.values[of_what] # a global, seen from inside a function
+        elif is_constant(of_what):
+            return "int"
         else:
             assert(isinstance(of_what,str))
             return Identifier(of_what)
+    def type_of_description(self,of_what):
+        """
+            the interned type for a type description, or for the type of a variable in the current scope
+        """
+        try:
+            return self.type_registry.get(of_what)
+        except KeyError:
+            pass
+        if isinstance(of_what,str) and of_what in self.values:
+            return self.type_registry.get(self.values[of_what])
+        raise KeyError(of_what)
     def sizeof(self,of_what):
-        if of_what == "int":
-            return 4
-        if of_what in ["char", "unsigned char", "signed char"]:
-            return 1
-        if of_what in ["short", "unsigned short", "signed short"]:
-            return 2
-        if of_what in ["long", "unsigned long", "signed long"]:
-            return 4
-        elif isinstance(of_what,list):
-            the_struct = of_what
-            offset = 0
-            for item_name, item_type in the_struct:
-                the_size = self.sizeof(item_type)
-                padding = offset%the_size
-                offset = offset + padding
-                offset = offset + the_size
-            return offset
-        elif isinstance(of_what,tuple):
-            dim, of_what = of_what
-            if dim == '':
-                return 4
-            else:
-                return int(dim) * self.sizeof(of_what)
-        elif of_what in self.types:
-            the_type = self.types[of_what]
-            return self.sizeof(the_type)
-        elif of_what in self.values:
-            the_type = self.values[of_what]
-            return self.sizeof(the_type)            
-        else:
+        try:
+            return self.type_of_description(of_what).size
+        except KeyError:
             print "name is "+str(of_what)
             assert(False)
+    def alignof(self,of_what):
+        return self.type_of_description(of_what).alignment
     def offsets_and_types_of_elements(self,which_struct):
-        while isinstance(which_struct,str):
-            which_struct = self.types[which_struct]
-        the_struct = which_struct
-        offset = 0
-        for item_name, item_type in the_struct:
-            the_size = self.sizeof(item_type)
-            padding = offset%the_size
-            offset = offset + padding
-            yield (item_name,(offset,item_type))
-            offset = offset + the_size
+        return iter(self.type_registry.get(which_struct).elements)
+    def field(self,which_struct,field_name):
+        """
+            (offset, type) of one field of a struct
+        """
+        return self.type_registry.get(which_struct).offsets[field_name]
+    def layout_reports(self,line_size=CACHE_LINE_SIZE):
+        """
+            struct name -> layout_report for every struct that has been defined
+        """
+        return dict((name,layout_report(self.type_registry.get(name),line_size)) for name, value in self.types.values.items()
+                    if name.startswith("struct ") and isinstance(value,list))
+    def function(self,name):
+        """
+            the scope of one function, with its 3AC under "{}", generating it first if that
+            hasn't been done yet (and in a lazy table, building the function's local scope first too).
+            The 3AC is generated by calling the table's generator with the name, the table and its profiler,
+            which is how mk3ac.generate_function gets passed in.
+        """
+        scope = self.values.values[name]
+        if name in self.builder.unvisited:
+            self.builder.build_function(name)
+        assert("{}" in scope) # not released
+        if isinstance(scope["{}"],pycparser.c_ast.Node):
+            assert(self.generator is not None) # nothing to generate the 3AC with
+            scope["{}"] = self.generator(name,self,self.profiler)
+        return scope
+    def return_type_of(self,name):
+        """
+            what a call to name gives back: what its scope says if it has one, what its prototype says
+            if it has only been declared, and int, as C89 would have it, if it hasn't been declared at all
+        """
+        value = self.values.values.get(name)
+        if isinstance(value,dict):
+            return value.get("return")
+        if isinstance(value,pycparser.c_ast.FuncDecl):
+            return_type = value.type
+            if isinstance(return_type,pycparser.c_ast.PtrDecl) and isinstance(get_type(return_type.type),pycparser.c_ast.IdentifierType):
+                return ('',normalize_type_name(get_type(return_type.type).names))
+            if isinstance(return_type,pycparser.c_ast.TypeDecl) and isinstance(return_type.type,pycparser.c_ast.IdentifierType):
+                return normalize_type_name(return_type.type.names)
+        return "int"
+    def release(self,name):
+        """
+            forgets a function's locals, temporaries and 3AC once they have been used,
+            keeping only what a call to it needs: its arguments and what it returns
+        """
+        scope = self.values.values[name]
+        self.values.values[name] = {"...": scope["..."],"return": scope.get("return")}
     def functions(self):
+        """
+            every function's scope; in a lazy table, each function's 3AC is generated as the function is reached
+        """
         for key, value in self.values.values.items():
         	if isinstance(value,dict):
+        		if key in self.builder.unvisited:
+        			value = self.function(key)
         		yield (key,value)
     def resolve(self,name):
         if len(self.values.path) == 0:            
@@ -258,15 +405,31 @@ class SymbolTable(object):
             return False
         elif name in self.values:
             return "local"
-        elif name in dict(self.values["..."]):
+        elif name in self.arguments():
             return "argument"
         return False
             
 
-def makeSymbolTable(parsed_code):
-    dv = SymbolTableBuilder()
+def makeSymbolTable(parsed_code,profiler=None,lazy=False,reorder_fields=False,data_model="ILP32",generator=None):
+    """
+        A lazy table only looks at globals, typedefs, structs and function signatures to begin with.
+        A function's locals and its 3AC are only worked out when it is asked for through
+        SymbolTable.function or SymbolTable.functions, so the cost follows what is asked for.
+        With reorder_fields, struct fields are laid out to waste as little as possible on padding.
+        data_model says how big pointers and longs are, as in type_registry.DATA_MODELS.
+        generator is what SymbolTable.function generates a function's 3AC with.
+    """
+    dv = SymbolTableBuilder(lazy)
+    if profiler is not None:
+        profiler.instrument(dv)
+        profiler.instrument_nested_dict(dv.values,"values")
+        profiler.instrument_nested_dict(dv.types,"types")
     dv.visit(parsed_code)
-    return SymbolTable(dv)
+    st = SymbolTable(dv,reorder_fields,data_model,generator)
+    st.profiler = profiler
+    if profiler is not None:
+        profiler.instrument_symbol_table(st)
+    return st
             
 
 if __name__ == "__main__":
@@ -318,7 +481,7 @@ signed long i;
 
     cparser = pycparser.c_parser.CParser()
     parsed_code = cparser.parse(code_to_parse)
-    parsed_code.show()
+    show(parsed_code)
     dv = SymbolTableBuilder()
     dv.visit(parsed_code)
     st = SymbolTable(dv)
@@ -0,0 +1,317 @@
+from collections import defaultdict
+
+from ir import InstructionList, is_constant, constant_value, is_name, is_temporary, is_binary, is_unary, \
+    wrap, size_of, is_pure, names_used, names_defined, address_taken, local_names, \
+    BINARY_OPERATIONS, UNARY_OPERATIONS, INCREMENT_OPERATIONS, MEMORY_READS, BRANCHES
+from cfg import TemporaryReuse, ControlFlowCleanup
+from value_numbering import ValueNumbering
+from loops import LoopInvariantCodeMotion, StrengthReduction, LoopRotation
+from inline import Inlining
+
+def divide(left,right):
+    quotient = abs(left) // abs(right)
+    if (left < 0) != (right < 0):
+        quotient = -quotient
+    return quotient
+
+FOLDERS = {
+    "+": lambda left, right: left + right,
+    "-": lambda left, right: left - right,
+    "*": lambda left, right: left * right,
+    "/": lambda left, right: divide(left,right) if right != 0 else None,
+    "%": lambda left, right: left - right * divide(left,right) if right != 0 else None,
+    "==": lambda left, right: int(left == right),
+    "!=": lambda left, right: int(left != right),
+    "<": lambda left, right: int(left < right),
+    "<=": lambda left, right: int(left <= right),
+    ">": lambda left, right: int(left > right),
+    ">=": lambda left, right: int(left >= right),
+    "&&": lambda left, right: int(bool(left) and bool(right)),
+    "||": lambda left, right: int(bool(left) or bool(right)),
+    "&": lambda left, right: left & right,
+    "|": lambda left, right: left | right,
+    "^": lambda left, right: left ^ right,
+    "<<": lambda left, right: left << right,
+    ">>": lambda left, right: left >> right,
+}
+
+UNARY_FOLDERS = {
+    "-": lambda value: -value,
+    "+": lambda value: value,
+    "!": lambda value: int(not value),
+    "~": lambda value: ~value,
+}
+
+class CopyPropagation(object):
+    """
+        Within each straight-line stretch of code, replaces uses of a name that was just copied
+        from a constant or another name with that constant or name. A constant is wrapped to the size
+        of the name it was copied into first, as it would be in that name, and a name is only copied
+        into a name of the same size; the sizes of longs, pointers and globals take symbol_table to know.
+    """
+    name = "copy_propagation"
+    symbol_table = None
+    def run(self,code,scope):
+        excluded = address_taken(code)
+        copies = {}
+        copied_into = defaultdict(set)
+        def forget(name):
+            if name in copies:
+                copied_into[copies.pop(name)].discard(name)
+            for other in copied_into.pop(name,()):
+                del copies[other]
+        def forget_everything():
+            copies.clear()
+            copied_into.clear()
+        result = []
+        for instruction in code:
+            label, operation, destination, source1, source2 = instruction
+            if label is not None:
+                forget_everything() # something may branch here, with other copies in force
+            if operation == "":
+                result.append(instruction)
+                continue
+            known = operation in ("=","load","return") or operation in BRANCHES or \
+                operation in BINARY_OPERATIONS or operation in UNARY_OPERATIONS
+            if not known:
+                forget_everything()
+                result.append(instruction)
+                continue
+            if operation == "return":
+                destination = copies.get(destination,destination)
+            elif operation == "conditional_branch":
+                source1 = copies.get(source1,source1)
+            elif operation == "unconditional_branch":
+                pass
+            elif source2 == "" and (operation in INCREMENT_OPERATIONS or operation == "&"):
+                pass # these need the name itself, not its value
+            else:
+                source1 = copies.get(source1,source1)
+                source2 = copies.get(source2,source2)
+            instruction = (label,operation,destination,source1,source2)
+            for name in names_defined(instruction):
+                forget(name)
+            if operation == "=" and is_name(destination) and destination not in excluded and destination != source1:
+                if is_constant(source1):
+                    copies[destination] = str(wrap(constant_value(source1),size_of(destination,scope,self.symbol_table)))
+                elif is_name(source1) and source1 not in excluded and \
+                        size_of(destination,scope,self.symbol_table) == size_of(source1,scope,self.symbol_table):
+                    copies[destination] = source1
+                    copied_into[source1].add(destination)
+            if operation in BRANCHES or operation == "return":
+                forget_everything()
+            result.append(instruction)
+        return self.coalesce(result,scope)
+    def coalesce(self,code,scope):
+        """
+            t = a op b followed by x = t, where nothing else uses t, becomes x = a op b;
+            not for a read through a pointer into a name of another type, since reading into a struct
+            or array gives its address instead
+        """
+        uses = defaultdict(int)
+        for instruction in code:
+            for name in names_used(instruction):
+                uses[name] += 1
+        result = []
+        for instruction in code:
+            label, operation, destination, source1, source2 = instruction
+            if operation == "=" and label is None and is_temporary(source1) and uses[source1] == 1 and result:
+                previous = result[-1]
+                if previous[2] == source1 and is_pure(previous) and names_defined(previous) == (source1,) and \
+                        (is_binary(previous) or previous[1] not in MEMORY_READS or scope.get(destination) == scope.get(source1)):
+                    result[-1] = (previous[0],previous[1],destination,previous[3],previous[4])
+                    continue
+            result.append(instruction)
+        return result
+
+SHIFTS = frozenset(["<<",">>"])
+
+def fold(instruction,size=4):
+    """
+        the instruction with its result worked out, if every operand is a constant, or None;
+        size is how many bytes the destination holds, which the result wraps to and shifts have to stay under
+    """
+    label, operation, destination, source1, source2 = instruction
+    if is_binary(instruction):
+        if is_constant(source1) and is_constant(source2):
+            right = constant_value(source1)
+            value = None
+            if operation not in SHIFTS or 0 <= right < 8*size:
+                value = FOLDERS[operation](constant_value(source2),right)
+            if value is not None:
+                return (label,"=",destination,str(wrap(value,size)),"")
+        return simplify(instruction)
+    if is_unary(instruction) and operation in UNARY_FOLDERS and is_constant(source1):
+        return (label,"=",destination,str(wrap(UNARY_FOLDERS[operation](constant_value(source1)),size)),"")
+    return None
+
+def simplify(instruction):
+    """
+        x+0, x-0, x*1 and the like, with x a name; remember that source2 is the left operand
+    """
+    label, operation, destination, source1, source2 = instruction
+    left, right = source2, source1
+    def constant(operand,value):
+        return is_constant(operand) and constant_value(operand) == value
+    if operation in ("+","|","^") and constant(right,0) and is_name(left):
+        return (label,"=",destination,left,"")
+    if operation in ("+","|","^") and constant(left,0) and is_name(right):
+        return (label,"=",destination,right,"")
+    if operation in ("-","<<",">>") and constant(right,0) and is_name(left):
+        return (label,"=",destination,left,"")
+    if operation == "*" and constant(right,1) and is_name(left):
+        return (label,"=",destination,left,"")
+    if operation == "*" and constant(left,1) and is_name(right):
+        return (label,"=",destination,right,"")
+    if operation in ("*","&") and (constant(left,0) or constant(right,0)):
+        return (label,"=",destination,"0","")
+    return None
+
+class ConstantFolding(object):
+    """
+        Works out operations whose operands are all constants, drops the algebraic no-ops,
+        and turns branches on a constant into an unconditional branch or nothing at all.
+        Results wrap to the size of the name they go in, which takes symbol_table to know;
+        without it, everything is taken to be an int.
+    """
+    name = "constant_folding"
+    symbol_table = None
+    def run(self,code,scope):
+        result = []
+        for instruction in code:
+            label, operation, destination, source1, source2 = instruction
+            if operation == "conditional_branch" and is_constant(source1):
+                if constant_value(source1) != 0:
+                    result.append((label,"unconditional_branch",destination,"",""))
+                elif label is not None:
+                    result.append((label,"","","",""))
+                continue
+            folded = fold(instruction,size_of(destination,scope,self.symbol_table))
+            result.append(folded if folded is not None else instruction)
+        return result
+
+class DeadCodeElimination(object):
+    """
+        Removes instructions that only compute a local name that is never used,
+        and then anything that only fed those, and so on.
+    """
+    name = "dead_code_elimination"
+    def run(self,code,scope):
+        removable = local_names(scope) - address_taken(code)
+        uses = defaultdict(int)
+        definitions = defaultdict(list)
+        for index, instruction in enumerate(code):
+            for name in names_used(instruction):
+                uses[name] += 1
+            for name in names_defined(instruction):
+                definitions[name].append(index)
+        dead = set()
+        candidates = [index for index, instruction in enumerate(code) if is_pure(instruction)]
+        while candidates:
+            index = candidates.pop()
+            if index in dead:
+                continue
+            instruction = code[index]
+            destination = instruction[2]
+            if not is_pure(instruction) or destination not in removable or uses[destination] != 0:
+                continue
+            dead.add(index)
+            for name in names_used(instruction):
+                uses[name] -= 1
+                if uses[name] == 0:
+                    candidates.extend(definitions[name])
+        result = []
+        for index, instruction in enumerate(code):
+            if index not in dead:
+                result.append(instruction)
+            elif instruction[0] is not None:
+                result.append((instruction[0],"","","",""))
+        return result
+
+PASSES = [CopyPropagation,ConstantFolding,ValueNumbering,DeadCodeElimination,LoopInvariantCodeMotion,StrengthReduction]
+FINAL_PASSES = [LoopRotation,ControlFlowCleanup,TemporaryReuse]
+INTERPROCEDURAL_PASSES = [Inlining]
+
+def prune_scope(code,scope):
+    """
+        forgets the temporaries that no instruction mentions any more, so they don't take up room in the frame
+    """
+    mentioned = set()
+    for instruction in code:
+        mentioned.update(instruction)
+    for name in [name for name in scope if is_temporary(name) and name not in mentioned]:
+        del scope[name]
+
+class PassManager(object):
+    """
+        Runs a list of passes over a function's 3AC, round after round until nothing changes
+        (or rounds runs out), and then the final passes once each. Each pass has a name and
+        a run(code,scope) method that takes a list of instruction tuples and the function's scope,
+        and returns a new list. Passes can be switched off by name.
+        The final passes are the ones that would get in the way of the others, like
+        temporary_reuse, after which a temporary may be set in more than one place.
+        Interprocedural passes, like inlining, look at more than one function: run_on_symbol_table
+        goes through the functions in the order the first of them asks for, runs each one's
+        run(symbol_table,name,graph) on a function just before the other passes, and hands it
+        the function's code as the rounds leave it, before the final passes, through optimized(name,code,scope).
+        A pass with a symbol_table attribute, like constant_folding, which needs the sizes of the names it works on,
+        gets the table that run_on_symbol_table is given.
+    """
+    def __init__(self,passes=None,final_passes=None,rounds=4,interprocedural_passes=None):
+        if passes is None:
+            passes = [the_pass() for the_pass in PASSES]
+        if final_passes is None:
+            final_passes = [the_pass() for the_pass in FINAL_PASSES]
+        if interprocedural_passes is None:
+            interprocedural_passes = [the_pass() for the_pass in INTERPROCEDURAL_PASSES]
+        self.passes = passes
+        self.final_passes = final_passes
+        self.interprocedural_passes = interprocedural_passes
+        self.rounds = rounds
+        self.disabled = set()
+    def names(self):
+        return [the_pass.name for the_pass in self.interprocedural_passes + self.passes + self.final_passes]
+    def disable(self,name):
+        assert(name in self.names())
+        self.disabled.add(name)
+    def enable(self,name):
+        self.disabled.discard(name)
+    def run(self,the_code,scope):
+        return self.finish(self.run_rounds(the_code,scope),scope)
+    def run_rounds(self,the_code,scope):
+        code = list(the_code)
+        for i in range(self.rounds):
+            before = code
+            for the_pass in self.passes:
+                if the_pass.name not in self.disabled:
+                    code = the_pass.run(code,scope)
+            if code == before:
+                break
+        prune_scope(code,scope)
+        return code
+    def finish(self,code,scope):
+        for the_pass in self.final_passes:
+            if the_pass.name not in self.disabled:
+                code = the_pass.run(code,scope)
+        return InstructionList(code)
+    def run_on_symbol_table(self,symbol_table,function_names=None):
+        """
+            optimizes the code that generate_code stored under "{}" in each function's scope
+        """
+        if function_names is None:
+            function_names = [name for name, value in symbol_table.functions()]
+        for the_pass in self.passes + self.final_passes:
+            if hasattr(the_pass,"symbol_table"):
+                the_pass.symbol_table = symbol_table
+        interprocedural = [the_pass for the_pass in self.interprocedural_passes if the_pass.name not in self.disabled]
+        graph = None
+        if interprocedural:
+            function_names, graph = interprocedural[0].order(symbol_table,function_names)
+        for name in function_names:
+            scope = symbol_table.function(name)
+            for the_pass in interprocedural:
+                scope["{}"] = the_pass.run(symbol_table,name,graph)
+            code = self.run_rounds(scope["{}"],scope)
+            for the_pass in interprocedural:
+                the_pass.optimized(name,code,scope)
+            scope["{}"] = self.finish(code,scope)
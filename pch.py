@@ -0,0 +1,154 @@
+import os
+import re
+import hashlib
+import subprocess
+import tempfile
+
+import mksymtab
+import mk3ac
+import streaming
+import compile_cache
+
+CPP = "cpp"
+
+# what can be in the header prefix of a file: preprocessor lines, comments and blank lines
+prefix_line = re.compile(r"[ \t]*(\#|//|/\*|$)")
+conditional_start = re.compile(r"[ \t]*\#[ \t]*if")
+conditional_end = re.compile(r"[ \t]*\#[ \t]*endif")
+
+class PreprocessorError(Exception):
+    pass
+
+def preprocess(text,cpp_args=(),flags=()):
+    """
+        runs the preprocessor over text, given on its standard input, and returns what it writes
+    """
+    command = [CPP]+list(flags)+list(cpp_args)+["-"]
+    process = subprocess.Popen(command,stdin=subprocess.PIPE,stdout=subprocess.PIPE,stderr=subprocess.PIPE)
+    output, errors = process.communicate(text)
+    if process.returncode != 0:
+        raise PreprocessorError(errors)
+    return output
+
+def split_prefix(code):
+    """
+        Splits code into its header prefix and the rest. The prefix is the longest run of lines at the start
+        made of preprocessor lines, comments and blank lines that leaves every #if closed, so an include guard
+        around the whole file stops it where the guard opens. Returns (prefix, rest, the line the rest starts on).
+    """
+    lines = code.splitlines(True)
+    depth = 0
+    in_comment = False
+    continued = False
+    end = 0
+    for index, line in enumerate(lines):
+        if in_comment or continued:
+            pass
+        elif not prefix_line.match(line):
+            break
+        elif conditional_start.match(line):
+            depth += 1
+        elif conditional_end.match(line):
+            depth -= 1
+        if in_comment:
+            in_comment = "*/" not in line
+        elif "/*" in line:
+            in_comment = "*/" not in line[line.index("/*")+2:]
+        continued = line.rstrip("\r\n").endswith("\\")
+        if depth == 0 and not in_comment and not continued:
+            end = index+1
+    return "".join(lines[:end]), "".join(lines[end:]), end+1
+
+def dependencies(prefix,cpp_args=()):
+    """
+        the files the preprocessor reads for the prefix, as cpp -M lists them
+    """
+    rule = preprocess(prefix,cpp_args,["-M"]).replace("\\\n"," ")
+    return rule.split(":",1)[1].split()
+
+def file_digest(path):
+    try:
+        with open(path,"rb") as contents:
+            return hashlib.sha1(contents.read()).hexdigest()
+    except IOError:
+        return None
+
+def macros_of(prefix,cpp_args=()):
+    """
+        the #defines the prefix leaves behind, without the ones the preprocessor starts out with
+    """
+    builtin = set(preprocess("",cpp_args,["-dM"]).splitlines())
+    return "".join(line+"\n" for line in preprocess(prefix,cpp_args,["-dM"]).splitlines() if line not in builtin)
+
+class PrecompiledHeader(object):
+    """
+        What parsing and building the symbol table for a header prefix leaves behind: the typedef names
+        the parser has to know, the types and globals the prefix declares, and the macros it defines.
+        dependencies maps every file the prefix reads to a hash of its contents, which is how a change
+        to one of them is noticed.
+    """
+    def __init__(self,dependencies,macros,typedef_names,values,types):
+        self.dependencies = dependencies
+        self.macros = macros
+        self.typedef_names = typedef_names
+        self.values = values
+        self.types = types
+    def is_current(self):
+        return all(file_digest(path) == digest for path, digest in self.dependencies.items())
+
+def precompile(prefix,cpp_args=()):
+    """
+        preprocesses, parses and builds the symbol table for a header prefix
+    """
+    files = dependencies(prefix,cpp_args)
+    digests = dict((path,file_digest(path)) for path in files)
+    cparser = mk3ac.new_parser(streaming.IncrementalCParser)
+    parsed_header = cparser.parse_chunk(preprocess(prefix,cpp_args))
+    builder = mksymtab.SymbolTableBuilder()
+    builder.visit(parsed_header)
+    return PrecompiledHeader(digests,macros_of(prefix,cpp_args),dict(cparser._scope_stack[0]),
+                             builder.values.values,builder.types.values)
+
+def header_key(prefix,cpp_args=(),compiler=None):
+    digest = hashlib.sha1(compiler if compiler is not None else compile_cache.compiler_digest())
+    for arg in cpp_args:
+        digest.update("\0")
+        digest.update(arg)
+    digest.update("\0")
+    digest.update(prefix)
+    return "pch-"+digest.hexdigest()
+
+def precompiled_header(prefix,cache,cpp_args=()):
+    """
+        the PrecompiledHeader for prefix, from the cache unless one of the files it was built from has changed since
+    """
+    key = header_key(prefix,cpp_args)
+    header = cache.get(key)
+    if header is None or not header.is_current():
+        header = precompile(prefix,cpp_args)
+        cache.put(key,header)
+    return header
+
+def compile_with_header(code,cache,cpp_args=(),filename="<stdin>",reorder_fields=False,lazy=False):
+    """
+        parses code and builds its symbol table like makeSymbolTable does, except that the header prefix
+        comes out of the cache, so only the rest of the file is parsed and visited. The rest is preprocessed
+        with the prefix's macros defined. Returns the parse tree of the rest and the symbol table.
+    """
+    prefix, rest, line = split_prefix(code)
+    header = precompiled_header(prefix,cache,cpp_args)
+    handle, macros_path = tempfile.mkstemp(suffix=".h")
+    try:
+        with os.fdopen(handle,"wb") as macros:
+            macros.write(header.macros)
+        preprocessed = preprocess('#line %d "%s"\n' % (line,filename)+rest,cpp_args,["-imacros",macros_path])
+    finally:
+        os.remove(macros_path)
+    cparser = mk3ac.new_parser(streaming.IncrementalCParser)
+    cparser._scope_stack[0].update(header.typedef_names)
+    parsed_code = cparser.parse_chunk(preprocessed,filename=filename)
+    builder = mksymtab.SymbolTableBuilder(lazy)
+    builder.values.values.update(header.values)
+    builder.types.values.update(header.types)
+    builder.visit(parsed_code)
+    return parsed_code, mksymtab.SymbolTable(builder,reorder_fields,generator=mk3ac.generate_function)
@@ -0,0 +1,121 @@
+import json
+import contextlib
+from timeit import default_timer as clock
+
+import mksymtab
+
+class CountingNestedDict(mksymtab.NestedDict):
+    """
+        Swapped in as the class of a NestedDict that is being profiled, so that [] and in are counted.
+        Nothing is counted, and nothing costs anything extra, for NestedDicts that are not profiled.
+    """
+    def __contains__(self,name):
+        self.lookup_counts[self.lookup_prefix+" in"] += 1
+        return mksymtab.NestedDict.__contains__(self,name)
+    def __getitem__(self,name):
+        self.lookup_counts[self.lookup_prefix+"[]"] += 1
+        return mksymtab.NestedDict.__getitem__(self,name)
+    def __setitem__(self,name,value):
+        self.lookup_counts[self.lookup_prefix+"[]="] += 1
+        mksymtab.NestedDict.__setitem__(self,name,value)
+
+class Profiler(object):
+    """
+        Opt-in instrumentation for a compile. Builders and symbol tables are only slowed down
+        once they are handed to instrument or instrument_symbol_table, which wrap their methods
+        on the instance; the classes themselves are never touched.
+        begin is wrapped rather than each visit_* method, so node kinds that fall through to
+        generic_visit are counted too. A visit lasts until its generator runs out, so times
+        are inclusive of the children; self_seconds is not.
+    """
+    def __init__(self):
+        self.phases = {}
+        self.visitors = {}
+        self.functions = {}
+        self.lookups = {}
+        self.open_visits = []
+    @contextlib.contextmanager
+    def phase(self,name):
+        started = clock()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name,0.0) + clock() - started
+    def instrument(self,builder):
+        """
+            builder is a SymbolTableBuilder or a CodeBuilder
+        """
+        kind = builder.__class__.__name__
+        stats = self.visitors.setdefault(kind,{})
+        open_visits = self.open_visits
+        begin = builder.begin
+        def finish(entry,started,children):
+            elapsed = clock() - started
+            entry[0] += 1
+            entry[1] += elapsed
+            entry[2] += elapsed - children
+            if open_visits:
+                open_visits[-1] += elapsed
+        def timed(children,entry,started):
+            open_visits.append(0.0)
+            try:
+                for child in children:
+                    yield child
+            finally:
+                finish(entry,started,open_visits.pop())
+        def counted_begin(node):
+            method = "visit_"+node.__class__.__name__
+            entry = stats.get(method)
+            if entry is None:
+                entry = stats[method] = [0,0.0,0.0]
+            started = clock()
+            children = begin(node)
+            if children is None:
+                finish(entry,started,0.0)
+                return None
+            return timed(children,entry,started)
+        builder.begin = counted_begin
+        if hasattr(builder,"the_function_name"):
+            function = self.functions.setdefault(builder.the_function_name,{"temporaries": 0,"instructions": 0})
+            genLabel = builder.genLabel
+            add = builder.add
+            def counted_genLabel(label_type,scope):
+                function["temporaries"] += 1
+                return genLabel(label_type,scope)
+            def counted_add(operation,destination,source1,source2,label=None):
+                function["instructions"] += 1
+                return add(operation,destination,source1,source2,label)
+            builder.genLabel = counted_genLabel
+            builder.add = counted_add
+        return builder
+    def instrument_nested_dict(self,nested_dict,prefix):
+        for suffix in [" in","[]","[]="]:
+            self.lookups.setdefault(prefix+suffix,0)
+        nested_dict.lookup_counts = self.lookups
+        nested_dict.lookup_prefix = prefix
+        nested_dict.__class__ = CountingNestedDict
+    def instrument_symbol_table(self,symbol_table):
+        for name in ["typeof","resolve","sizeof","field","arguments"]:
+            self.lookups.setdefault(name,0)
+            setattr(symbol_table,name,self.counted(name,getattr(symbol_table,name)))
+        self.instrument_nested_dict(symbol_table.values,"values")
+        self.instrument_nested_dict(symbol_table.types,"types")
+        return symbol_table
+    def counted(self,name,method):
+        lookups = self.lookups
+        def counted_method(*args):
+            lookups[name] += 1
+            return method(*args)
+        return counted_method
+    def report(self):
+        visitors = {}
+        for kind, stats in self.visitors.items():
+            visitors[kind] = dict((method,{"calls": calls,"seconds": seconds,"self_seconds": self_seconds})
+                                  for method, (calls, seconds, self_seconds) in stats.items())
+        return {"phases": dict(self.phases),
+                "visitors": visitors,
+                "functions": dict((name,dict(counts)) for name, counts in self.functions.items()),
+                "lookups": dict(self.lookups)}
+    def write_report(self,where):
+        json.dump(self.report(),where,indent=1,sort_keys=True)
+        where.write("\n")
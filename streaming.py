@@ -0,0 +1,92 @@
+import re
+import pprint # so we can pretty-print our output
+
+import pycparser # the C parser written in Python
+from pycparser import c_ast
+
+import mksymtab
+import mk3ac
+from ir import printable
+
+# the things that matter when looking for the end of a top-level declaration, and the things
+# (comments, string and character literals, preprocessor lines) whose braces and semicolons don't count
+interesting = re.compile(r"""/\*.*?\*/|//[^\n]*|"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*'|^[ \t]*\#[^\n]*|[{};]""",re.S|re.M)
+
+def top_level_chunks(code):
+    """
+        Splits preprocessed C into its top-level declarations and function definitions without parsing it,
+        yielding (text, the line it starts on). A chunk ends at a ; outside any braces, or at the }
+        that closes a function body, which is a { at the top level that comes right after a ).
+        A preprocessor line at the top level, such as #line or #pragma, is a chunk of its own.
+        K&R definitions, with declarations between the ) and the {, are not supported.
+    """
+    start = 0
+    line = 1
+    depth = 0
+    function_body = False
+    for match in interesting.finditer(code):
+        token = match.group()
+        end = None
+        if token == "{":
+            if depth == 0:
+                function_body = code[start:match.start()].rstrip().endswith(")")
+            depth += 1
+        elif token == "}":
+            depth -= 1
+            if depth == 0 and function_body:
+                end = match.end()
+        elif token == ";":
+            if depth == 0:
+                end = match.end()
+        elif token.lstrip().startswith("#") and depth == 0 and not code[start:match.start()].strip():
+            end = match.end()
+        if end is not None:
+            text = code[start:end]
+            if text.strip():
+                yield (text,line)
+            line += text.count("\n")
+            start = end
+    if code[start:].strip():
+        yield (code[start:],line)
+
+class IncrementalCParser(pycparser.c_parser.CParser):
+    """
+        A CParser that can be fed a file one top-level chunk at a time. parse forgets every typedef name
+        each time it is called, but parse_chunk keeps the ones that earlier chunks declared,
+        since the grammar needs them to parse the chunks that use them.
+    """
+    def parse_chunk(self,text,line=1,filename=''):
+        self.clex.filename = filename
+        self.clex.reset_lineno()
+        self.clex.lexer.lineno = line
+        self._last_yielded_token = None
+        try:
+            return self.cparser.parse(input=text,lexer=self.clex)
+        except Exception:
+            del self._scope_stack[1:] # an error can leave it inside a block
+            raise
+
+def compile_streaming(code_to_parse,cparser,out,optimize=False,disabled_passes=(),reorder_fields=False):
+    """
+        Compiles one top-level chunk at a time. A function is parsed, its scope built, its 3AC generated
+        (and optimized) and written to out as {name: scope}; its parse tree, locals and 3AC are then let go
+        before the next chunk is even parsed, so what is held at once is bounded by the largest function
+        and not by the whole file. Globals, types and every function's signature are kept, and the table
+        they make up is written at the end. cparser has to be an IncrementalCParser.
+        Since a function's code is gone by the time anything calls it, nothing gets inlined.
+    """
+    builder = mksymtab.SymbolTableBuilder(lazy=True)
+    st = mksymtab.SymbolTable(builder,reorder_fields,generator=mk3ac.generate_function)
+    for text, line in top_level_chunks(code_to_parse):
+        chunk = cparser.parse_chunk(text,line)
+        builder.visit(chunk)
+        function_names = [ext.decl.name for ext in chunk.ext if isinstance(ext,c_ast.FuncDef)]
+        del chunk
+        for name in function_names:
+            scope = st.function(name)
+            if optimize:
+                mk3ac.optimize_symbol_table(st,disabled_passes,[name])
+            pprint.pprint({name: printable(scope)},out)
+            st.release(name)
+    pprint.pprint(printable(st.values.values),out)
+    return st
@@ -0,0 +1,34 @@
+import sys
+import unittest
+from StringIO import StringIO
+
+import benchmark
+
+def result(parse,symbol_table,codegen,growth):
+    return {"phases": {"parse": {"seconds": parse},"symbol_table": {"seconds": symbol_table},"codegen": {"seconds": codegen}},
+            "peak_growth_kb": growth}
+
+class BenchmarkTest(unittest.TestCase):
+    def test_the_workloads_are_the_same_every_time(self):
+        for name, generator in benchmark.WORKLOADS:
+            self.assertEqual(generator(1),generator(1),name)
+            self.assertNotEqual(generator(1,seed=1),generator(1),name)
+    def test_a_workload_compiles(self):
+        code = benchmark.deep_nesting(1)
+        lines, instructions, timings = benchmark.run_phases(code)
+        self.assertEqual(lines,code.count("\n"))
+        self.assertTrue(instructions > 0)
+        self.assertEqual(sorted(timings),["codegen","parse","parser_setup","symbol_table"])
+    def test_only_slowdowns_past_the_threshold_are_regressions(self):
+        baseline = {"benchmarks": {"a": result(1.0,1.0,1.0,1000),"gone": result(1.0,1.0,1.0,1000)}}
+        results = {"benchmarks": {"a": result(1.05,2.0,0.5,1500),"new": result(9.0,9.0,9.0,9000)}}
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            regressions = benchmark.compare(results,baseline,0.10)
+        finally:
+            sys.stdout = stdout
+        self.assertEqual([(name,phase) for name, phase, ratio in regressions],[("a","symbol_table"),("a","memory")])
+
+if __name__ == "__main__":
+    unittest.main()
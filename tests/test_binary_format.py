@@ -0,0 +1,94 @@
+import os
+import pprint
+import shutil
+import struct
+import tempfile
+import unittest
+
+import binary_format
+import mk3ac
+import mksymtab
+from ir import printable
+
+CODE = """
+typedef struct record {
+    char tag;
+    long count;
+    char flag;
+    struct record * next;
+} record;
+long * count_of(record * r) {
+    return &(r->count);
+}
+int sum(int n) {
+    int i;
+    int total;
+    total = 0;
+    for (i = 0; i < n; i++) {
+        total = total + i;
+    }
+    return total;
+}
+"""
+
+class BinaryFormatTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory,"tables")
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    def round_trip(self,reorder_fields,data_model,optimize=False):
+        parsed_code = mk3ac.new_parser().parse(CODE)
+        st = mksymtab.makeSymbolTable(parsed_code,reorder_fields=reorder_fields,data_model=data_model,
+                                      generator=mk3ac.generate_function)
+        mk3ac.generate_code(st)
+        if optimize:
+            mk3ac.optimize_symbol_table(st)
+        binary_format.write_file(st,self.path)
+        return st, binary_format.MappedTables(self.path)
+    def test_the_code_comes_back(self):
+        st, tables = self.round_trip(False,"ILP32")
+        try:
+            self.assertEqual(sorted(tables.function_names()),["count_of","sum"])
+            for name in ("count_of","sum"):
+                self.assertEqual(tables.function(name)["{}"],list(st.function(name)["{}"]))
+        finally:
+            tables.close()
+    def test_the_layouts_come_back_as_they_were_worked_out(self):
+        for reorder_fields in (False,True):
+            for data_model in ("ILP32","LP64"):
+                st, tables = self.round_trip(reorder_fields,data_model)
+                try:
+                    self.assertEqual(tables.data_model,data_model)
+                    self.assertEqual(tables.reorder_fields,reorder_fields)
+                    written = st.type_registry.get("struct record")
+                    read = tables.symbol_table().type_registry.get("struct record")
+                    self.assertEqual((read.size,read.offsets),(written.size,written.offsets))
+                    self.assertEqual(tables.layouts()["struct record"][:2],(written.size,written.alignment))
+                finally:
+                    tables.close()
+    def test_optimized_code_and_its_labels_come_back(self):
+        st, tables = self.round_trip(False,"LP64",True)
+        try:
+            written = st.function("sum")
+            read = tables.function("sum")
+            self.assertEqual(read["{}"],list(written["{}"]))
+            self.assertEqual(pprint.pformat(printable(read)),pprint.pformat(printable(written))) # Labels have no ==
+            self.assertTrue(isinstance(read["L0"],mk3ac.Label))
+            self.assertEqual(tables.symbol_table().function("sum")["{}"],list(written["{}"]))
+            self.assertRaises(KeyError,tables.function,"missing")
+        finally:
+            tables.close()
+    def test_only_a_3ac_file_of_this_version_is_read(self):
+        st, tables = self.round_trip(False,"ILP32")
+        tables.close()
+        with open(self.path,"r+b") as the_file:
+            the_file.seek(4)
+            the_file.write(struct.pack("<I",binary_format.VERSION+1))
+        self.assertRaises(ValueError,binary_format.MappedTables,self.path)
+        with open(self.path,"wb") as the_file:
+            the_file.write("\0"*binary_format.HEADER.size)
+        self.assertRaises(ValueError,binary_format.MappedTables,self.path)
+
+if __name__ == "__main__":
+    unittest.main()
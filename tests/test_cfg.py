@@ -0,0 +1,80 @@
+import unittest
+
+import cfg
+import execution_engine
+
+LOOP = [
+    (None,"=","i","0",""),
+    (None,"=","total","0",""),
+    ("L0","<","L1","n","i"),
+    (None,"conditional_branch","L2","L1",""),
+    (None,"unconditional_branch","L3","",""),
+    ("L2","+","L4","i","total"),
+    (None,"=","total","L4",""),
+    (None,"++","L5","i",""),
+    (None,"unconditional_branch","L0","",""),
+    ("L3","return","total","",""),
+]
+
+CODE = """
+int reuse(int a) {
+    int b;
+    int c;
+    b = a * 2 + 1;
+    c = a * 3 + 2;
+    return b * c + a * 4;
+}
+"""
+
+class ControlFlowGraphTest(unittest.TestCase):
+    def test_blocks_and_edges(self):
+        graph = cfg.ControlFlowGraph(LOOP)
+        self.assertEqual([block.label for block in graph.blocks],[None,"L0",None,"L2","L3"])
+        self.assertEqual([[successor.index for successor in block.successors] for block in graph.blocks],
+                         [[1],[3,2],[4],[1],[]])
+        self.assertEqual(graph.code(),LOOP)
+        self.assertEqual([block.index for block in graph.reverse_postorder()],[0,1,2,4,3])
+    def test_liveness(self):
+        graph = cfg.ControlFlowGraph(LOOP)
+        live_in, live_out = cfg.liveness(graph)
+        self.assertEqual(live_in[0],set(["n"]))
+        self.assertEqual(live_in[1],set(["i","n","total"]))
+        self.assertEqual(live_out[3],set(["i","n","total"]))
+        self.assertEqual(live_in[4],set(["total"]))
+        after = cfg.live_after_each_instruction(graph.blocks[3],live_out[3])
+        self.assertEqual(after[0],set(["L4","i","n"]))
+    def test_temporaries_that_never_overlap_share_a_name(self):
+        code = [(None,"*","L0","2","a"),
+                (None,"=","b","L0",""),
+                (None,"*","L1","3","a"),
+                (None,"=","c","L1",""),
+                (None,"return","c","","")]
+        scope = {"a": "int","b": "int","c": "int","L0": "int","L1": "int"}
+        self.assertEqual(cfg.TemporaryReuse().run(code,scope)[2:4],[(None,"*","L0","3","a"),(None,"=","c","L0","")])
+        self.assertNotIn("L1",scope)
+    def test_a_copy_between_temporaries_that_share_a_name_goes(self):
+        code = [(None,"*","L0","2","a"),
+                (None,"=","b","L0",""),
+                (None,"*","L1","3","a"),
+                ("L3","=","L2","L1",""),
+                (None,"return","L2","","")]
+        scope = {"a": "int","b": "int","L0": "int","L1": "int","L2": "int"}
+        self.assertEqual(cfg.TemporaryReuse().run(code,scope)[2:],
+                         [(None,"*","L0","3","a"),("L3","","","",""),(None,"return","L0","","")])
+    def test_temporaries_of_different_types_do_not(self):
+        code = [(None,"*","L0","2","a"),
+                (None,"=","b","L0",""),
+                (None,"*","L1","3","a"),
+                (None,"return","L1","","")]
+        scope = {"a": "int","b": "int","L0": "int","L1": "char"}
+        self.assertEqual(cfg.TemporaryReuse().run(code,scope),code)
+    def test_reused_temporaries_give_the_same_answers(self):
+        plain = execution_engine.compile_and_load(CODE)
+        optimized = execution_engine.compile_and_load(CODE,True)
+        for argument in (-3,0,5):
+            self.assertEqual(optimized.call("reuse",argument),plain.call("reuse",argument))
+        temporaries = [name for name in optimized.symbol_table.function("reuse") if name.startswith("L")]
+        self.assertTrue(len(temporaries) < len([name for name in plain.symbol_table.function("reuse") if name.startswith("L")]))
+
+if __name__ == "__main__":
+    unittest.main()
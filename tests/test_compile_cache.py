@@ -0,0 +1,116 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import binary_format
+import compile_cache
+from ir import printable
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CODE = """
+typedef struct point { int x; int y; } point;
+int * y_of(point * p) {
+    return &(p->y);
+}
+int twice(int a) {
+    return a + a;
+}
+"""
+
+def command_line(*arguments):
+    process = subprocess.Popen([sys.executable,os.path.join(ROOT,"mk3ac.py")]+list(arguments),
+                               stdout=subprocess.PIPE,stderr=subprocess.PIPE,cwd=ROOT)
+    out, errors = process.communicate()
+    return process.returncode, out
+
+class CompileCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    def compile(self,code):
+        cache = compile_cache.CompileCache(self.directory)
+        parsed_code, st = compile_cache.compile_incrementally(code,cache)
+        return cache, printable(st.values.values)
+    def test_unchanged_code_comes_out_of_the_cache(self):
+        first_cache, first = self.compile(CODE)
+        self.assertEqual(first_cache.hits,0)
+        second_cache, second = self.compile(CODE)
+        self.assertEqual(second_cache.hits,3) # the parse and both functions
+        self.assertEqual(second_cache.misses,0)
+        self.assertEqual(second,first)
+    def test_a_changed_declaration_invalidates_only_what_uses_it(self):
+        self.compile(CODE)
+        changed = CODE.replace("int x; int y;","int y; int x;")
+        cache, scopes = self.compile(changed)
+        self.assertEqual(cache.hits,1) # twice, which doesn't use struct point
+        self.assertEqual(cache.misses,2) # the parse and y_of
+        fresh_directory = tempfile.mkdtemp()
+        try:
+            parsed_code, st = compile_cache.compile_incrementally(changed,compile_cache.CompileCache(fresh_directory))
+            self.assertEqual(scopes,printable(st.values.values))
+        finally:
+            shutil.rmtree(fresh_directory)
+    def test_a_changed_caller_still_sees_what_a_cached_callee_returns(self):
+        code = "int * get(int * p) { return p; } int use(int * q) { int a; a = *get(q); return a; }"
+        self.compile(code)
+        changed = code.replace("return a;","return a + 1;")
+        cache, scopes = self.compile(changed)
+        self.assertEqual((cache.hits,cache.misses),(1,2)) # get, and then the parse and use
+        self.assertEqual(scopes["use"]["L0"],("","int"))
+        fresh_directory = tempfile.mkdtemp()
+        try:
+            parsed_code, st = compile_cache.compile_incrementally(changed,compile_cache.CompileCache(fresh_directory))
+            self.assertEqual(scopes,printable(st.values.values))
+        finally:
+            shutil.rmtree(fresh_directory)
+    def test_the_least_recently_used_entries_are_evicted(self):
+        cache = compile_cache.CompileCache(self.directory,2500)
+        for key in ("a","b"):
+            cache.put(key,"x"*1000)
+            os.utime(cache.path_of(key),(1000,1000) if key == "a" else (2000,2000))
+            cache.entries[key][1] = os.stat(cache.path_of(key)).st_mtime
+        self.assertEqual(cache.get("a"),"x"*1000) # a is now the most recently used
+        cache.put("c","x"*1000)
+        self.assertEqual(sorted(cache.entries),["a","c"])
+        self.assertEqual(sorted(os.listdir(self.directory)),["a","c"])
+        self.assertTrue(cache.total_bytes <= 2500)
+        reopened = compile_cache.CompileCache(self.directory,1500)
+        self.assertEqual(len(reopened.entries),1)
+    def test_an_unreadable_entry_is_a_miss(self):
+        cache = compile_cache.CompileCache(self.directory)
+        cache.put("a",[1,2,3])
+        with open(cache.path_of("a"),"wb") as entry:
+            entry.write("not a pickle")
+        self.assertEqual(cache.get("a"),None)
+        self.assertEqual((cache.hits,cache.misses),(0,1))
+        self.assertFalse(os.path.exists(cache.path_of("a")))
+    def test_deeply_nested_code_can_be_hashed(self):
+        code = "int f(int a) { return " + " + ".join(["a"]*5000) + "; }"
+        self.compile(code)
+        cache, scopes = self.compile(code)
+        self.assertEqual(cache.hits,1) # the function; the parse tree is too deep to pickle
+        self.assertEqual(len(scopes["f"]["{}"]),5000)
+    def test_the_command_line_optimizes_and_writes_binaries(self):
+        path = os.path.join(self.directory,"tables")
+        status, uncached = command_line("-O",CODE)
+        self.assertEqual(status,0)
+        for attempt in range(2): # a miss and then a hit
+            status, cached = command_line("--cache",self.directory,"-O","--binary",path,CODE)
+            self.assertEqual(status,0)
+            self.assertTrue(uncached.endswith(cached))
+        tables = binary_format.MappedTables(path)
+        try:
+            self.assertEqual(sorted(tables.function_names()),["twice","y_of"])
+        finally:
+            tables.close()
+    def test_the_command_line_rejects_profiling_a_cached_compile(self):
+        status, out = command_line("--cache",self.directory,"--profile","-",CODE)
+        self.assertEqual(status,2)
+
+if __name__ == "__main__":
+    unittest.main()
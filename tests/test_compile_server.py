@@ -0,0 +1,78 @@
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+import compile_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CODE = "int f(int a) { int b; b = 2 + 3; return a + b; }"
+STRUCT_CODE = "typedef struct pair { char a; int b; char c; } pair; int g(pair * p) { return p->b; }"
+
+def run(script,*arguments):
+    process = subprocess.Popen([sys.executable,os.path.join(ROOT,script)]+list(arguments),
+                               stdout=subprocess.PIPE,stderr=subprocess.PIPE,cwd=ROOT)
+    out, errors = process.communicate()
+    return process.returncode, out
+
+class CompileServerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.socket = os.path.join(self.directory,"mk3ac.sock")
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    def test_without_a_server_the_client_compiles_itself(self):
+        expected = run("mk3ac.py","-O","--function","f",CODE)
+        self.assertEqual(expected[0],0)
+        self.assertEqual(run("mk3ac_client.py","--socket",self.socket,"-O","--function","f",CODE),expected)
+    def test_the_server_compiles_like_the_command_line(self):
+        server = subprocess.Popen([sys.executable,os.path.join(ROOT,"compile_server.py"),"--socket",self.socket,"--parsers","1"],
+                                  cwd=ROOT)
+        try:
+            for attempt in range(200):
+                if os.path.exists(self.socket):
+                    break
+                time.sleep(0.05)
+            for arguments in [(CODE,),("-O",CODE),("--function","f",CODE),(),("--reorder-fields","--layout-report",STRUCT_CODE)]:
+                expected = run("mk3ac.py",*arguments)
+                self.assertEqual(run("mk3ac_client.py","--socket",self.socket,*arguments),expected)
+        finally:
+            server.terminate()
+            server.wait()
+    def test_a_failed_compile_is_reported(self):
+        reply = compile_server.handle_request({"code": "int f( {"},compile_server.ParserPool(1))
+        self.assertEqual(reply["status"],1)
+        self.assertIn("ParseError",reply["error"])
+    def test_a_parser_goes_back_to_the_pool_after_a_failure(self):
+        parsers = compile_server.ParserPool(1)
+        self.assertEqual(compile_server.handle_request({"code": "int f( {"},parsers)["status"],1)
+        reply = compile_server.handle_request({"code": CODE,"optimize": True},parsers)
+        self.assertEqual(reply["status"],0)
+        self.assertEqual(reply["output"],run("mk3ac.py","-O",CODE)[1])
+    def test_a_bad_request_does_not_close_the_connection(self):
+        server = compile_server.CompileServer(self.socket,compile_server.ParserPool(1))
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            connection = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+            connection.connect(self.socket)
+            replies = connection.makefile("r")
+            connection.sendall("not json\n")
+            self.assertEqual(json.loads(replies.readline())["status"],2)
+            connection.sendall(json.dumps({"code": CODE})+"\n")
+            self.assertEqual(json.loads(replies.readline())["status"],0)
+            connection.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+if __name__ == "__main__":
+    unittest.main()
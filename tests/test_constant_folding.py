@@ -0,0 +1,105 @@
+import platform
+import unittest
+from StringIO import StringIO
+from distutils.spawn import find_executable
+
+import execution_engine
+import mk3ac
+import mksymtab
+import optimize
+import x86_64_backend
+
+LONGS = """
+long product(long a) {
+    long b;
+    long c;
+    b = 100000;
+    c = b * b;
+    return c + a;
+}
+long shifted(long a) {
+    long b;
+    long one;
+    one = 1;
+    b = 40;
+    return (one << b) + (a << b);
+}
+long back(long a) {
+    long big;
+    long b;
+    big = 1099511627776;
+    b = 38;
+    return (big >> b) + a;
+}
+int narrow(int a) {
+    int b;
+    b = 0xFFFFFFFF;
+    return (b == -1) + a;
+}
+long stepping(long n) {
+    long i;
+    long total;
+    long k;
+    total = 0;
+    k = 3000000000;
+    for (i = 0; i < n; i++) {
+        total = total + i * k;
+    }
+    return total;
+}
+"""
+
+EXPECTED = {
+    "product": lambda a: 100000*100000 + a,
+    "shifted": lambda a: (1 << 40) + (a << 40),
+    "back": lambda a: (1 << 2) + a,
+    "narrow": lambda a: 1 + a,
+    "stepping": lambda n: sum(i*3000000000 for i in range(n)),
+}
+
+ARGUMENTS = [0,1,5]
+
+def optimized_code(name,data_model):
+    parsed_code = mk3ac.new_parser().parse(LONGS)
+    st = mksymtab.makeSymbolTable(parsed_code,data_model=data_model,generator=mk3ac.generate_function)
+    mk3ac.generate_code(st)
+    mk3ac.optimize_symbol_table(st,function_names=[name])
+    return list(st.function(name)["{}"])
+
+class ConstantFoldingTest(unittest.TestCase):
+    def test_folding_wraps_to_the_destination(self):
+        self.assertEqual(optimize.fold((None,"*","x","100000","100000")),(None,"=","x","1410065408",""))
+        self.assertEqual(optimize.fold((None,"*","x","100000","100000"),8),(None,"=","x","10000000000",""))
+        self.assertEqual(optimize.fold((None,"-","x","2147483648","")),(None,"=","x","-2147483648",""))
+    def test_shifts_fold_only_within_the_destination(self):
+        self.assertEqual(optimize.fold((None,"<<","x","40","1")),None)
+        self.assertEqual(optimize.fold((None,"<<","x","40","1"),8),(None,"=","x",str(1 << 40),""))
+        self.assertEqual(optimize.fold((None,">>","x","64","1"),8),None)
+        self.assertEqual(optimize.fold((None,">>","x","-1","1"),8),None)
+    def test_a_long_is_as_big_as_the_data_model_says(self):
+        for data_model, product in (("ILP32","1410065408"),("LP64","10000000000")):
+            label, operation, destination, source1, source2 = optimized_code("product",data_model)[0]
+            self.assertEqual((operation,source1,source2),("+","a",product))
+    def test_the_engine_gives_the_same_answers_optimized(self):
+        for optimized in (False,True):
+            engine = execution_engine.compile_and_load(LONGS,optimized,data_model="LP64")
+            for name, expected in EXPECTED.items():
+                for argument in ARGUMENTS:
+                    self.assertEqual(engine.call(name,argument),expected(argument),(name,argument,optimized))
+    @unittest.skipUnless(platform.machine() == "x86_64" and find_executable("cc"),"needs x86-64 and a C compiler")
+    def test_the_backend_agrees(self):
+        for optimized in (False,True):
+            library = x86_64_backend.NativeLibrary(x86_64_backend.compile_to_assembly(LONGS,optimized))
+            try:
+                for name, expected in EXPECTED.items():
+                    for argument in ARGUMENTS:
+                        self.assertEqual(library.call(name,argument),expected(argument),(name,argument,optimized))
+            finally:
+                library.close()
+    def test_without_a_symbol_table_everything_is_an_int(self):
+        scope = {"x": "long","{}": []}
+        code = optimize.PassManager().run([(None,"*","x","100000","100000"),(None,"return","x","","")],scope)
+        self.assertEqual(list(code)[-1],(None,"return","1410065408","",""))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+
+import execution_engine
+from cfg import ControlFlowCleanup
+
+CODE = """
+int sign(int a, int low) {
+    if (a < 0) {
+        return 0 - 1;
+    } else {
+        if (a > 0) {
+            return 1;
+        }
+    }
+    return 0;
+}
+int clamp(int a, int low) {
+    int b;
+    b = a;
+    if (b < low) {
+        b = low;
+    }
+    while (b > 100) {
+        b = b - 100;
+    }
+    return b;
+}
+"""
+
+EXPECTED = {
+    "sign": lambda a, low: (a > 0) - (a < 0),
+    "clamp": lambda a, low: (max(a,low) - 1) % 100 + 1 if max(a,low) > 100 else max(a,low),
+}
+
+def cleaned(code,scope=None):
+    return ControlFlowCleanup().run(code,dict(scope or {}))
+
+class ControlFlowCleanupTest(unittest.TestCase):
+    def test_jumps_to_jumps_are_threaded(self):
+        code = [(None,"conditional_branch","L0","a",""),
+                (None,"return","b","",""),
+                ("L0","unconditional_branch","L1","",""),
+                ("L1","return","a","","")]
+        self.assertEqual(cleaned(code),[(None,"conditional_branch","L1","a",""),
+                                        (None,"return","b","",""),
+                                        ("L1","return","a","","")])
+    def test_unreachable_code_and_unused_labels_go(self):
+        code = [(None,"return","a","",""),
+                (None,"=","b","1",""),
+                ("L0","","","",""),
+                (None,"return","b","","")]
+        self.assertEqual(cleaned(code),[(None,"return","a","","")])
+    def test_a_branch_over_a_jump_is_inverted(self):
+        code = [(None,"<","L0","b","a"),
+                (None,"conditional_branch","L1","L0",""),
+                (None,"unconditional_branch","L2","",""),
+                ("L1","","","",""),
+                (None,"=","a","b",""),
+                ("L2","","","",""),
+                (None,"return","a","","")]
+        self.assertEqual(cleaned(code,{"L0": "int"}),[(None,">=","L0","b","a"),
+                                                      (None,"conditional_branch","L2","L0",""),
+                                                      (None,"=","a","b",""),
+                                                      ("L2","return","a","","")])
+        self.assertEqual(cleaned(code)[1:3],code[1:3]) # L0 might be used somewhere it can't see
+    def test_a_loop_to_itself_is_left_alone(self):
+        code = [("L0","unconditional_branch","L0","","")]
+        self.assertEqual(cleaned(code),code)
+    def test_cleaned_code_gives_the_same_answers(self):
+        plain = execution_engine.compile_and_load(CODE)
+        optimized = execution_engine.compile_and_load(CODE,True)
+        for name, expected in EXPECTED.items():
+            for a, low in ((-5,0),(0,3),(7,3),(250,3),(1,400)):
+                self.assertEqual(plain.call(name,a,low),expected(a,low),(name,a,low))
+                self.assertEqual(optimized.call(name,a,low),expected(a,low),(name,a,low))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+
+import execution_engine
+from execution_engine import ExecutionError
+
+CODE = """
+typedef struct account { char kind; int balance; struct account * next; } account;
+int quotient(int a, int b) {
+    return a / b;
+}
+int remainder(int a, int b) {
+    return a % b;
+}
+int to_char(int a) {
+    char c;
+    c = a;
+    return c;
+}
+int overflow(int a) {
+    int b;
+    b = 2147483647;
+    return b + a;
+}
+int factorial(int n) {
+    int i;
+    int result;
+    result = 1;
+    for (i = 2; i <= n; i++) {
+        result = result * i;
+    }
+    return result;
+}
+int fibonacci(int n) {
+    if (n < 2) {
+        return n;
+    }
+    return fibonacci(n - 1) + fibonacci(n - 2);
+}
+int total(account * a) {
+    int sum;
+    sum = 0;
+    while (a) {
+        sum = sum + a->balance;
+        a = a->next;
+    }
+    return sum;
+}
+int deposit(account * a, int amount) {
+    a->balance = a->balance + amount;
+    return a->balance;
+}
+int forever(int a) {
+    while (1) {
+        a = a + 1;
+    }
+    return a;
+}
+int nothing(int a) {
+    a = a + 1;
+}
+"""
+
+class ExecutionEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.engines = [execution_engine.compile_and_load(CODE),execution_engine.compile_and_load(CODE,True)]
+    def test_arithmetic_is_c_arithmetic(self):
+        for engine in self.engines:
+            for a, b in ((7,2),(-7,2),(7,-2),(-7,-2)):
+                self.assertEqual(engine.call("quotient",a,b),int(float(a)/b))
+                self.assertEqual(engine.call("remainder",a,b),a-b*int(float(a)/b))
+            self.assertEqual(engine.call("to_char",300),44)
+            self.assertEqual(engine.call("to_char",200),-56)
+            self.assertEqual(engine.call("overflow",1),-2147483648)
+    def test_loops_and_calls(self):
+        for engine in self.engines:
+            self.assertEqual([engine.call("factorial",n) for n in range(6)],[1,1,2,6,24,120])
+            self.assertEqual([engine.call("fibonacci",n) for n in range(10)],[0,1,1,2,3,5,8,13,21,34])
+    def test_structs_in_memory(self):
+        for engine in self.engines:
+            first = engine.allocate("account")
+            second = engine.allocate("account")
+            engine.store_field(first,"account","balance",10)
+            engine.store_field(first,"account","next",second)
+            engine.store_field(second,"account","balance",32)
+            engine.store_field(second,"account","next",0)
+            self.assertEqual(engine.call("total",first),42)
+            self.assertEqual(engine.call("deposit",second,8),40)
+            self.assertEqual(engine.fetch_field(second,"account","balance"),40)
+            self.assertEqual(engine.call("total",first),50)
+    def test_errors(self):
+        engine = execution_engine.compile_and_load(CODE,step_limit=1000)
+        self.assertRaises(ExecutionError,engine.call,"quotient",1,0)
+        self.assertRaises(ExecutionError,engine.call,"quotient",1)
+        self.assertRaises(ExecutionError,engine.call,"forever",0)
+        self.assertRaises(ExecutionError,engine.call,"total",12345678)
+        self.assertRaises(ExecutionError,engine.call,"account")
+        self.assertEqual(engine.call("nothing",1),None)
+    def test_the_report_counts_instructions(self):
+        engine = self.engines[0]
+        engine.call("fibonacci",5)
+        report = engine.report()
+        self.assertEqual(report["instructions"],report["functions"]["fibonacci"])
+        self.assertTrue(report["instructions"] > 15)
+
+if __name__ == "__main__":
+    unittest.main()
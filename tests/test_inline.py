@@ -0,0 +1,112 @@
+import unittest
+
+import execution_engine
+import optimize
+from inline import falls_off_the_end
+
+BRANCHING_CALLEES = """
+int pick(int c) {
+    int r;
+    if (c < 3) {
+        r = c + 1;
+    } else {
+        r = 8;
+    }
+    return r;
+}
+int through(int x) {
+    int y;
+    y = pick(x);
+    return y;
+}
+int late(int c) {
+    int r;
+    if (c > 4) {
+        r = c + 8;
+    } else {
+        r = 10;
+    }
+    return r;
+}
+int twice(int x) {
+    return late(x) + late(x + 1);
+}
+int early(int x) {
+    if (x < 3) {
+        return x + 1;
+    }
+    return 8;
+}
+int loop(int n) {
+    int i;
+    int total;
+    total = 0;
+    for (i = 0; i < n; i++) {
+        total = total + early(i) + pick(i);
+    }
+    return total;
+}
+int fact(int n) {
+    if (n <= 1) {
+        return 1;
+    }
+    return n * fact(n - 1);
+}
+int uses_fact(int n) {
+    return fact(n) + early(n);
+}
+"""
+
+def results(code,optimized,calls):
+    engine = execution_engine.compile_and_load(code,optimized,step_limit=100000)
+    return [engine.call(name,*arguments) for name, arguments in calls]
+
+class InliningTest(unittest.TestCase):
+    calls = [(name,(x,)) for name in ("through","twice","loop","uses_fact") for x in range(-2,9)]
+    def test_optimized_matches_unoptimized(self):
+        self.assertEqual(results(BRANCHING_CALLEES,True,self.calls),results(BRANCHING_CALLEES,False,self.calls))
+    def test_calls_are_inlined(self):
+        engine = execution_engine.compile_and_load(BRANCHING_CALLEES,True)
+        operations = [instruction[1] for instruction in engine.symbol_table.function("through")["{}"]]
+        self.assertNotIn("call",operations)
+    def test_recursion_is_not_inlined_into_itself(self):
+        engine = execution_engine.compile_and_load(BRANCHING_CALLEES,True)
+        calls = [instruction[3] for instruction in engine.symbol_table.function("fact")["{}"] if instruction[1] == "call"]
+        self.assertEqual(calls,["fact"])
+    def test_inlining_can_be_disabled(self):
+        engine = execution_engine.compile_and_load(BRANCHING_CALLEES)
+        pass_manager = optimize.PassManager()
+        pass_manager.disable("inlining")
+        pass_manager.run_on_symbol_table(engine.symbol_table)
+        operations = [instruction[1] for instruction in engine.symbol_table.function("through")["{}"]]
+        self.assertIn("call",operations)
+        self.assertEqual([engine.call("through",x) for x in range(6)],[1,2,3,8,8,8])
+    def test_only_a_reachable_end_falls_off(self):
+        self.assertFalse(falls_off_the_end([(None,"return","a","","")]))
+        self.assertTrue(falls_off_the_end([(None,"conditional_branch","L0","a",""),
+                                           (None,"return","b","",""),
+                                           ("L0","","","","")])) # a trailing if with no else
+        self.assertFalse(falls_off_the_end([(None,"conditional_branch","L0","a",""),
+                                            (None,"return","b","",""),
+                                            ("L0","return","a","",""),
+                                            ("L1","","","","")])) # nothing branches to L1
+        self.assertTrue(falls_off_the_end([(None,"=","b","a","")]))
+    def test_a_callee_that_can_fall_off_the_end(self):
+        code = """
+int positive(int c) {
+    if (c > 0) {
+        return 1;
+    }
+}
+int uses(int c) {
+    return positive(c) + 2;
+}
+"""
+        engine = execution_engine.compile_and_load(code,True)
+        scope = engine.symbol_table.function("uses")
+        self.assertNotIn("call",[instruction[1] for instruction in scope["{}"]])
+        self.assertIn("0",[instruction[3] for instruction in scope["{}"] if instruction[1] == "="])
+        self.assertEqual(engine.call("uses",5),3)
+
+if __name__ == "__main__":
+    unittest.main()
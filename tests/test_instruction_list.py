@@ -0,0 +1,49 @@
+import cPickle
+import unittest
+from StringIO import StringIO
+
+import mk3ac
+from ir import InstructionList, OperandTable
+
+CODE = [
+    (None,"=","a","1",""),
+    (None,"+","L0","a","b"),
+    ("L1","","","",""),
+    (None,"conditional_branch","L1","L0",""),
+    (None,"return","L0","",""),
+]
+
+class InstructionListTest(unittest.TestCase):
+    def test_it_reads_back_as_tuples(self):
+        code = InstructionList(CODE)
+        self.assertEqual(len(code),len(CODE))
+        self.assertEqual(list(code),CODE)
+        self.assertEqual(code.tolist(),CODE)
+        self.assertEqual(code[1],CODE[1])
+        self.assertEqual(code[-1],CODE[-1])
+        self.assertEqual(code[1:4],CODE[1:4])
+        self.assertRaises(IndexError,lambda: code[len(CODE)])
+        self.assertRaises(IndexError,lambda: code[-len(CODE)-1])
+    def test_it_compares_like_a_list(self):
+        code = InstructionList(CODE)
+        self.assertTrue(code == CODE)
+        self.assertTrue(code == InstructionList(CODE))
+        self.assertTrue(code != CODE[:-1])
+        self.assertFalse(code == CODE[:-1]+[(None,"return","a","","")])
+    def test_operands_are_shared(self):
+        operands = OperandTable()
+        first = InstructionList(CODE[:2],operands)
+        second = InstructionList(CODE[2:],operands)
+        self.assertIs(first.operands,second.operands)
+        self.assertIs(first[1][2],second[2][2]) # both L0
+    def test_it_can_be_pickled(self):
+        code = InstructionList(CODE)
+        self.assertEqual(cPickle.loads(cPickle.dumps(code,cPickle.HIGHEST_PROTOCOL)),CODE)
+    def test_the_code_generator_fills_one_in(self):
+        st = mk3ac.compile_code("int f(int a) { return a + 1; }",mk3ac.new_parser(),StringIO())
+        code = st.function("f")["{}"]
+        self.assertTrue(isinstance(code,InstructionList))
+        self.assertEqual(code[-1][1],"return")
+
+if __name__ == "__main__":
+    unittest.main()
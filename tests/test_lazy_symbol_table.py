@@ -0,0 +1,67 @@
+import unittest
+from StringIO import StringIO
+
+import mk3ac
+import mksymtab
+
+CODE = """
+typedef struct point { int x; int y; } point;
+int g;
+int * y_of(point * p) {
+    return &(p->y);
+}
+int twice(int a) {
+    int b;
+    b = a + a;
+    return b;
+}
+int sum(int n) {
+    int i;
+    int total;
+    total = 0;
+    for (i = 0; i < n; i++) {
+        total = total + twice(i);
+    }
+    return total;
+}
+"""
+
+def symbol_table(lazy):
+    parsed_code = mk3ac.new_parser().parse(CODE)
+    return mksymtab.makeSymbolTable(parsed_code,lazy=lazy,generator=mk3ac.generate_function)
+
+class LazySymbolTableTest(unittest.TestCase):
+    def test_only_what_is_asked_for_is_built(self):
+        st = symbol_table(True)
+        self.assertEqual(sorted(st.builder.unvisited),["sum","twice","y_of"])
+        self.assertEqual(st.values.values["twice"]["..."],[("a","int")])
+        self.assertNotIn("b",st.values.values["twice"])
+        scope = st.function("twice")
+        self.assertEqual(scope["b"],"int")
+        self.assertEqual(sorted(st.builder.unvisited),["sum","y_of"])
+        self.assertEqual(st.return_type_of("y_of"),("","int"))
+    def test_a_lazy_table_ends_up_like_an_eager_one(self):
+        eager = symbol_table(False)
+        mk3ac.generate_code(eager)
+        lazy = symbol_table(True)
+        functions = dict(lazy.functions())
+        self.assertEqual(lazy.builder.unvisited,{})
+        self.assertEqual(sorted(functions),["sum","twice","y_of"])
+        for name in functions:
+            self.assertEqual(list(lazy.function(name)["{}"]),list(eager.function(name)["{}"]))
+    def test_released_functions_keep_their_signature(self):
+        st = symbol_table(True)
+        st.function("twice")
+        st.release("twice")
+        self.assertEqual(st.values.values["twice"],{"...": [("a","int")],"return": "int"})
+        self.assertEqual(st.return_type_of("twice"),"int")
+        self.assertRaises(AssertionError,st.function,"twice")
+    def test_the_command_line_asks_for_one_function(self):
+        out = StringIO()
+        st = mk3ac.compile_code(CODE,mk3ac.new_parser(),out,function_names=["sum"])
+        self.assertEqual(sorted(st.builder.unvisited),["twice","y_of"])
+        self.assertIn("'sum'",out.getvalue())
+        self.assertNotIn("'b': 'int'",out.getvalue())
+
+if __name__ == "__main__":
+    unittest.main()
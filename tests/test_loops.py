@@ -0,0 +1,102 @@
+import unittest
+from StringIO import StringIO
+
+import execution_engine
+import loops
+import mk3ac
+from cfg import ControlFlowGraph
+
+CODE = """
+int scaled(int n, int k) {
+    int i;
+    int total;
+    int m;
+    total = 0;
+    for (i = 0; i < n; i++) {
+        m = k * 7;
+        total = total + i * m;
+    }
+    return total;
+}
+int nested(int n, int k) {
+    int i;
+    int j;
+    int total;
+    total = 0;
+    for (i = 0; i < n; i++) {
+        j = 0;
+        while (j < i) {
+            total = total + j * 3 + k / 2;
+            j = j + 1;
+        }
+    }
+    return total;
+}
+int countdown(int n, int k) {
+    int seen;
+    seen = 0;
+    while (n > 0) {
+        n = n - 2;
+        seen = seen + n * k;
+    }
+    return seen;
+}
+int divides(int n, int k) {
+    int i;
+    int q;
+    q = 0;
+    for (i = 0; i < n; i++) {
+        q = 100 / k;
+    }
+    return q;
+}
+"""
+
+EXPECTED = {
+    "scaled": lambda n, k: sum(i*k*7 for i in range(n)),
+    "nested": lambda n, k: sum(j*3 + int(float(k)/2) for i in range(n) for j in range(i)),
+    "countdown": lambda n, k: sum(m*k for m in range(n-2,-2,-2)) if n > 0 else 0,
+    "divides": lambda n, k: int(100.0/k) if n > 0 else 0,
+}
+
+def optimized_code(name):
+    st = mk3ac.compile_code(CODE,mk3ac.new_parser(),StringIO(),optimize=True,function_names=[name])
+    return list(st.function(name)["{}"])
+
+class LoopTest(unittest.TestCase):
+    def test_natural_loops_innermost_first(self):
+        st = mk3ac.compile_code(CODE,mk3ac.new_parser(),StringIO(),function_names=["nested"])
+        graph = ControlFlowGraph(st.function("nested")["{}"])
+        found = loops.natural_loops(graph)
+        self.assertEqual(len(found),2)
+        self.assertTrue(found[0].blocks < found[1].blocks)
+        for loop in found:
+            self.assertEqual(len(loop.latches),1)
+            self.assertTrue(loop.exits)
+    def test_invariants_leave_the_loop_and_multiplications_become_additions(self):
+        code = optimized_code("scaled")
+        top = [index for index, instruction in enumerate(code) if instruction[1] == "unconditional_branch"][0]
+        self.assertIn((None,"*","L4","7","k"),code[:top])
+        self.assertEqual([instruction for instruction in code[top:] if instruction[1] == "*"],[])
+    def test_rotated_loops_test_at_the_bottom(self):
+        code = optimized_code("scaled")
+        self.assertEqual([instruction[1] for instruction in code if instruction[1] in ("conditional_branch","unconditional_branch")],
+                         ["unconditional_branch","conditional_branch"])
+        self.assertEqual(code[-2][1],"conditional_branch")
+    def test_a_division_that_might_fail_stays_in_the_loop(self):
+        code = optimized_code("divides")
+        division = [index for index, instruction in enumerate(code) if instruction[1] == "/"][0]
+        entry = [index for index, instruction in enumerate(code) if instruction[1] == "unconditional_branch"][0]
+        self.assertTrue(division > entry)
+        engine = execution_engine.compile_and_load(CODE,True)
+        self.assertEqual(engine.call("divides",0,0),0)
+    def test_loops_give_the_same_answers_optimized(self):
+        plain = execution_engine.compile_and_load(CODE)
+        optimized = execution_engine.compile_and_load(CODE,True)
+        for name, expected in EXPECTED.items():
+            for n, k in ((0,3),(1,3),(5,-4),(8,7)):
+                self.assertEqual(plain.call(name,n,k),expected(n,k),(name,n,k))
+                self.assertEqual(optimized.call(name,n,k),expected(n,k),(name,n,k))
+
+if __name__ == "__main__":
+    unittest.main()
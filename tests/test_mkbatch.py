@@ -0,0 +1,112 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import mkbatch
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+GOOD = "int f(int a) { return a + 1; }\nint g(int b) { return b * 2; }\n"
+BAD = "int f(int a) { return a + ; }\n"
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.compile_file = mkbatch.compile_file
+    def tearDown(self):
+        mkbatch.compile_file = self.compile_file
+        shutil.rmtree(self.directory)
+    def source(self,name,code):
+        path = os.path.join(self.directory,name)
+        with open(path,"w") as source:
+            source.write(code)
+        return path
+    def batch(self,paths,jobs,timeout=mkbatch.DEFAULT_TIMEOUT):
+        records = []
+        failures = mkbatch.compile_batch(paths,records.append,jobs,timeout)
+        return failures, records
+    def statuses(self,records):
+        return sorted((record["file"],record["status"]) for record in records if "status" in record)
+    def test_every_file_gets_a_status(self):
+        good = self.source("good.c",GOOD)
+        bad = self.source("bad.c",BAD)
+        missing = os.path.join(self.directory,"missing.c")
+        for jobs in (1,2):
+            failures, records = self.batch([good,bad,missing],jobs)
+            self.assertEqual(failures,2)
+            self.assertEqual(self.statuses(records),sorted([(good,"ok"),(bad,"error"),(missing,"error")]))
+            self.assertEqual(sorted(record["function"] for record in records if "function" in record),["f","g"])
+    def test_a_file_named_twice_is_compiled_twice(self):
+        good = self.source("good.c",GOOD)
+        failures, records = self.batch([good,good,good],2)
+        self.assertEqual(failures,0)
+        self.assertEqual(self.statuses(records),[(good,"ok")]*3)
+    def test_a_worker_that_dies_is_a_failure(self):
+        good = self.source("good.c",GOOD)
+        crash = self.source("crash.c",GOOD)
+        def compile_file(path):
+            if path == crash:
+                os._exit(1) # as a segfault or the OOM killer would
+            return self.compile_file(path)
+        mkbatch.compile_file = compile_file # the workers are forked, so they see this
+        failures, records = self.batch([crash,good],2)
+        self.assertEqual(failures,1)
+        self.assertEqual(self.statuses(records),sorted([(good,"ok"),(crash,"error")]))
+    def test_a_file_that_takes_too_long_is_a_failure(self):
+        good = self.source("good.c",GOOD)
+        slow = self.source("slow.c",GOOD)
+        def compile_file(path):
+            if path == slow:
+                time.sleep(60)
+            return self.compile_file(path)
+        mkbatch.compile_file = compile_file
+        started = time.time()
+        failures, records = self.batch([slow,good],2,timeout=1)
+        self.assertTrue(time.time() - started < 30)
+        self.assertEqual(failures,1)
+        self.assertEqual(self.statuses(records),sorted([(good,"ok"),(slow,"error")]))
+    def test_what_a_file_sends_after_it_was_given_up_on_is_dropped(self):
+        late = self.source("late.c",GOOD)
+        quick = [self.source("quick%d.c" % i,GOOD) for i in range(8)]
+        def compile_file(path):
+            time.sleep(2.5 if path == late else 0.5) # the quick files keep the batch going past when late reports
+            for record in self.compile_file(path):
+                yield record
+        mkbatch.compile_file = compile_file
+        failures, records = self.batch([late]+quick,2,timeout=1.5)
+        self.assertEqual(failures,1)
+        self.assertEqual(self.statuses(records),sorted([(late,"error")]+[(path,"ok") for path in quick]))
+        self.assertEqual([record for record in records if record["file"] == late and "function" in record],[])
+    def test_a_stuck_file_is_noticed_while_others_keep_reporting(self):
+        stuck = self.source("stuck.c",GOOD)
+        chatty = [self.source("chatty%d.c" % i,GOOD) for i in range(6)]
+        def compile_file(path):
+            if path == stuck:
+                time.sleep(60)
+            for i in range(15): # a record every 0.05 seconds, so the queue is never quiet for long
+                time.sleep(0.05)
+                yield {"file": path,"function": "f%d" % i}
+            yield {"file": path,"status": "ok"}
+        mkbatch.compile_file = compile_file
+        failures, records = self.batch([stuck]+chatty,2,timeout=1.5)
+        self.assertEqual(failures,1)
+        statuses = [record["file"] for record in records if "status" in record]
+        self.assertEqual(sorted(statuses),sorted([stuck]+chatty))
+        self.assertNotEqual(statuses[-1],stuck)
+    def test_a_missing_manifest_is_a_failure_record(self):
+        good = self.source("good.c",GOOD)
+        manifest = os.path.join(self.directory,"missing.list")
+        process = subprocess.Popen([sys.executable,os.path.join(ROOT,"mkbatch.py"),manifest,good],
+                                   stdout=subprocess.PIPE,cwd=ROOT)
+        out, errors = process.communicate()
+        self.assertEqual(process.returncode,1)
+        records = [json.loads(line) for line in out.splitlines()]
+        self.assertEqual(self.statuses(records),sorted([(good,"ok"),(manifest,"error")]))
+
+if __name__ == "__main__":
+    unittest.main()
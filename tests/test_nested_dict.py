@@ -0,0 +1,62 @@
+import unittest
+
+import mksymtab
+
+def walked(table):
+    """
+        the scope the path names, found the slow way from the root
+    """
+    node = table.values
+    for name in table.path:
+        node = node[name]
+    return node
+
+class NestedDictTest(unittest.TestCase):
+    def setUp(self):
+        self.table = mksymtab.NestedDict()
+        self.table.values.update({"f": {"a": "int","inner": {"b": "char"}},"g": {"c": "long"},"x": "int"})
+    def test_entering_and_leaving_scopes(self):
+        table = self.table
+        table.path.append("f")
+        self.assertEqual(table["a"],"int")
+        table.path.append("inner")
+        self.assertTrue("b" in table)
+        self.assertFalse("a" in table)
+        del table.path[-1]
+        self.assertIs(table.current_node(),table.values["f"])
+        table.path.pop()
+        self.assertEqual(table["x"],"int")
+    def test_any_change_to_the_path_keeps_the_chain_in_step(self):
+        table = self.table
+        path = table.path
+        def check():
+            self.assertIs(table.current_node(),walked(table))
+            self.assertEqual(len(table.scopes),len(path)+1)
+        path.extend(["f","inner"])
+        check()
+        path[0:2] = ["g"]
+        check()
+        path[0] = "f"
+        check()
+        path.insert(1,"inner")
+        check()
+        del path[0:2]
+        check()
+        path += ["f","inner"]
+        check()
+        path.remove("inner")
+        check()
+        path.pop(0)
+        check()
+    def test_setting_the_path(self):
+        table = self.table
+        table.path = ["f","inner"]
+        self.assertEqual(table["b"],"char")
+        table.insert("d","int")
+        table["e"] = "short"
+        self.assertEqual(table.values["f"]["inner"],{"b": "char","d": "int","e": "short"})
+        table.path = []
+        self.assertIs(table.current_node(),table.values)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+from StringIO import StringIO
+
+import mk3ac
+
+CODE = """
+typedef struct point { int x; int y; } point;
+int g;
+int sum(int n) {
+    int i;
+    int total;
+    total = 0;
+    for (i = 0; i < n; i++) {
+        total = total + i;
+    }
+    return total;
+}
+int * y_of(point * p) {
+    return &(p->y);
+}
+int pick(int a, int b) {
+    if (a < b) {
+        g = a;
+    } else {
+        g = b;
+    }
+    return g * 2 + a * b;
+}
+"""
+
+def compiled(jobs,**options):
+    out = StringIO()
+    st = mk3ac.compile_code(CODE,mk3ac.new_parser(),out,jobs,**options)
+    return out.getvalue(), dict((name,list(st.function(name)["{}"])) for name, value in st.functions())
+
+class ParallelCodeGenerationTest(unittest.TestCase):
+    def test_more_jobs_give_the_same_output(self):
+        serial = compiled(1)
+        for jobs in (2,3,8):
+            self.assertEqual(compiled(jobs),serial)
+    def test_more_jobs_optimize_the_same(self):
+        self.assertEqual(compiled(3,optimize=True),compiled(1,optimize=True))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import pprint
+import unittest
+from StringIO import StringIO
+
+import mk3ac
+import mksymtab
+import optimize
+import streaming
+from ir import printable
+
+CODE = """
+int g;
+int square(int x) {
+    int a;
+    int b;
+    a = 2 + 3;
+    b = a;
+    return x * x + b;
+}
+int loop(int n) {
+    int i;
+    int total;
+    total = 0;
+    for (i = 0; i < n; i++) {
+        total = total + i * 4;
+    }
+    return total;
+}
+"""
+
+ALL_PASSES = [the_pass.name for the_pass in optimize.PassManager().passes+optimize.PassManager().final_passes
+              +optimize.PassManager().interprocedural_passes]
+
+def compiled(function_names=None,optimized=True,disabled_passes=()):
+    return mk3ac.compile_code(CODE,mk3ac.new_parser(),StringIO(),optimize=optimized,disabled_passes=disabled_passes,
+                              function_names=function_names)
+
+class PassManagerTest(unittest.TestCase):
+    def test_one_function_is_optimized_as_in_the_whole_file(self):
+        whole = compiled()
+        alone = compiled(["loop"])
+        self.assertEqual(list(alone.function("loop")["{}"]),list(whole.function("loop")["{}"]))
+    def test_disabling_every_pass_leaves_the_code_alone(self):
+        plain = compiled(optimized=False)
+        disabled = compiled(disabled_passes=ALL_PASSES)
+        for name in ("square","loop"):
+            self.assertEqual(list(disabled.function(name)["{}"]),list(plain.function(name)["{}"]))
+    def test_streaming_optimizes_like_compile_code(self):
+        out = StringIO()
+        streaming.compile_streaming(CODE,mk3ac.new_parser(streaming.IncrementalCParser),out,optimize=True)
+        whole = compiled()
+        for name in ("square","loop"):
+            self.assertIn(pprint.pformat({name: printable(whole.function(name))}),out.getvalue())
+    def test_a_table_without_a_generator_can_not_generate_code(self):
+        parsed_code = mk3ac.new_parser().parse(CODE)
+        st = mksymtab.makeSymbolTable(parsed_code,lazy=True)
+        self.assertRaises(AssertionError,st.function,"square")
+        st = mksymtab.makeSymbolTable(parsed_code,lazy=True,generator=mk3ac.generate_function)
+        self.assertEqual(st.function("square")["{}"][-1][1],"return")
+
+if __name__ == "__main__":
+    unittest.main()
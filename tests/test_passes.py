@@ -0,0 +1,88 @@
+import unittest
+
+import execution_engine
+import optimize
+
+CODE = """
+int g;
+int straight(int a) {
+    int b;
+    int c;
+    int unused;
+    b = 2 + 3;
+    c = b;
+    unused = a * 7;
+    return a + c;
+}
+int branches(int a) {
+    int b;
+    b = 1;
+    if (a > 0) {
+        b = a;
+    }
+    return b + 1;
+}
+int globals(int a) {
+    int b;
+    b = a * 2;
+    g = b;
+    return g;
+}
+int constant_branch(int a) {
+    if (1 < 2) {
+        return a;
+    }
+    return 0 - a;
+}
+"""
+
+EXPECTED = {
+    "straight": lambda a: a + 5,
+    "branches": lambda a: (a if a > 0 else 1) + 1,
+    "globals": lambda a: a * 2,
+    "constant_branch": lambda a: a,
+}
+
+class PassTest(unittest.TestCase):
+    def test_copy_propagation_stops_at_labels(self):
+        code = [(None,"=","b","1",""),
+                ("L0","","","",""),
+                (None,"+","c","b","b"),
+                (None,"return","c","","")]
+        self.assertEqual(optimize.CopyPropagation().run(code,{"b": "int","c": "int"})[2],(None,"+","c","b","b"))
+        self.assertEqual(optimize.CopyPropagation().run(code[:1]+code[2:],{"b": "int","c": "int"})[1],(None,"+","c","1","1"))
+    def test_copy_propagation_leaves_names_whose_address_is_taken(self):
+        code = [(None,"=","b","1",""),
+                (None,"&","p","b",""),
+                (None,"return","b","","")]
+        self.assertEqual(optimize.CopyPropagation().run(code,{"b": "int","p": ("","int")}),code)
+    def test_copies_into_a_narrower_name_are_wrapped_or_kept(self):
+        code = [(None,"=","c","a",""),
+                (None,"return","c","","")]
+        self.assertEqual(optimize.CopyPropagation().run(code,{"a": "int","c": "char"}),code)
+        code = [(None,"=","c","300",""),
+                (None,"return","c","","")]
+        self.assertEqual(optimize.CopyPropagation().run(code,{"c": "char"})[1],(None,"return","44","",""))
+    def test_dead_code_keeps_globals_and_labels(self):
+        code = [("L0","=","t","1",""),
+                (None,"=","g","2",""),
+                (None,"return","","","")]
+        self.assertEqual(optimize.DeadCodeElimination().run(code,{"t": "int"}),
+                         [("L0","","","",""),(None,"=","g","2",""),(None,"return","","","")])
+    def test_branches_on_constants_go_away(self):
+        code = [(None,"conditional_branch","L0","1",""),
+                ("L1","conditional_branch","L0","0",""),
+                (None,"conditional_branch","L0","0","")]
+        self.assertEqual(optimize.ConstantFolding().run(code,{}),
+                         [(None,"unconditional_branch","L0","",""),("L1","","","","")])
+    def test_optimized_code_gives_the_same_answers(self):
+        plain = execution_engine.compile_and_load(CODE)
+        optimized = execution_engine.compile_and_load(CODE,True)
+        for name, expected in EXPECTED.items():
+            for argument in (-2,0,3):
+                self.assertEqual(plain.call(name,argument),expected(argument),name)
+                self.assertEqual(optimized.call(name,argument),expected(argument),name)
+        self.assertTrue(len(optimized.symbol_table.function("straight")["{}"]) < len(plain.symbol_table.function("straight")["{}"]))
+
+if __name__ == "__main__":
+    unittest.main()
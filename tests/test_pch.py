@@ -0,0 +1,88 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from distutils.spawn import find_executable
+
+import binary_format
+import compile_cache
+import mk3ac
+import pch
+from ir import printable
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEADER = """
+typedef struct point { int x; int y; } point;
+#define SCALE 3
+"""
+
+CODE = """#include "shapes.h"
+int * y_of(point * p) {
+    return &(p->y);
+}
+int scaled(int a) {
+    return a * SCALE;
+}
+"""
+
+def command_line(*arguments):
+    process = subprocess.Popen([sys.executable,os.path.join(ROOT,"mk3ac.py")]+list(arguments),
+                               stdout=subprocess.PIPE,stderr=subprocess.PIPE,cwd=ROOT)
+    out, errors = process.communicate()
+    return process.returncode, out
+
+@unittest.skipUnless(find_executable(pch.CPP),"needs the C preprocessor")
+class PrecompiledHeaderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.include = os.path.join(self.directory,"include")
+        os.mkdir(self.include)
+        self.header = os.path.join(self.include,"shapes.h")
+        with open(self.header,"w") as header:
+            header.write(HEADER)
+        self.cpp_args = ["-I"+self.include]
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    def compile(self,code=CODE):
+        cache = compile_cache.CompileCache(os.path.join(self.directory,"cache"))
+        parsed_code, st = pch.compile_with_header(code,cache,self.cpp_args)
+        mk3ac.generate_code(st)
+        return cache, st
+    def test_the_header_is_parsed_once(self):
+        first_cache, first = self.compile()
+        self.assertEqual((first_cache.hits,first_cache.misses),(0,1))
+        second_cache, second = self.compile()
+        self.assertEqual((second_cache.hits,second_cache.misses),(1,0))
+        self.assertEqual(printable(second.values.values),printable(first.values.values))
+    def test_it_compiles_like_the_preprocessed_file(self):
+        cache, st = self.compile()
+        expected = mk3ac.compile_code(pch.preprocess(CODE,self.cpp_args),mk3ac.new_parser(),open(os.devnull,"w"))
+        for name in ("y_of","scaled"):
+            self.assertEqual(list(st.function(name)["{}"]),list(expected.function(name)["{}"]))
+    def test_a_changed_header_is_parsed_again(self):
+        self.compile()
+        with open(self.header,"w") as header:
+            header.write(HEADER.replace("SCALE 3","SCALE 5"))
+        cache, st = self.compile()
+        self.assertIn((None,"*","L0","5","a"),list(st.function("scaled")["{}"]))
+    def test_the_command_line_writes_binaries(self):
+        path = os.path.join(self.directory,"tables")
+        cache = os.path.join(self.directory,"cache")
+        for attempt in range(2): # a miss and then a hit
+            status, out = command_line("--pch",cache,"-I",self.include,"-O","--binary",path,CODE)
+            self.assertEqual(status,0)
+            tables = binary_format.MappedTables(path)
+            try:
+                self.assertEqual(sorted(tables.function_names()),["scaled","y_of"])
+            finally:
+                tables.close()
+            os.remove(path)
+    def test_the_command_line_rejects_profiling(self):
+        status, out = command_line("--pch",os.path.join(self.directory,"cache"),"--profile","-",CODE)
+        self.assertEqual(status,2)
+
+if __name__ == "__main__":
+    unittest.main()
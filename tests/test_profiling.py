@@ -0,0 +1,59 @@
+import json
+import unittest
+from StringIO import StringIO
+
+import mk3ac
+import mksymtab
+import profiling
+
+CODE = """
+int twice(int a) {
+    int b;
+    b = a + a;
+    return b;
+}
+int sum(int n) {
+    int i;
+    int total;
+    total = 0;
+    for (i = 0; i < n; i++) {
+        total = total + twice(i);
+    }
+    return total;
+}
+"""
+
+def compiled(profiler=None):
+    out = StringIO()
+    st = mk3ac.compile_code(CODE,mk3ac.new_parser(),out,profiler=profiler)
+    return out.getvalue(), st
+
+class ProfilingTest(unittest.TestCase):
+    def test_profiling_does_not_change_the_output(self):
+        self.assertEqual(compiled(profiling.Profiler())[0],compiled()[0])
+    def test_the_report_covers_every_phase_and_function(self):
+        profiler = profiling.Profiler()
+        out, st = compiled(profiler)
+        report = json.loads(json.dumps(profiler.report()))
+        self.assertTrue(set(["parse","symbol_table","codegen"]) <= set(report["phases"]))
+        for name in ("twice","sum"):
+            self.assertEqual(report["functions"][name]["instructions"],len(st.function(name)["{}"]))
+        self.assertEqual(report["functions"]["twice"]["temporaries"],1)
+        for kind in ("SymbolTableBuilder","CodeBuilder"):
+            self.assertIn(kind,report["visitors"])
+        calls = report["visitors"]["CodeBuilder"]["visit_Return"]
+        self.assertEqual(calls["calls"],2)
+        self.assertTrue(0 <= calls["self_seconds"] <= calls["seconds"])
+        self.assertTrue(report["lookups"]["typeof"] > 0)
+    def test_only_instrumented_tables_count(self):
+        profiler = profiling.Profiler()
+        table = mksymtab.NestedDict()
+        profiler.instrument_nested_dict(table,"values")
+        table["a"] = "int"
+        table["a"]
+        "a" in table
+        self.assertEqual(profiler.lookups,{"values in": 1,"values[]": 1,"values[]=": 1})
+        self.assertFalse(isinstance(mksymtab.NestedDict(),profiling.CountingNestedDict))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import platform
+import unittest
+from StringIO import StringIO
+from distutils.spawn import find_executable
+
+import execution_engine
+import mk3ac
+import x86_64_backend
+
+STORES = """
+typedef struct point { int x; int y; char z; } point;
+point origin;
+int through_a_field(int a) {
+    point * p;
+    p = &origin;
+    p->x = a;
+    p->z = a + 1;
+    p->y = p->x * 3;
+    return p->x + p->y;
+}
+int narrow_field(int a) {
+    point * p;
+    p = &origin;
+    p->z = a + 300;
+    p->x = 0;
+    return p->z;
+}
+int through_a_pointer(int a) {
+    int b;
+    int * c;
+    b = 1;
+    c = &b;
+    *c = a;
+    *c = *c + b;
+    return b;
+}
+int either(int a) {
+    int b;
+    int c;
+    int * q;
+    b = 0;
+    c = 0;
+    q = &b;
+    if (a > 2) {
+        q = &c;
+    }
+    *q = a;
+    return b * 10 + c;
+}
+int in_a_loop(int n) {
+    int i;
+    int total;
+    int * q;
+    total = 0;
+    q = &total;
+    for (i = 0; i < n; i++) {
+        *q = *q + i;
+    }
+    return total;
+}
+"""
+
+EXPECTED = {
+    "through_a_field": lambda a: a + 3*a,
+    "narrow_field": lambda a: execution_engine.wrap(a + 300,1),
+    "through_a_pointer": lambda a: 2*a,
+    "either": lambda a: a if a > 2 else 10*a,
+    "in_a_loop": lambda n: sum(range(n)),
+}
+
+ARGUMENTS = [-3,0,1,2,3,7]
+
+def code_of(name):
+    st = mk3ac.compile_code(STORES,mk3ac.new_parser(),StringIO(),function_names=[name])
+    return list(st.function(name)["{}"])
+
+class StoreTest(unittest.TestCase):
+    def test_assignments_through_pointers_store(self):
+        code = code_of("through_a_pointer")
+        self.assertIn((None,"&","L0","b",""),code)
+        self.assertIn((None,"store","","a","c"),code)
+        self.assertEqual([instruction[2] for instruction in code if instruction[1] == "="],["b","c"])
+        code = code_of("narrow_field")
+        self.assertEqual([instruction[3] for instruction in code if instruction[1] == "store"],["L3","0"])
+    def test_the_engine_stores_with_and_without_optimizing(self):
+        for optimized in (False,True):
+            engine = execution_engine.compile_and_load(STORES,optimized)
+            for name, expected in EXPECTED.items():
+                for argument in ARGUMENTS:
+                    self.assertEqual(engine.call(name,argument),expected(argument),(name,argument,optimized))
+    def test_a_struct_pointer_argument(self):
+        code = "typedef struct pair { int a; int b; } pair; int f(struct pair * p, pair * q) { p->a = q->b; return p->a; }"
+        engine = execution_engine.compile_and_load(code)
+        self.assertEqual(engine.symbol_table.function("f")["..."],[("p",("","struct pair")),("q",("","pair"))])
+        p = engine.allocate("pair")
+        q = engine.allocate("pair")
+        engine.store_field(q,"pair","b",42)
+        self.assertEqual(engine.call("f",p,q),42)
+        self.assertEqual(engine.fetch_field(p,"pair","a"),42)
+        st = mk3ac.compile_code("int f(struct s * p) { return 0; }",mk3ac.new_parser(),StringIO())
+        self.assertEqual(st.function("f")["..."],[("p",("","struct s"))])
+    @unittest.skipUnless(platform.machine() == "x86_64" and find_executable("cc"),"needs x86-64 and a C compiler")
+    def test_the_backend_stores_like_the_engine(self):
+        for optimized in (False,True):
+            library = x86_64_backend.NativeLibrary(x86_64_backend.compile_to_assembly(STORES,optimized))
+            try:
+                for name, expected in EXPECTED.items():
+                    for argument in ARGUMENTS:
+                        self.assertEqual(library.call(name,argument),expected(argument),(name,argument,optimized))
+            finally:
+                library.close()
+
+if __name__ == "__main__":
+    unittest.main()
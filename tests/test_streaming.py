@@ -0,0 +1,93 @@
+import ast
+import os
+import pprint
+import subprocess
+import sys
+import unittest
+from StringIO import StringIO
+
+from pycparser.plyparser import ParseError
+
+import mk3ac
+import mksymtab
+import streaming
+from ir import printable
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CODE = """
+typedef struct point { int x; int y; } point;
+int g;
+int twice(int a) {
+    int b;
+    b = a + a;
+    return b;
+}
+point origin;
+int area(point * p) {
+    if (p->x > 0) {
+        return p->x * p->y + twice(g);
+    }
+    return 0;
+}
+int sum(int n) {
+    int i;
+    int total;
+    total = 0;
+    for (i = 0; i < n; i++) {
+        total = total + twice(i);
+    }
+    return total;
+}
+"""
+
+def streamed(code,optimize=False):
+    out = StringIO()
+    st = streaming.compile_streaming(code,mk3ac.new_parser(streaming.IncrementalCParser),out,optimize)
+    return st, ["{"+text+"\n" for text in ("\n"+out.getvalue()).split("\n{")[1:]]
+
+class StreamingTest(unittest.TestCase):
+    def test_chunks_end_where_top_level_declarations_do(self):
+        code = 'int a;\n#line 40 "x.c"\nint f(int b) { char * s; s = "};"; { b = 1; } return b; }\nint c'
+        self.assertEqual(list(streaming.top_level_chunks(code)),
+                         [("int a;",1),('\n#line 40 "x.c"',1),('\nint f(int b) { char * s; s = "};"; { b = 1; } return b; }',2),("\nint c",3)])
+    def test_each_function_comes_out_as_the_whole_file_would_compile_it(self):
+        st, printed = streamed(CODE)
+        eager = mksymtab.makeSymbolTable(mk3ac.new_parser().parse(CODE))
+        mk3ac.generate_code(eager)
+        self.assertEqual(printed[:-1],[pprint.pformat({name: printable(eager.function(name))})+"\n" for name in ("twice","area","sum")])
+        self.assertEqual(ast.literal_eval(printed[-1]),{"area": {"...": [("p",("","point"))],"return": "int"},
+                                                        "g": "int",
+                                                        "origin": "point",
+                                                        "struct point": [("x","int"),("y","int")],
+                                                        "sum": {"...": [("n","int")],"return": "int"},
+                                                        "twice": {"...": [("a","int")],"return": "int"}})
+    def test_functions_are_let_go_once_printed(self):
+        st, printed = streamed(CODE,True)
+        self.assertEqual(st.builder.unvisited,{})
+        for name in ("twice","area","sum"):
+            self.assertNotIn("{}",st.values.values[name])
+        self.assertIn("'twice', 1)",printed[2]) # the call to twice is still there, since nothing gets inlined
+    def test_a_bad_chunk_does_not_spoil_the_ones_after_it(self):
+        cparser = mk3ac.new_parser(streaming.IncrementalCParser)
+        cparser.parse_chunk("typedef int number;")
+        self.assertRaises(ParseError,cparser.parse_chunk,"number f(number a) { { return a +; }",2)
+        chunk = cparser.parse_chunk("number g(number a) { return a; }",3)
+        self.assertEqual(chunk.ext[0].decl.name,"g")
+        self.assertEqual(chunk.ext[0].coord.line,3)
+    def test_the_command_line_streams(self):
+        process = subprocess.Popen([sys.executable,os.path.join(ROOT,"mk3ac.py"),"--stream","-O",CODE],stdout=subprocess.PIPE,cwd=ROOT)
+        out, errors = process.communicate()
+        self.assertEqual(process.returncode,0)
+        self.assertEqual(out,"".join(streamed(CODE,True)[1]).rstrip("\n")+"\n")
+    def test_the_command_line_rejects_what_streaming_can_not_do(self):
+        for option in (["--binary","tables"],["--profile","-"],["--function","sum"],["--jobs","2"],["--layout-report"],
+                       ["--cache","cache"],["--pch","cache"]):
+            process = subprocess.Popen([sys.executable,os.path.join(ROOT,"mk3ac.py"),"--stream"]+option+[CODE],
+                                       stdout=subprocess.PIPE,stderr=subprocess.PIPE,cwd=ROOT)
+            out, errors = process.communicate()
+            self.assertEqual(process.returncode,2,option)
+            self.assertEqual(out,"")
+
+if __name__ == "__main__":
+    unittest.main()
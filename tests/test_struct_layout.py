@@ -0,0 +1,76 @@
+import os
+import subprocess
+import sys
+import unittest
+
+import execution_engine
+import mk3ac
+import mksymtab
+from type_registry import layout_report
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CODE = """
+typedef struct padded {
+    char a;
+    int b;
+    char c;
+    short d;
+    char e;
+} padded;
+typedef struct wide {
+    char tag[60];
+    char name[10];
+    int count;
+} wide;
+int total(padded * p) {
+    p->a = 1;
+    p->b = 1000;
+    p->c = 3;
+    p->d = 300;
+    p->e = 5;
+    return p->b;
+}
+"""
+
+def registry(reorder_fields=False):
+    parsed_code = mk3ac.new_parser().parse(CODE)
+    return mksymtab.makeSymbolTable(parsed_code,reorder_fields=reorder_fields).type_registry
+
+class StructLayoutTest(unittest.TestCase):
+    def test_fields_are_aligned_in_declaration_order(self):
+        padded = registry().get("padded")
+        self.assertEqual(dict((name,offset) for name, (offset, the_type) in padded.offsets.items()),
+                         {"a": 0,"b": 4,"c": 8,"d": 10,"e": 12})
+        self.assertEqual((padded.size,padded.alignment),(16,4))
+        self.assertEqual(padded.holes,[(1,3),(9,1),(13,3)])
+    def test_reordering_packs_by_alignment(self):
+        padded = registry(True).get("padded")
+        self.assertEqual(padded.size,12)
+        self.assertEqual([name for name, (offset, the_type) in padded.elements],["a","b","c","d","e"])
+        offsets = sorted((offset,name) for name, (offset, the_type) in padded.elements)
+        self.assertEqual([name for offset, name in offsets][:2],["b","d"])
+    def test_the_report(self):
+        report = layout_report(registry().get("padded"))
+        self.assertEqual((report["padding"],report["reordered_size"],report["cache_lines"]),(7,12,1))
+        report = layout_report(registry().get("wide"))
+        self.assertEqual(report["straddling"],["name"])
+        self.assertEqual(report["cache_lines"],2)
+    def test_code_reads_and_writes_the_fields_where_they_are(self):
+        for reorder_fields in (False,True):
+            parsed_code = mk3ac.new_parser().parse(CODE)
+            st = mksymtab.makeSymbolTable(parsed_code,lazy=True,reorder_fields=reorder_fields,generator=mk3ac.generate_function)
+            engine = execution_engine.ExecutionEngine(st)
+            p = engine.allocate("padded")
+            self.assertEqual(engine.call("total",p),1000)
+            for field, value in (("a",1),("b",1000),("c",3),("d",300),("e",5)):
+                self.assertEqual(engine.fetch_field(p,"padded",field),value)
+    def test_the_command_line_reports_layouts(self):
+        process = subprocess.Popen([sys.executable,os.path.join(ROOT,"mk3ac.py"),"--layout-report","--reorder-fields",CODE],
+                                   stdout=subprocess.PIPE,cwd=ROOT)
+        out, errors = process.communicate()
+        self.assertEqual(process.returncode,0)
+        self.assertIn("'reordered_size': 12",out)
+
+if __name__ == "__main__":
+    unittest.main()
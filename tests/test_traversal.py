@@ -0,0 +1,67 @@
+import os
+import subprocess
+import sys
+import unittest
+from StringIO import StringIO
+
+import mk3ac
+from compiler_utilities import TagStack, show
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def deep_sum(terms):
+    return "int f(int a) { return " + " + ".join(["a"]*terms) + "; }"
+
+class TraversalTest(unittest.TestCase):
+    def test_show_matches_pycparser(self):
+        parsed_code = mk3ac.new_parser().parse(mk3ac.SAMPLE_CODE)
+        expected = StringIO()
+        parsed_code.show(buf=expected)
+        got = StringIO()
+        show(parsed_code,got)
+        self.assertEqual(got.getvalue(),expected.getvalue())
+    def test_deep_expression_through_compile_code(self):
+        out = StringIO()
+        st = mk3ac.compile_code(deep_sum(5000),mk3ac.new_parser(),out)
+        code = list(st.function("f")["{}"])
+        self.assertEqual(len(code),5000)
+        self.assertEqual(code[-1][1],"return")
+    def test_deep_expression_through_the_command_line(self):
+        process = subprocess.Popen([sys.executable,os.path.join(ROOT,"mk3ac.py"),deep_sum(5000)],
+                                   stdout=subprocess.PIPE,stderr=subprocess.PIPE)
+        output, errors = process.communicate()
+        self.assertEqual(process.returncode,0,errors)
+        self.assertIn("'return'",output)
+
+class TagStackTest(unittest.TestCase):
+    def test_push_and_unpush(self):
+        state = TagStack()
+        self.assertNotIn("lvalue",state)
+        with state.push("lvalue"):
+            self.assertIn("lvalue",state)
+            with state.push("lvalue"):
+                with state.unpush("lvalue"):
+                    self.assertNotIn("lvalue",state)
+                    with state.push("lvalue"):
+                        self.assertIn("lvalue",state)
+                    self.assertNotIn("lvalue",state)
+                self.assertIn("lvalue",state)
+            self.assertIn("lvalue",state)
+        self.assertNotIn("lvalue",state)
+        with state.unpush("lvalue"):
+            with state.push("lvalue"):
+                self.assertIn("lvalue",state)
+        self.assertNotIn("lvalue",state)
+    def test_taking_the_address_of_a_name(self):
+        code = "int g; int f(int a) { int * p; int * q; p = &a; q = &g; return *p + *q; }"
+        scope = mk3ac.compile_code(code,mk3ac.new_parser(),StringIO()).function("f")
+        self.assertEqual(list(scope["{}"])[:4],[(None,"&","L0","a",""),(None,"=","p","L0",""),
+                                                (None,"&","L1","g",""),(None,"=","q","L1","")])
+        self.assertEqual((scope["L0"],scope["L1"]),(("","int"),("","int")))
+    def test_a_struct_declared_in_a_typedef_is_in_its_scope(self):
+        st = mk3ac.compile_code("typedef struct point { int x; int y; } point; point origin;",mk3ac.new_parser(),StringIO())
+        self.assertEqual(st.values.values,{"struct point": [("x","int"),("y","int")],"origin": "point"})
+        self.assertEqual(st.types.values,{"struct point": [("x","int"),("y","int")],"point": "struct point"})
+
+if __name__ == "__main__":
+    unittest.main()
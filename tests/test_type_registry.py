@@ -0,0 +1,48 @@
+import unittest
+
+import mk3ac
+import mksymtab
+
+CODE = """
+typedef struct node {
+    char tag;
+    int value;
+    struct node * next;
+    int items[3];
+} node;
+node head;
+long count;
+"""
+
+def symbol_table(data_model="ILP32"):
+    return mksymtab.makeSymbolTable(mk3ac.new_parser().parse(CODE),data_model=data_model)
+
+class TypeRegistryTest(unittest.TestCase):
+    def test_every_description_of_a_type_is_one_object(self):
+        registry = symbol_table().type_registry
+        self.assertIs(registry.get("node"),registry.get("struct node"))
+        self.assertIs(registry.get(("","node")),registry.get(("","node")))
+        self.assertIs(registry.get(("3","int")).element,registry.get("int"))
+        fields = symbol_table().types.values["struct node"]
+        self.assertIs(registry.get(fields),registry.get(fields))
+        self.assertTrue("node" in registry)
+        self.assertFalse("struct nothing" in registry)
+    def test_sizes_and_offsets(self):
+        for data_model, pointer, size in (("ILP32",4,24),("LP64",8,32)):
+            st = symbol_table(data_model)
+            self.assertEqual(st.sizeof("node"),size)
+            self.assertEqual(st.sizeof("long"),pointer)
+            self.assertEqual(st.sizeof(("","node")),pointer)
+            self.assertEqual(st.field("node","next"),(8,("","struct node")))
+            self.assertEqual(st.field("node","items"),(8+pointer,("3","int")))
+    def test_a_changed_struct_is_laid_out_again_after_invalidate(self):
+        st = symbol_table()
+        registry = st.type_registry
+        self.assertEqual(registry.get("node").size,24)
+        st.types.values["struct node"] = [("tag","char")]
+        self.assertEqual(registry.get("node").size,24) # still the interned layout
+        registry.invalidate()
+        self.assertEqual(registry.get("node").size,1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+
+import execution_engine
+from value_numbering import ValueNumbering
+
+SCOPE = {"a": "int","b": "int","p": ("","int"),"L0": "int","L1": "int","L2": "int","L3": "int"}
+
+def numbered(code,scope=SCOPE):
+    return ValueNumbering().run(code,dict(scope))
+
+CODE = """
+typedef struct pair { int left; int right; } pair;
+pair shared;
+int repeated(int a, int b) {
+    int c;
+    int d;
+    c = a * b + a;
+    d = b * a + a;
+    return c + d;
+}
+int across_a_branch(int a, int b) {
+    int c;
+    c = a + b;
+    if (a > 0) {
+        c = c * 2;
+    }
+    return c + (a + b);
+}
+int through_memory(int a, int b) {
+    pair * p;
+    int before;
+    p = &shared;
+    p->left = a;
+    before = p->left;
+    p->left = a + 1;
+    return before * 10 + p->left + b;
+}
+"""
+
+EXPECTED = {
+    "repeated": lambda a, b: 2*(a*b + a),
+    "across_a_branch": lambda a, b: (2*(a+b) if a > 0 else a+b) + a + b,
+    "through_memory": lambda a, b: a*10 + a + 1 + b,
+}
+
+class ValueNumberingTest(unittest.TestCase):
+    def test_a_repeated_expression_becomes_a_copy(self):
+        code = [(None,"*","L0","b","a"),
+                (None,"*","L1","a","b"),
+                (None,"return","L1","","")]
+        self.assertEqual(numbered(code)[1],(None,"=","L1","L0",""))
+    def test_a_result_wrapped_to_another_size_is_not_reused(self):
+        code = [(None,"*","c","b","a"),
+                (None,"*","L1","b","a"),
+                (None,"return","L1","","")]
+        self.assertEqual(numbered(code,dict(SCOPE,c="char")),code)
+    def test_changing_an_operand_forgets_the_expression(self):
+        code = [(None,"+","L0","b","a"),
+                (None,"=","a","1",""),
+                (None,"+","L1","b","a"),
+                (None,"return","L1","","")]
+        self.assertEqual(numbered(code),code)
+    def test_stores_forget_what_was_read_through_pointers(self):
+        code = [(None,"*","L0","p",""),
+                (None,"store","","a","p"),
+                (None,"*","L1","p",""),
+                (None,"return","L1","","")]
+        self.assertEqual(numbered(code),code)
+    def test_a_loop_changes_what_is_available(self):
+        code = [(None,"+","L0","b","a"),
+                ("L2","+","L1","b","a"),
+                (None,"=","a","L1",""),
+                (None,"conditional_branch","L2","a",""),
+                (None,"return","L1","","")]
+        self.assertEqual(numbered(code),code)
+    def test_numbered_code_gives_the_same_answers(self):
+        plain = execution_engine.compile_and_load(CODE)
+        optimized = execution_engine.compile_and_load(CODE,True)
+        for name, expected in EXPECTED.items():
+            for a, b in ((1,2),(-3,4),(0,0)):
+                self.assertEqual(plain.call(name,a,b),expected(a,b),name)
+                self.assertEqual(optimized.call(name,a,b),expected(a,b),name)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import platform
+import random
+import unittest
+from distutils.spawn import find_executable
+
+import execution_engine
+import x86_64_backend
+
+CODE = """
+typedef struct cell { int value; char flag; struct cell * next; } cell;
+cell first;
+cell second;
+int counter;
+int many(int a, int b, int c, int d, int e, int f, int g, int h) {
+    return a - b + c * d - e + f * g - h;
+}
+int calls(int a, int b) {
+    return many(a, b, a + 1, b + 1, a * 2, b * 2, a - b, 7) + many(b, a, 1, 2, 3, 4, 5, 6);
+}
+int arithmetic(int a, int b) {
+    int q;
+    int r;
+    q = 0;
+    r = 0;
+    if (b != 0) {
+        q = a / b;
+        r = a % b;
+    }
+    return q * 1000 + r * 10 + (a << 3) - (b >> 1) + (a & b) - (a | b) + (a ^ b);
+}
+int compares(int a, int b) {
+    return (a < b) + 2 * (a <= b) + 4 * (a > b) + 8 * (a >= b) + 16 * (a == b) + 32 * (a != b) + 64 * (a && b) + 128 * (!a || b);
+}
+int pressure(int a, int b) {
+    int c;
+    int d;
+    int e;
+    int f;
+    int g;
+    int h;
+    int i;
+    int j;
+    c = a + b;
+    d = a - b;
+    e = a * b;
+    f = c + d;
+    g = d * e;
+    h = e - f;
+    i = f * g;
+    j = g + h;
+    return a + b + c + d + e + f + g + h + i + j + calls(c, d);
+}
+int gcd(int a, int b) {
+    if (b == 0) {
+        return a;
+    }
+    return gcd(b, a % b);
+}
+int linked(int a, int b) {
+    cell * p;
+    int sum;
+    int flag;
+    first.value = a;
+    first.flag = b;
+    first.next = &second;
+    second.value = b;
+    second.flag = a + 200;
+    second.next = 0;
+    sum = 0;
+    p = &first;
+    while (p) {
+        flag = p->flag;
+        sum = sum + p->value * 3 + flag;
+        counter = counter + 1;
+        p = p->next;
+    }
+    return sum;
+}
+"""
+
+NAMES = ["many","calls","arithmetic","compares","pressure","gcd","linked"]
+
+@unittest.skipUnless(platform.machine() == "x86_64" and find_executable("cc"),"needs x86-64 and a C compiler")
+class BackendTest(unittest.TestCase):
+    def test_native_code_agrees_with_the_engine(self):
+        rng = random.Random(3)
+        for optimized in (False,True):
+            engine = execution_engine.compile_and_load(CODE,optimized,data_model="LP64")
+            library = x86_64_backend.NativeLibrary(x86_64_backend.compile_to_assembly(CODE,optimized))
+            try:
+                for name in NAMES:
+                    arity = len(engine.symbol_table.function(name)["..."])
+                    for trial in range(12):
+                        arguments = [rng.randint(-50,50) for i in range(arity)]
+                        if name == "gcd":
+                            arguments = [abs(argument) for argument in arguments]
+                        self.assertEqual(library.call(name,*arguments),engine.call(name,*arguments),(name,arguments,optimized))
+            finally:
+                library.close()
+    def test_the_assembly_is_position_independent(self):
+        assembly = x86_64_backend.compile_to_assembly(CODE,True)
+        self.assertIn("call gcd@PLT",assembly)
+        self.assertIn("counter(%rip)",assembly)
+
+if __name__ == "__main__":
+    unittest.main()
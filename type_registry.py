@@ -0,0 +1,221 @@
+PRIMITIVE_SIZES = {
+    "int": 4,
+    "char": 1, "unsigned char": 1, "signed char": 1,
+    "short": 2, "unsigned short": 2, "signed short": 2,
+    "long": 4, "unsigned long": 4, "signed long": 4,
+}
+PRIMITIVE_TYPE_NAMES = frozenset(PRIMITIVE_SIZES)
+POINTER_SIZE = 4
+CACHE_LINE_SIZE = 64
+
+# what changes between data models: the sizes of pointers and of longs
+DATA_MODELS = {
+    "ILP32": {"pointer": 4,"long": 4},
+    "LP64": {"pointer": 8,"long": 8},
+}
+LONG_TYPE_NAMES = frozenset(["long","unsigned long","signed long"])
+
+class PrimitiveType(object):
+    def __init__(self,name,size):
+        self.name = name
+        self.size = size
+        self.alignment = size
+    def __repr__(self):
+        return "PrimitiveType(%r)" % self.name
+
+class PointerType(object):
+    """
+        target is left as the symbol table describes it, so that a struct can point to itself
+    """
+    def __init__(self,target,size=POINTER_SIZE):
+        self.target = target
+        self.size = size
+        self.alignment = size
+    def __repr__(self):
+        return "PointerType(%r)" % (self.target,)
+
+class ArrayType(object):
+    def __init__(self,length,element):
+        self.length = length
+        self.element = element
+        self.size = length * element.size
+        self.alignment = element.alignment
+    def __repr__(self):
+        return "ArrayType(%r,%r)" % (self.length,self.element)
+
+def place(fields):
+    """
+        lays out (name, description, type) fields in the order given, each at the next offset that is
+        a multiple of its alignment, and rounds the size up to a multiple of the largest alignment
+        so that the next element of an array is aligned too.
+        Returns (size, alignment, name -> (offset, description), [(offset, bytes) of padding])
+    """
+    offsets = {}
+    holes = []
+    offset = 0
+    alignment = 1
+    for item_name, item_type, the_type in fields:
+        padding = -offset % the_type.alignment
+        if padding:
+            holes.append((offset,padding))
+        offset = offset + padding
+        offsets[item_name] = (offset,item_type)
+        offset = offset + the_type.size
+        alignment = max(alignment,the_type.alignment)
+    padding = -offset % alignment
+    if padding:
+        holes.append((offset,padding))
+    return (offset+padding,alignment,offsets,holes)
+
+def by_alignment(fields):
+    """
+        the fields with the most strictly aligned first, which never leaves a hole between them
+        because every size is a multiple of its alignment
+    """
+    return sorted(fields,key=lambda field: -field[2].alignment)
+
+class StructType(object):
+    """
+        fields is the (name, type) list that the symbol table keeps for the struct.
+        The layout is worked out the first time anybody asks for it, because the types of
+        the fields may not all be known while the struct itself is being interned.
+        If the registry reorders fields, they are laid out by alignment instead of in declaration order.
+    """
+    def __init__(self,name,fields,registry):
+        self.name = name
+        self.fields = fields
+        self.registry = registry
+        self._layout = None
+    def typed_fields(self):
+        return [(item_name,item_type,self.registry.get(item_type)) for item_name, item_type in self.fields]
+    def layout(self):
+        if self._layout is None:
+            fields = self.typed_fields()
+            if self.registry.reorder_fields:
+                fields = by_alignment(fields)
+            size, alignment, offsets, holes = place(fields)
+            ordered = [(item_name,offsets[item_name]) for item_name, item_type in self.fields]
+            self._layout = (size,alignment,offsets,ordered,holes)
+        return self._layout
+    @property
+    def size(self):
+        return self.layout()[0]
+    @property
+    def alignment(self):
+        return self.layout()[1]
+    @property
+    def offsets(self):
+        """
+            field name -> (offset, field type)
+        """
+        return self.layout()[2]
+    @property
+    def elements(self):
+        """
+            the same (name, (offset, type)) pairs as offsets, in declaration order
+        """
+        return self.layout()[3]
+    @property
+    def holes(self):
+        """
+            (offset, bytes) for each run of padding, including any at the end
+        """
+        return self.layout()[4]
+    def __repr__(self):
+        return "StructType(%r)" % self.name
+
+PRIMITIVES = dict((name,PrimitiveType(name,size)) for name, size in PRIMITIVE_SIZES.items())
+
+def primitives_for(data_model):
+    sizes = DATA_MODELS[data_model]
+    if sizes["long"] == PRIMITIVE_SIZES["long"]:
+        return PRIMITIVES
+    return dict((name,PrimitiveType(name,sizes["long"] if name in LONG_TYPE_NAMES else size))
+                for name, size in PRIMITIVE_SIZES.items())
+
+class TypeRegistry(object):
+    """
+        Interns the types described by a symbol table's types NestedDict.
+        Every description of a type (a primitive name, a typedef or struct name, a ('',type) pointer,
+        a (dim,type) array or a struct's field list) maps to one type object, so the size,
+        alignment and field offsets of a type are only ever worked out once.
+        With reorder_fields, structs are laid out to waste as little as possible on padding,
+        and everything that asks for a field's offset gets the new one.
+        data_model is one of DATA_MODELS: ILP32, which the compiler has always assumed,
+        or LP64 for targets like x86-64 Linux.
+    """
+    def __init__(self,types,reorder_fields=False,data_model="ILP32"):
+        self.types = types
+        self.reorder_fields = reorder_fields
+        self.data_model = data_model
+        self.primitives = primitives_for(data_model)
+        self.pointer_size = DATA_MODELS[data_model]["pointer"]
+        self.by_name = dict(self.primitives)
+        self.by_description = {}
+        self.by_identity = {}
+    def __contains__(self,description):
+        try:
+            self.get(description)
+        except KeyError:
+            return False
+        return True
+    def get(self,description):
+        if isinstance(description,str):
+            the_type = self.by_name.get(description)
+            if the_type is None:
+                the_type = self.intern_name(description)
+            return the_type
+        if isinstance(description,tuple):
+            the_type = self.by_description.get(description)
+            if the_type is None:
+                dim, of_what = description
+                if dim == '':
+                    the_type = PointerType(of_what,self.pointer_size)
+                else:
+                    the_type = ArrayType(int(dim),self.get(of_what))
+                self.by_description[description] = the_type
+            return the_type
+        if isinstance(description,list):
+            entry = self.by_identity.get(id(description))
+            if entry is None:
+                entry = (description,StructType(None,description,self))
+                self.by_identity[id(description)] = entry
+            return entry[1]
+        raise KeyError(description)
+    def intern_name(self,name):
+        """
+            follows typedefs until it reaches a struct or something that is already interned
+        """
+        the_description = self.types.values[name]
+        if isinstance(the_description,list):
+            the_type = StructType(name,the_description,self)
+        else:
+            the_type = self.get(the_description)
+        self.by_name[name] = the_type
+        return the_type
+    def invalidate(self):
+        """
+            forget everything but the primitives, for when the types table has been changed
+        """
+        self.by_name = dict(self.primitives)
+        self.by_description = {}
+        self.by_identity = {}
+
+def layout_report(the_type,line_size=CACHE_LINE_SIZE):
+    """
+        what a struct's layout costs: its padding, what it would take up with its fields reordered,
+        and which fields straddle a cache line when the struct starts at the start of one
+    """
+    size = the_type.size
+    straddling = []
+    for item_name, (offset, item_type) in sorted(the_type.elements,key=lambda element: element[1][0]):
+        item_size = the_type.registry.get(item_type).size
+        if item_size and offset//line_size != (offset+item_size-1)//line_size:
+            straddling.append(item_name)
+    return {"size": size,
+            "alignment": the_type.alignment,
+            "padding": sum(length for offset, length in the_type.holes),
+            "holes": the_type.holes,
+            "reordered_size": place(by_alignment(the_type.typed_fields()))[0],
+            "cache_lines": (size+line_size-1)//line_size,
+            "straddling": straddling}
@@ -0,0 +1,166 @@
+from collections import defaultdict
+
+from ir import is_constant, constant_value, is_name, is_binary, is_unary, names_defined, address_taken, local_names, \
+    size_of, BINARY_OPERATIONS, UNARY_OPERATIONS, PURE_UNARY_OPERATIONS, BRANCHES
+from cfg import ControlFlowGraph
+
+COMMUTATIVE_OPERATIONS = frozenset(["+","*","==","!=","&","|","^","&&","||"])
+
+def operand_key(operand):
+    if is_constant(operand):
+        return ("constant",constant_value(operand))
+    return operand
+
+def expression_of(instruction):
+    """
+        what an instruction computes, as a key that is the same for every instruction computing the same thing,
+        or None if it is not something that can be reused
+    """
+    label, operation, destination, source1, source2 = instruction
+    if operation == "load":
+        return ("load",operand_key(source1),operand_key(source2))
+    if is_binary(instruction):
+        first, second = operand_key(source1), operand_key(source2)
+        if operation in COMMUTATIVE_OPERATIONS and repr(second) < repr(first):
+            first, second = second, first
+        return (operation,first,second)
+    if is_unary(instruction) and (operation in PURE_UNARY_OPERATIONS or operation == "*"):
+        return (operation,operand_key(source1))
+    return None
+
+def reads_memory(expression):
+    return expression[0] in ("load","*")
+
+class Available(object):
+    """
+        The expressions known to be held in some name, with indexes from each name to the
+        expressions that mention it, and of the ones that read memory, so they can be forgotten quickly.
+    """
+    def __init__(self):
+        self.holders = {}
+        self.mentions = defaultdict(set)
+        self.memory = set()
+    def copy(self):
+        other = Available()
+        for expression, holder in self.holders.items():
+            other.add(expression,holder)
+        return other
+    def add(self,expression,holder):
+        self.holders[expression] = holder
+        self.mentions[holder].add(expression)
+        for operand in expression[1:]:
+            if type(operand) is str:
+                self.mentions[operand].add(expression)
+        if reads_memory(expression):
+            self.memory.add(expression)
+    def remove(self,expression):
+        holder = self.holders.pop(expression,None)
+        if holder is None:
+            return
+        self.mentions[holder].discard(expression)
+        for operand in expression[1:]:
+            if type(operand) is str:
+                self.mentions[operand].discard(expression)
+        self.memory.discard(expression)
+    def forget_name(self,name):
+        for expression in list(self.mentions.pop(name,())):
+            self.remove(expression)
+    def forget_memory(self):
+        for expression in list(self.memory):
+            self.remove(expression)
+    def forget_everything(self):
+        self.holders.clear()
+        self.mentions.clear()
+        self.memory.clear()
+    def intersection(self,other):
+        result = Available()
+        for expression, holder in self.holders.items():
+            if other.holders.get(expression) == holder:
+                result.add(expression,holder)
+        return result
+
+class ValueNumbering(object):
+    """
+        Reuses the result of an earlier instruction that computed the same thing, instead of computing it again.
+        What is available is worked out over the whole control flow graph, so an expression computed in a block
+        that dominates this one is reused as long as nothing on any path in between changed its operands.
+        Assigning to a name forgets everything computed from it or held in it; assigning to a global
+        or to a name whose address was taken (either could be what a pointer points at) also forgets
+        everything read through * and load.
+        Reused results become copies, which the other passes then clean up. A result held in a name
+        of another size has been wrapped to that size, so it is only reused for a name of the same size;
+        the sizes of longs, pointers and globals take symbol_table to know.
+    """
+    name = "value_numbering"
+    symbol_table = None
+    def run(self,code,scope):
+        self.scope = scope
+        self.visible = (local_names(scope) - address_taken(code))
+        graph = ControlFlowGraph(code)
+        order = graph.reverse_postorder()
+        available_out = {}
+        position = dict((block.index,i) for i, block in enumerate(order))
+        has_loops = any(position.get(predecessor.index,-1) >= position[block.index]
+                        for block in order for predecessor in block.predecessors)
+        if not has_loops:
+            # every block's predecessors come before it, so one pass sees everything it needs
+            for block in graph.blocks:
+                available = self.available_in(block,available_out) if block.index in position else Available()
+                block.instructions = self.transfer(block,available,True)
+                available_out[block.index] = available
+            return graph.code()
+        changed = True
+        while changed:
+            changed = False
+            for block in order:
+                available = self.available_in(block,available_out)
+                self.transfer(block,available,False)
+                old = available_out.get(block.index)
+                if old is None or old.holders != available.holders:
+                    available_out[block.index] = available
+                    changed = True
+        for block in graph.blocks:
+            available = self.available_in(block,available_out) if block.index in available_out else Available()
+            block.instructions = self.transfer(block,available,True)
+        return graph.code()
+    def available_in(self,block,available_out):
+        if block.index == 0:
+            return Available()
+        result = None
+        for predecessor in block.predecessors:
+            if predecessor.index not in available_out:
+                continue # not worked out yet, so it doesn't limit anything on this round
+            if result is None:
+                result = available_out[predecessor.index].copy()
+            else:
+                result = result.intersection(available_out[predecessor.index])
+        return result if result is not None else Available()
+    def transfer(self,block,available,rewrite):
+        result = []
+        for instruction in block.instructions:
+            label, operation, destination, source1, source2 = instruction
+            if label is not None and result:
+                available.forget_everything() # a label can only be branched to from outside what was seen so far
+            known = operation in ("","=","load","return") or operation in BRANCHES or \
+                operation in BINARY_OPERATIONS or operation in UNARY_OPERATIONS
+            if not known:
+                available.forget_everything()
+                result.append(instruction)
+                continue
+            expression = expression_of(instruction)
+            holder = available.holders.get(expression) if expression is not None else None
+            if holder is not None and size_of(holder,self.scope,self.symbol_table) == size_of(destination,self.scope,self.symbol_table):
+                if holder == destination:
+                    if label is not None:
+                        result.append((label,"","","",""))
+                    continue # it already holds exactly this
+                instruction = (label,"=",destination,holder,"")
+            for name in names_defined(instruction):
+                available.forget_name(name)
+                if name not in self.visible:
+                    available.forget_memory()
+            if expression is not None and instruction[1] != "=" and is_name(destination) \
+                    and destination not in expression[1:] and destination in self.visible:
+                available.add(expression,destination)
+            result.append(instruction)
+        return result if rewrite else None
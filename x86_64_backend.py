@@ -0,0 +1,623 @@
+import sys # so we can access command-line args
+import argparse # so we can parse command-line options
+import os
+import subprocess
+import tempfile
+import shutil
+import ctypes
+import time
+
+import mksymtab
+import mk3ac
+from ir import is_constant, constant_value, is_temporary, names_used, names_defined, address_taken
+from cfg import ControlFlowGraph, liveness
+from loops import block_starts
+from type_registry import StructType, ArrayType
+
+class BackendError(Exception):
+    pass
+
+ARGUMENT_REGISTERS = ["%rdi","%rsi","%rdx","%rcx","%r8","%r9"]
+# rax, rcx, rdx and r11 are scratch for the code of a single instruction, and rsp and rbp hold the frame;
+# the rest are handed out to names, the ones that don't have to be saved first
+ALLOCATABLE_REGISTERS = ["%rsi","%rdi","%r8","%r9","%r10","%rbx","%r12","%r13","%r14","%r15"]
+CALLEE_SAVED_REGISTERS = ["%rbx","%r12","%r13","%r14","%r15"]
+CALLER_SAVED_REGISTERS = ["%rsi","%rdi","%r8","%r9","%r10"]
+SUBREGISTERS = {
+    "%rax": ("%al","%ax","%eax"), "%rbx": ("%bl","%bx","%ebx"), "%rcx": ("%cl","%cx","%ecx"),
+    "%rdx": ("%dl","%dx","%edx"), "%rsi": ("%sil","%si","%esi"), "%rdi": ("%dil","%di","%edi"),
+    "%r8": ("%r8b","%r8w","%r8d"), "%r9": ("%r9b","%r9w","%r9d"), "%r10": ("%r10b","%r10w","%r10d"),
+    "%r11": ("%r11b","%r11w","%r11d"), "%r12": ("%r12b","%r12w","%r12d"), "%r13": ("%r13b","%r13w","%r13d"),
+    "%r14": ("%r14b","%r14w","%r14d"), "%r15": ("%r15b","%r15w","%r15d"),
+}
+SIGN_EXTEND = {1: "movsbq",2: "movswq",4: "movslq"}
+STORE = {1: "movb",2: "movw",4: "movl",8: "movq"}
+ARITHMETIC = {"+": "addq","-": "subq","*": "imulq","&": "andq","|": "orq","^": "xorq"}
+COMPARISONS = {"==": "sete","!=": "setne","<": "setl","<=": "setle",">": "setg",">=": "setge"}
+JUMPS = {"==": "je","!=": "jne","<": "jl","<=": "jle",">": "jg",">=": "jge"}
+
+def subregister(register,size):
+    if size == 8:
+        return register
+    return SUBREGISTERS[register][{1: 0,2: 1,4: 2}[size]]
+
+def wrap(value,size=4):
+    bits = 8*size
+    return ((value + (1 << (bits-1))) % (1 << bits)) - (1 << (bits-1))
+
+def is_immediate(where):
+    """
+        whether an operand can be an instruction's immediate, which only movabsq takes wider than 4 bytes
+    """
+    return where.startswith("$") and -2**31 <= int(where[1:]) < 2**31
+
+def round_up(value,alignment):
+    return value + (-value % alignment)
+
+def live_intervals(code,names,arguments):
+    """
+        name -> [first, last] position in code where it is live, for the names given.
+        Live ranges with holes in them are treated as one interval, as linear scan does.
+        Arguments start out live at position -1, before the first instruction.
+    """
+    graph = ControlFlowGraph(code)
+    live_in, live_out = liveness(graph)
+    starts = block_starts(graph)
+    intervals = {}
+    def extend(name,position):
+        if name in names:
+            interval = intervals.get(name)
+            if interval is None:
+                intervals[name] = [position,position]
+            elif position < interval[0]:
+                interval[0] = position
+            elif position > interval[1]:
+                interval[1] = position
+    for block in graph.blocks:
+        if not block.instructions:
+            continue
+        first = starts[block.index]
+        last = first + len(block.instructions) - 1
+        for name in live_in[block.index]:
+            extend(name,first)
+        for name in live_out[block.index]:
+            extend(name,last)
+        for offset, instruction in enumerate(block.instructions):
+            for name in names_used(instruction):
+                extend(name,first+offset)
+            for name in names_defined(instruction):
+                extend(name,first+offset)
+    for name in arguments:
+        if name in intervals:
+            extend(name,-1)
+    return intervals, live_in[0]
+
+def linear_scan(intervals,registers=ALLOCATABLE_REGISTERS):
+    """
+        Poletto and Sarkar's linear scan: walks the intervals in order of where they start,
+        freeing the registers of the ones that have ended, and when it runs out spills
+        whichever live interval ends last. Every instruction reads its operands before it writes
+        its destination, so an interval may start where another ends and take over its register.
+        Returns name -> register, and the set of names that live in the frame instead.
+    """
+    assigned = {}
+    spilled = set()
+    active = []
+    free = list(registers)
+    for name in sorted(intervals,key=lambda name: (intervals[name][0],name)):
+        start, end = intervals[name]
+        still_active = []
+        for active_end, active_name in active:
+            if active_end <= start:
+                free.append(assigned[active_name])
+            else:
+                still_active.append((active_end,active_name))
+        active = still_active
+        if free:
+            free.sort(key=registers.index)
+            assigned[name] = free.pop(0)
+            active.append((end,name))
+        else:
+            longest_end, longest = max(active)
+            if longest_end > end:
+                assigned[name] = assigned.pop(longest)
+                spilled.add(longest)
+                active.remove((longest_end,longest))
+                active.append((end,name))
+            else:
+                spilled.add(name)
+    return assigned, spilled
+
+class FunctionCompiler(object):
+    """
+        Lowers one function's 3AC to x86-64 assembly in AT&T syntax, following the System V calling convention.
+        Values are kept the way execution_engine keeps them: every scalar is sign-extended from the size
+        of its type into a 64-bit register, a struct or array used as a value is its address,
+        and pointer arithmetic is not scaled.
+        Names whose address is taken, and locals that are structs or arrays, live in the frame;
+        everything else gets a register from linear_scan, or a frame slot if there aren't enough.
+    """
+    def __init__(self,symbol_table,name):
+        self.symbol_table = symbol_table
+        self.registry = symbol_table.type_registry
+        self.name = name
+        scope = symbol_table.function(name)
+        self.code = list(scope["{}"])
+        self.arguments = [argument for argument, the_type in scope.get("...",[])]
+        self.types = dict(scope.get("...",[]))
+        for local, the_type in scope.items():
+            if local not in ("...","return","{}") and not isinstance(the_type,mk3ac.Label):
+                self.types[local] = the_type
+        self.lines = []
+        self.locations = {}
+    def type_of(self,description):
+        try:
+            return self.registry.get(description)
+        except (KeyError,TypeError,ValueError):
+            return None
+    def is_aggregate(self,the_type):
+        return isinstance(the_type,(StructType,ArrayType))
+    def size_of(self,name):
+        """
+            the size a value stored in name is wrapped to
+        """
+        if name in self.types:
+            the_type = self.type_of(self.types[name])
+        else:
+            the_type = self.type_of(self.symbol_table.values.values.get(name))
+        if the_type is None:
+            return 4
+        if self.is_aggregate(the_type):
+            return 8 # an address
+        return the_type.size
+    def pointee(self,name):
+        """
+            the type of what name points to, if it is known
+        """
+        description = self.types.get(name) if name in self.types else self.symbol_table.values.values.get(name)
+        if isinstance(description,tuple) and description[0] == "":
+            return self.type_of(description[1])
+        return None
+    def label(self,label):
+        return ".L%s_%s" % (self.name,label)
+    def emit(self,line):
+        self.lines.append("\t"+line)
+    def lay_out_frame(self):
+        taken = address_taken(self.code)
+        in_frame = []
+        candidates = set()
+        for name in sorted(self.types):
+            the_type = self.type_of(self.types[name])
+            if name in self.arguments and self.is_aggregate(the_type):
+                raise BackendError("%s: struct and array arguments are not supported" % self.name)
+            if name in taken or (self.is_aggregate(the_type) and not is_temporary(name)):
+                in_frame.append((name,the_type))
+            else:
+                candidates.add(name)
+        intervals, live_at_entry = live_intervals(self.code,candidates,self.arguments)
+        registers, spilled = linear_scan(intervals)
+        self.intervals = intervals
+        self.saved = [register for register in CALLEE_SAVED_REGISTERS if register in registers.values()]
+        self.frame_used = 8*len(self.saved)
+        for name, the_type in in_frame:
+            size = the_type.size if the_type is not None else 4
+            alignment = the_type.alignment if the_type is not None else 4
+            where = self.frame_slot(max(size,1),max(alignment,1))
+            if self.is_aggregate(the_type):
+                self.locations[name] = ("aggregate",where,size)
+            else:
+                self.locations[name] = ("memory",where,size)
+        for name, register in registers.items():
+            self.locations[name] = ("register",register,8)
+        for name in sorted(spilled):
+            self.locations[name] = ("spill",self.frame_slot(8,8),8)
+        self.staging = [self.frame_slot(8,8) for argument in self.arguments[:len(ARGUMENT_REGISTERS)]]
+        # slots start out as 0 in execution_engine, so anything read before it is written does here too
+        self.zeroed = sorted(name for name in live_at_entry if name in self.locations and name not in self.arguments
+                             and self.locations[name][0] in ("register","spill"))
+        self.frame_size = round_up(self.frame_used,16) - 8*len(self.saved)
+    def frame_slot(self,size,alignment):
+        """
+            size bytes of the frame, below the saved registers and everything handed out so far
+        """
+        self.frame_used = round_up(self.frame_used+size,alignment)
+        return "-%d(%%rbp)" % self.frame_used
+    def location(self,operand):
+        """
+            (kind, where, size): kind is "constant", "register", "spill" (8 bytes in the frame),
+            "memory" (a scalar of size bytes at where) or "aggregate" (a struct or array at where,
+            whose value is its address)
+        """
+        if is_constant(operand):
+            return ("constant","$%d" % wrap(constant_value(operand),8),8)
+        if operand in self.locations:
+            return self.locations[operand]
+        description = self.symbol_table.values.values.get(operand)
+        if isinstance(description,(str,tuple)):
+            the_type = self.type_of(description)
+            if the_type is not None:
+                where = "%s(%%rip)" % operand
+                if self.is_aggregate(the_type):
+                    return ("aggregate",where,the_type.size)
+                return ("memory",where,the_type.size)
+        raise BackendError("%s: %r is not defined" % (self.name,operand))
+    def load(self,operand,register):
+        kind, where, size = self.location(operand)
+        if kind == "aggregate":
+            self.emit("leaq %s, %s" % (where,register))
+        elif kind == "constant" and not is_immediate(where):
+            self.emit("movabsq %s, %s" % (where,register))
+        elif kind == "memory" and size != 8:
+            self.emit("%s %s, %s" % (SIGN_EXTEND[size],where,register))
+        elif where != register:
+            self.emit("movq %s, %s" % (where,register))
+    def source(self,operand,scratch):
+        """
+            something an instruction can take its right operand from: a register, a frame slot or
+            an immediate, loading the operand into scratch first if it has to
+        """
+        kind, where, size = self.location(operand)
+        if kind in ("register","spill") or kind == "constant" and is_immediate(where):
+            return where
+        self.load(operand,scratch)
+        return scratch
+    def store(self,name,register,narrow=False):
+        """
+            writes the value in register to name, wrapping it to name's size first
+            unless it is narrow, which is to say it fits in any size already
+        """
+        kind, where, size = self.location(name)
+        if kind == "constant":
+            raise BackendError("%s: can not assign to %r" % (self.name,name))
+        if kind == "aggregate":
+            # copy the struct or array whose address is in register
+            self.emit("pushq %rsi")
+            self.emit("pushq %rdi")
+            self.emit("movq %s, %%rsi" % register)
+            self.emit("leaq %s, %%rdi" % where)
+            self.emit("movq $%d, %%rcx" % size)
+            self.emit("rep movsb")
+            self.emit("popq %rdi")
+            self.emit("popq %rsi")
+            return
+        if kind == "memory":
+            self.emit("%s %s, %s" % (STORE[size],subregister(register,size),where))
+            return
+        size = self.size_of(name)
+        if size != 8 and not narrow:
+            self.emit("%s %s, %s" % (SIGN_EXTEND[size],subregister(register,size),register))
+        if where != register:
+            self.emit("movq %s, %s" % (register,where))
+    def compile(self):
+        self.lay_out_frame()
+        self.lines.append("\t.globl %s" % self.name)
+        self.lines.append("\t.type %s, @function" % self.name)
+        self.lines.append("%s:" % self.name)
+        self.emit("pushq %rbp")
+        self.emit("movq %rsp, %rbp")
+        for register in self.saved:
+            self.emit("pushq %s" % register)
+        if self.frame_size:
+            self.emit("subq $%d, %%rsp" % self.frame_size)
+        for register, slot in zip(ARGUMENT_REGISTERS,self.staging):
+            self.emit("movq %s, %s" % (register,slot))
+        for index, argument in enumerate(self.arguments):
+            if argument not in self.locations:
+                continue # never used
+            if index < len(ARGUMENT_REGISTERS):
+                self.emit("movq %s, %%rax" % self.staging[index])
+            else:
+                self.emit("movq %d(%%rbp), %%rax" % (16+8*(index-len(ARGUMENT_REGISTERS))))
+            self.store(argument,"%rax")
+        for name in self.zeroed:
+            kind, where, size = self.locations[name]
+            self.emit("movq $0, %s" % where)
+        uses = {}
+        for instruction in self.code:
+            for name in names_used(instruction):
+                uses[name] = uses.get(name,0) + 1
+        fused = None
+        for index, instruction in enumerate(self.code):
+            if instruction[0] is not None:
+                self.lines.append("%s:" % self.label(instruction[0]))
+            if index == fused or instruction[1] == "":
+                continue
+            following = self.code[index+1] if index+1 < len(self.code) else None
+            if instruction[1] in COMPARISONS and following is not None and following[0] is None and \
+                    following[1] == "conditional_branch" and following[3] == instruction[2] and \
+                    is_temporary(instruction[2]) and uses.get(instruction[2]) == 1:
+                # the comparison's only use is the branch, so branch on the flags instead of making a 0 or 1
+                self.compare(instruction[3],instruction[4],"%rax")
+                self.emit("%s %s" % (JUMPS[instruction[1]],self.label(following[2])))
+                fused = index + 1
+                continue
+            self.instruction(instruction,index)
+        self.emit("xorl %eax, %eax") # falling off the end
+        self.lines.append("%s:" % self.label("return"))
+        if self.saved:
+            self.emit("leaq -%d(%%rbp), %%rsp" % (8*len(self.saved)))
+            for register in reversed(self.saved):
+                self.emit("popq %s" % register)
+        else:
+            self.emit("movq %rbp, %rsp")
+        self.emit("popq %rbp")
+        self.emit("ret")
+        self.lines.append("\t.size %s, .-%s" % (self.name,self.name))
+        return self.lines
+    def compare(self,right,left,target):
+        self.load(left,target)
+        self.emit("cmpq %s, %s" % (self.source(right,"%rcx"),target))
+    def instruction(self,instruction,index):
+        label, operation, destination, source1, source2 = instruction
+        if operation == "unconditional_branch":
+            self.emit("jmp %s" % self.label(destination))
+        elif operation == "conditional_branch":
+            kind, where, size = self.location(source1)
+            if kind == "constant":
+                if wrap(constant_value(source1),8) != 0:
+                    self.emit("jmp %s" % self.label(destination))
+                return
+            if kind != "register":
+                self.load(source1,"%rax")
+                where = "%rax"
+            self.emit("testq %s, %s" % (where,where))
+            self.emit("jne %s" % self.label(destination))
+        elif operation == "return":
+            if destination == "":
+                self.emit("xorl %eax, %eax")
+            else:
+                self.load(destination,"%rax")
+            self.emit("jmp %s" % self.label("return"))
+        elif operation == "&" and source2 == "":
+            kind, where, size = self.location(source1)
+            if kind not in ("memory","aggregate"):
+                raise BackendError("%s: can not take the address of %r" % (self.name,source1))
+            self.emit("leaq %s, %%rax" % where)
+            self.store(destination,"%rax")
+        elif operation in ("++","--","p++","p--") and source2 == "":
+            self.load(source1,"%rax")
+            self.emit("leaq %d(%%rax), %%rdx" % (1 if operation in ("++","p++") else -1))
+            self.store(source1,"%rdx")
+            self.store(destination,"%rax" if operation.startswith("p") else "%rdx")
+        elif operation == "*" and source2 == "" or operation == "load":
+            self.load(source1,"%rax")
+            displacement = ""
+            if operation == "load":
+                if is_constant(source2):
+                    displacement = str(wrap(constant_value(source2)))
+                else:
+                    self.emit("addq %s, %%rax" % self.source(source2,"%rcx"))
+            the_type = self.type_of(self.types.get(destination)) if destination in self.types else None
+            if self.is_aggregate(the_type):
+                self.emit("leaq %s(%%rax), %%rax" % displacement)
+            else:
+                size = the_type.size if the_type is not None else 4
+                self.emit("%s %s(%%rax), %%rax" % (SIGN_EXTEND.get(size,"movq"),displacement))
+            self.store(destination,"%rax")
+        elif operation == "store":
+            the_type = self.pointee(source2)
+            self.load(source2,"%rdx")
+            self.load(source1,"%rax")
+            if self.is_aggregate(the_type):
+                # copy the struct or array whose address is in rax
+                self.emit("pushq %rsi")
+                self.emit("pushq %rdi")
+                self.emit("movq %rax, %rsi")
+                self.emit("movq %rdx, %rdi")
+                self.emit("movq $%d, %%rcx" % the_type.size)
+                self.emit("rep movsb")
+                self.emit("popq %rdi")
+                self.emit("popq %rsi")
+            else:
+                size = the_type.size if the_type is not None else 4
+                self.emit("%s %s, (%%rdx)" % (STORE[size],subregister("%rax",size)))
+        elif operation == "=":
+            kind, where, size = self.location(destination)
+            narrow = is_constant(source1) and -128 <= wrap(constant_value(source1),8) < 128
+            if kind == "register":
+                self.load(source1,where)
+                self.store(destination,where,narrow)
+            else:
+                self.load(source1,"%rax")
+                self.store(destination,"%rax",narrow)
+        elif source2 != "" and operation in ARITHMETIC or operation in COMPARISONS:
+            # destination = source2 op source1, worked out in the destination's register when that is safe
+            target = "%rax"
+            kind, where, size = self.location(destination)
+            if kind == "register" and self.location(source1)[1] != where:
+                target = where
+            if operation in ARITHMETIC:
+                self.load(source2,target)
+                self.emit("%s %s, %s" % (ARITHMETIC[operation],self.source(source1,"%rcx"),target))
+                self.store(destination,target)
+            else:
+                self.compare(source1,source2,target)
+                self.emit("%s %s" % (COMPARISONS[operation],subregister(target,1)))
+                self.emit("movzbq %s, %s" % (subregister(target,1),target))
+                self.store(destination,target,narrow=True)
+        elif operation in ("/","%"):
+            self.load(source2,"%rax")
+            self.load(source1,"%rcx")
+            self.emit("cqto")
+            self.emit("idivq %rcx")
+            self.store(destination,"%rax" if operation == "/" else "%rdx")
+        elif operation in ("<<",">>"):
+            self.load(source2,"%rax")
+            self.load(source1,"%rcx")
+            self.emit("andl $%d, %%ecx" % (63 if self.size_of(destination) == 8 else 31))
+            self.emit("%s %%cl, %%rax" % ("salq" if operation == "<<" else "sarq"))
+            self.store(destination,"%rax")
+        elif operation in ("&&","||"):
+            self.load(source2,"%rax")
+            self.load(source1,"%rcx")
+            self.emit("testq %rax, %rax")
+            self.emit("setne %al")
+            self.emit("testq %rcx, %rcx")
+            self.emit("setne %cl")
+            self.emit("%s %%cl, %%al" % ("andb" if operation == "&&" else "orb"))
+            self.emit("movzbq %al, %rax")
+            self.store(destination,"%rax",narrow=True)
+        elif operation in ("-","+","!","~") and source2 == "":
+            self.load(source1,"%rax")
+            if operation == "-":
+                self.emit("negq %rax")
+            elif operation == "~":
+                self.emit("notq %rax")
+            elif operation == "!":
+                self.emit("testq %rax, %rax")
+                self.emit("sete %al")
+                self.emit("movzbq %al, %rax")
+            self.store(destination,"%rax")
+        elif operation == "param":
+            pass # the call loads it
+        elif operation == "call":
+            self.call(instruction,index)
+        else:
+            raise BackendError("%s: can not compile %r" % (self.name,instruction))
+    def call(self,instruction,index):
+        """
+            Saves the caller-saved registers of the names that are live across the call, pushes the arguments
+            past the sixth, and puts the first six in their registers by pushing them all and popping them off
+            into place, since one of those registers may hold another argument. The stack is kept 16-byte aligned
+            at the call, padding it if an odd number of things were pushed, and the call goes through the PLT so that
+            it works for a function in the same shared library as well as one in another.
+        """
+        label, operation, destination, function_name, count = instruction
+        params = self.code[index-count:index]
+        if len(params) != count or any(param[1] != "param" for param in params):
+            raise BackendError("%s: %r is not right after its params" % (self.name,instruction))
+        saved = sorted(set(self.locations[name][1] for name, (start, end) in self.intervals.items()
+                           if start < index < end and self.locations[name][0] == "register"
+                           and self.locations[name][1] in CALLER_SAVED_REGISTERS),key=ALLOCATABLE_REGISTERS.index)
+        arguments = [param[3] for param in params]
+        on_stack = arguments[len(ARGUMENT_REGISTERS):]
+        padding = 8*((len(saved)+len(on_stack)) % 2)
+        for register in saved:
+            self.emit("pushq %s" % register)
+        if padding:
+            self.emit("subq $8, %rsp")
+        for argument in reversed(on_stack):
+            self.load(argument,"%rax")
+            self.emit("pushq %rax")
+        in_registers = arguments[:len(ARGUMENT_REGISTERS)]
+        for argument in in_registers:
+            self.load(argument,"%rax")
+            self.emit("pushq %rax")
+        for register in reversed(ARGUMENT_REGISTERS[:len(in_registers)]):
+            self.emit("popq %s" % register)
+        self.emit("call %s@PLT" % function_name)
+        if on_stack or padding:
+            self.emit("addq $%d, %%rsp" % (8*len(on_stack)+padding))
+        for register in reversed(saved):
+            self.emit("popq %s" % register)
+        self.store(destination,"%rax")
+
+def global_definitions(symbol_table):
+    """
+        a zeroed, file-local definition for each global
+    """
+    lines = []
+    for name, description in sorted(symbol_table.values.values.items()):
+        if isinstance(description,(str,tuple)):
+            try:
+                the_type = symbol_table.type_registry.get(description)
+            except (KeyError,TypeError,ValueError):
+                continue
+            lines.append("\t.local %s" % name)
+            lines.append("\t.comm %s,%d,%d" % (name,max(the_type.size,1),max(the_type.alignment,1)))
+    return lines
+
+def assemble(symbol_table,function_names=None,errors=None):
+    """
+        the assembly for the functions of a symbol table made with data_model="LP64", and its globals.
+        A function that can't be compiled is left out; what went wrong is added to errors, if that is given,
+        and raised otherwise.
+    """
+    assert(symbol_table.type_registry.data_model == "LP64")
+    if function_names is None:
+        function_names = sorted(name for name, value in symbol_table.functions())
+    lines = ["\t.text"]
+    for name in function_names:
+        try:
+            lines.extend(FunctionCompiler(symbol_table,name).compile())
+        except BackendError as error:
+            if errors is None:
+                raise
+            errors.append(str(error))
+    lines.extend(global_definitions(symbol_table))
+    lines.append("\t.section .note.GNU-stack,\"\",@progbits")
+    return "\n".join(lines)+"\n"
+
+def compile_to_assembly(code,optimized=False,errors=None):
+    parsed_code = mk3ac.new_parser().parse(code)
+    st = mksymtab.makeSymbolTable(parsed_code,lazy=True,data_model="LP64",generator=mk3ac.generate_function)
+    if optimized:
+        mk3ac.optimize_symbol_table(st)
+    return assemble(st,errors=errors)
+
+class NativeLibrary(object):
+    """
+        assembly built into a shared library with the C compiler and loaded with ctypes,
+        so its functions can be called on int arguments the way ExecutionEngine.call is
+    """
+    def __init__(self,assembly,compiler="cc"):
+        self.directory = tempfile.mkdtemp(prefix="mk3ac-")
+        source = os.path.join(self.directory,"code.s")
+        self.path = os.path.join(self.directory,"code.so")
+        with open(source,"w") as out:
+            out.write(assembly)
+        subprocess.check_call([compiler,"-shared","-o",self.path,source])
+        self.library = ctypes.CDLL(self.path)
+    def call(self,name,*arguments):
+        function = getattr(self.library,name)
+        function.restype = ctypes.c_long
+        function.argtypes = [ctypes.c_long]*len(arguments)
+        return function(*arguments)
+    def close(self):
+        shutil.rmtree(self.directory,ignore_errors=True)
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="compile some C to x86-64 assembly through the 3AC, or run one of its functions natively")
+    argument_parser.add_argument("file",help="the C file to compile")
+    argument_parser.add_argument("function",nargs="?",help="build the code into a shared library and call this function")
+    argument_parser.add_argument("arguments",nargs="*",type=int,help="int arguments to call it with")
+    argument_parser.add_argument("-O","--optimize",action="store_true",help="run the optimization passes first")
+    argument_parser.add_argument("-o","--output",metavar="FILE",help="write the assembly here instead of to standard output")
+    argument_parser.add_argument("--compare",action="store_true",help="also run the function in execution_engine, and check they agree")
+    argument_parser.add_argument("--repeat",type=int,default=1,metavar="N",help="call the function N times when timing it")
+    arguments = argument_parser.parse_args()
+    with open(arguments.file) as source:
+        code = source.read()
+    errors = []
+    assembly = compile_to_assembly(code,arguments.optimize,errors)
+    for error in errors:
+        sys.stderr.write("not compiled: %s\n" % error)
+    if arguments.function is None:
+        if arguments.output is None:
+            sys.stdout.write(assembly)
+        else:
+            with open(arguments.output,"w") as out:
+                out.write(assembly)
+        sys.exit(0)
+    library = NativeLibrary(assembly)
+    try:
+        started = time.time()
+        for i in range(arguments.repeat):
+            result = library.call(arguments.function,*arguments.arguments)
+        seconds = time.time() - started
+    finally:
+        library.close()
+    print "native %s(%s) = %r" % (arguments.function,", ".join(map(str,arguments.arguments)),result)
+    print "    %d calls in %.4fs" % (arguments.repeat,seconds)
+    if arguments.compare:
+        import execution_engine
+        engine = execution_engine.compile_and_load(code,arguments.optimize,data_model="LP64")
+        started = time.time()
+        for i in range(arguments.repeat):
+            expected = engine.call(arguments.function,*arguments.arguments)
+        seconds = time.time() - started
+        print "engine %s(%s) = %r" % (arguments.function,", ".join(map(str,arguments.arguments)),expected)
+        print "    %d calls in %.4fs" % (arguments.repeat,seconds)
+        if (expected if expected is not None else 0) != result:
+            print "MISMATCH"
+            sys.exit(1)